@@ -0,0 +1,211 @@
+"""
+analysis_pool.py - Анализ пар вне event loop
+
+- CryptoMickyAnalyzer.analyze_pair - синхронная CPU-работа (NumPy, уровни);
+  в цикле событий она останавливала polling aiogram, вебхуки и отправку
+- Задание на пару - компактные колонки свечей (6, n) по таймфреймам,
+  индикаторы из batch_features, общий CycleContext цикла (состояние BTC
+  и прочие рыночные признаки) и записи антидубля анализатора
+- По умолчанию пул потоков в том же процессе (NumPy отпускает GIL,
+  цикл событий свободен); ANALYSIS_EXECUTOR=process - процессы (spawn)
+  на ANALYSIS_WORKERS ядрах. Процесс-воркер не исполняет заново
+  запускающий скрипт (main.py как __mp_main__: бот, диспетчер, логи),
+  а импортирует только analysis_pool и его зависимости
+- Результаты отдаются по мере готовности: async for pair, signal in ...
+- Кэш результатов по ключу задания: версии серий CandleStorage,
+  fingerprint контекста и свежие записи антидубля. Тот же ключ - тот же
+  результат, пара в воркер не отправляется (4h/1d меняются только на
+  закрытии бара, 1h - при записи price_collector)
+
+Антидубль анализатора (_signal_cache) живёт в главном процессе: задание
+везёт записи своей пары, воркер возвращает их обновлёнными.
+
+LRU трендов и зон 4h/1d (CryptoMickyAnalyzer._memoized) - у анализатора
+воркера. В режиме thread анализатор один на пул и кэш общий; в режиме
+process у каждого процесса свой кэш и свой memo_stats: пара, попавшая
+в другой процесс, считается заново, поэтому с кэшем (ANALYZER_MEMO_SIZE > 0)
+по умолчанию используется thread.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import types
+from collections import Counter
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import professional_analyzer
+from candle_buffer import OHLCV
+from cycle_context import CycleContext
+from config import ANALYSIS_EXECUTOR, ANALYSIS_WORKERS, ANALYZER_MEMO_SIZE
+
+logger = logging.getLogger(__name__)
+
+TIMEFRAMES = ("1h", "4h", "1d")
+
+
+class AnalysisJob(NamedTuple):
+    pair: str
+    key: tuple                           # см. job_key
+    candles: Dict[str, np.ndarray]       # {tf: (6, n)}; копия снимается при отправке в воркер
+    context: Optional[CycleContext]      # общий снимок рынка цикла
+    indicators: Dict[str, object]        # {tf: PairFeatures/SeriesIndicators}
+    recent_signals: List[dict]           # _signal_cache[pair]
+
+
+def snapshot_columns(columns) -> np.ndarray:
+    """Колонки серии (6, n) - копия, буфер может меняться во время анализа"""
+    return np.array(columns, dtype=np.float64).reshape(6, -1)
+
+
+def job_key(storage, pair: str, context: Optional[CycleContext], recent_signals: List[dict],
+            now: float) -> tuple:
+    """Всё, от чего зависит analyze_pair: тот же ключ - тот же результат"""
+    versions = tuple(storage.version(pair, tf) for tf in TIMEFRAMES)
+    # Записи антидубля старше окна уже ни на что не влияют
+    recent = tuple(
+        (s['side'], s['price'], s['timestamp']) for s in recent_signals
+        if now - s['timestamp'] < professional_analyzer.DUPLICATE_WINDOW
+    )
+    return versions, context.fingerprint() if context is not None else None, recent
+
+
+def make_job(storage, pair: str, context: Optional[CycleContext] = None,
+             indicators: Dict[str, object] = None) -> AnalysisJob:
+    recent_signals = list(professional_analyzer._signal_cache.get(pair, []))
+    now = context.timestamp if context is not None else time.time()
+    return AnalysisJob(
+        pair=pair,
+        key=job_key(storage, pair, context, recent_signals, now),
+        candles={tf: storage.get_arrays(pair, tf) for tf in TIMEFRAMES},
+        context=context,
+        indicators=indicators or {},
+        recent_signals=recent_signals,
+    )
+
+
+# Анализатор воркера: в пуле потоков - общий (кэш под блокировкой),
+# в пуле процессов - свой в каждом процессе
+_ANALYZER: Optional[professional_analyzer.CryptoMickyAnalyzer] = None
+
+
+def _analyze(job: AnalysisJob) -> Tuple[str, Optional[Dict], List[dict]]:
+    global _ANALYZER
+    if _ANALYZER is None:
+        _ANALYZER = professional_analyzer.CryptoMickyAnalyzer()
+
+    candles = {tf: OHLCV(*np.asarray(columns)) for tf, columns in job.candles.items()}
+
+    cache = professional_analyzer._signal_cache
+    cache[job.pair] = list(job.recent_signals)
+    signal = _ANALYZER.analyze_arrays(
+        job.pair, candles["1h"], candles["4h"], candles["1d"],
+        indicators=job.indicators, context=job.context
+    )
+    return job.pair, signal, cache.get(job.pair, [])
+
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    """spawn-процесс воркера без повторного импорта __main__"""
+
+    def start(self):
+        # Данные для запуска дочернего процесса собираются в start();
+        # у __main__ без __file__ и __spec__ дочерний процесс его не импортирует
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            super().start()
+        finally:
+            sys.modules['__main__'] = main
+
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    Process = _WorkerProcess
+
+
+class AnalysisPool:
+    """Пул воркеров анализа; создаётся при первом цикле"""
+
+    def __init__(self, mode: str = ANALYSIS_EXECUTOR, workers: int = ANALYSIS_WORKERS):
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: Optional[Executor] = None
+        self.results: Dict[str, Tuple[tuple, Optional[Dict]]] = {}  # pair -> (key, signal)
+        self.stats = Counter()  # analyzed/reused за последний run
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "thread":
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="analysis")
+            else:
+                # spawn: fork процесса с потоками aiosqlite/httpx может зависнуть
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=_WorkerContext())
+                if ANALYZER_MEMO_SIZE and self.workers > 1:
+                    logger.warning(f"⚠️ Analyzer memo is per process: {self.workers} separate caches")
+            logger.info(f"✅ Analysis pool: {self.mode} x{self.workers}")
+        return self._executor
+
+    async def _run_one(self, executor: Executor, job: AnalysisJob):
+        """(job, результат воркера или None при ошибке)"""
+        loop = asyncio.get_running_loop()
+        try:
+            return job, await loop.run_in_executor(executor, _analyze, job)
+        except BrokenExecutor as e:
+            # Воркер упал - следующий цикл поднимет пул заново
+            logger.error(f"Analysis pool broken on {job.pair}: {e}")
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+        except Exception as e:
+            logger.error(f"Error analyzing {job.pair}: {e}")
+        return job, None
+
+    async def run(self, jobs: Iterable[AnalysisJob]) -> AsyncIterator[Tuple[str, Optional[Dict]]]:
+        """
+        (pair, signal): сначала пары с прежним результатом, затем
+        проанализированные - в порядке готовности
+        """
+        self.stats.clear()
+        reused, fresh = [], []
+        for job in jobs:
+            cached = self.results.get(job.pair)
+            if cached is not None and cached[0] == job.key:
+                reused.append((job.pair, cached[1]))
+            else:
+                # Снимок свечей - до первого yield, пока серии не менялись
+                candles = {tf: snapshot_columns(columns) for tf, columns in job.candles.items()}
+                fresh.append(job._replace(candles=candles))
+
+        executor = self.executor() if fresh else None
+        tasks = [asyncio.ensure_future(self._run_one(executor, job)) for job in fresh]
+        try:
+            for pair, signal in reused:
+                self.stats['reused'] += 1
+                yield pair, signal
+
+            for next_done in asyncio.as_completed(tasks):
+                job, result = await next_done
+                if result is None:
+                    yield job.pair, None
+                    continue
+                pair, signal, recent_signals = result
+                professional_analyzer._signal_cache[pair] = recent_signals
+                self.results[pair] = (job.key, signal)
+                self.stats['analyzed'] += 1
+                yield pair, signal
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+ANALYSIS_POOL = AnalysisPool()
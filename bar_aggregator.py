@@ -0,0 +1,101 @@
+"""
+bar_aggregator.py - Сборка настоящих OHLCV-баров из тиков цены
+
+REST polling даёт только последнюю цену и 24h объём. Вместо
+псевдо-свечи на каждый тик (o=h=l=c) обновляем формирующийся бар:
+- high/low/close по цене тика, volume не трогаем - это объём свечи
+  биржи (загрузка истории, refresh_recent_bars); прирост скользящего
+  24h объёма - не объём бара (минус выпавшее из окна сутки назад)
+- на границе таймфрейма открывается новый бар с нулевым объёмом до
+  следующей загрузки свечей с биржи
+- 4h и 1d собираются из 1h баров, отдельные запросы не нужны
+"""
+import time
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from config import TIMEFRAME_SECONDS
+from indicators import CANDLES, CandleStorage
+
+logger = logging.getLogger(__name__)
+
+
+class BarAggregator:
+    """Тики → бары базового таймфрейма → бары старших таймфреймов"""
+
+    def __init__(self, storage: CandleStorage = CANDLES, base_tf: str = "1h",
+                 rollup_tfs: Tuple[str, ...] = ("4h", "1d")):
+        self.storage = storage
+        self.base_tf = base_tf
+        self.rollup_tfs = rollup_tfs
+
+    def on_tick(self, pair: str, price: float, ts: Optional[float] = None):
+        """Учесть новую цену пары"""
+        ts = time.time() if ts is None else ts
+
+        bar = self._apply_tick(pair, price, ts)
+        if bar is None:
+            return
+
+        for tf in self.rollup_tfs:
+            self._roll_up(pair, tf, bar['t'])
+
+    def _apply_tick(self, pair: str, price: float, ts: float) -> Optional[dict]:
+        """Обновить формирующийся бар базового таймфрейма или открыть новый"""
+        tf_sec = TIMEFRAME_SECONDS[self.base_tf]
+        open_ts = float(int(ts // tf_sec) * tf_sec)
+        series = self.storage.get_candles(pair, self.base_tf)
+        last = series[-1] if series else None
+
+        if last is not None and last['t'] == open_ts:
+            bar = {
+                't': open_ts,
+                'o': last['o'],
+                'h': max(last['h'], price),
+                'l': min(last['l'], price),
+                'c': price,
+                'v': last['v']
+            }
+        elif last is None or open_ts > last['t']:
+            bar = {'t': open_ts, 'o': price, 'h': price, 'l': price, 'c': price, 'v': 0.0}
+        else:
+            # Тик из прошлого бара (часы отстают) - игнорируем
+            return None
+
+        self.storage.update_candle(pair, self.base_tf, bar)
+        return bar
+
+    def _roll_up(self, pair: str, tf: str, base_open: float):
+        """Пересобрать бар старшего таймфрейма, в который попал base_open"""
+        tf_sec = TIMEFRAME_SECONDS[tf]
+        window_open = float(int(base_open // tf_sec) * tf_sec)
+
+        base = self.storage.get_arrays(pair, self.base_tf)
+        lo, hi = np.searchsorted(base.t, [window_open, window_open + tf_sec])
+        if lo == hi:
+            return
+
+        bar = {
+            't': window_open,
+            'o': float(base.o[lo]),
+            'h': float(base.h[lo:hi].max()),
+            'l': float(base.l[lo:hi].min()),
+            'c': float(base.c[hi - 1]),
+            'v': float(base.v[lo:hi].sum())
+        }
+
+        # 1h история не покрывает начало окна - дополняем бар, скачанный с биржи
+        series = self.storage.get_candles(pair, tf)
+        existing = series[-1] if series and series[-1]['t'] == window_open else None
+        if existing is not None and base.t[lo] > window_open:
+            bar['o'] = existing['o']
+            bar['h'] = max(bar['h'], existing['h'])
+            bar['l'] = min(bar['l'], existing['l'])
+            bar['v'] = max(bar['v'], existing['v'])
+
+        self.storage.update_candle(pair, tf, bar)
+
+
+BAR_AGGREGATOR = BarAggregator()
@@ -0,0 +1,129 @@
+"""
+batch_indicators.py - Индикаторы для всех пар одним вызовом
+
+- Серии пар складываются в матрицы пары × время (close/high/low/volume),
+  выровненные по последней свече
+- EMA, RSI, ATR и объёмные соотношения считаются indicator_engine
+  по всей матрице сразу - цена цикла анализа почти не растёт с числом пар
+- batch[pair] - срез одной пары с теми же атрибутами, что у
+  SeriesIndicators (ema, rsi, atr), для CryptoMickyAnalyzer.analyze_pair
+
+Короткие серии дополняются слева своей первой свечой: EMA от этого не
+меняется, а RSI/ATR, которым не хватило настоящих свечей, - None.
+"""
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config import RSI_PERIOD
+from indicator_engine import ema_series, rsi_series, atr_series
+
+VOLUME_RECENT = 10   # свечей для объёма зелёных/красных свечей
+VOLUME_AVERAGE = 30  # свечей для среднего объёма
+
+
+def stack_series(storage, pairs: Iterable[str], tf: str):
+    """
+    Матрицы (pairs, n) для o/h/l/c/v и число настоящих свечей каждой пары
+
+    n - длина самой длинной серии; пары без свечей пропускаются.
+    """
+    series = [(pair, storage.get_arrays(pair, tf)) for pair in pairs]
+    series = [(pair, arrays) for pair, arrays in series if len(arrays.t)]
+    names = [pair for pair, _ in series]
+    if not series:
+        empty = np.empty((0, 0))
+        return names, {field: empty for field in "ohlcv"}, np.empty(0, dtype=np.int64)
+
+    counts = np.array([len(arrays.t) for _, arrays in series])
+    n = int(counts.max())
+    matrices = {}
+    for field in "ohlcv":
+        matrix = np.empty((len(series), n))
+        for row, (_, arrays) in enumerate(series):
+            column = getattr(arrays, field)
+            matrix[row, n - len(column):] = column
+            matrix[row, :n - len(column)] = column[0]
+        matrices[field] = matrix
+    return names, matrices, counts
+
+
+class PairFeatures:
+    """Индикаторы одной пары из пакетного расчёта"""
+
+    __slots__ = ('ema', 'rsi', 'atr', 'close', 'volume_ratio', 'green_volume_ratio', 'red_volume_ratio')
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+
+def _scalar(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+class BatchFeatures:
+    """Индикаторы всех пар одного таймфрейма"""
+
+    def __init__(self, storage, pairs: Iterable[str], tf: str, ema_periods=(20, 50, 100),
+                 rsi_period: int = RSI_PERIOD, atr_period: int = 14, volume_period: int = 20):
+        self.tf = tf
+        self.pairs, m, counts = stack_series(storage, pairs, tf)
+        self._index = {pair: row for row, pair in enumerate(self.pairs)}
+        n = m['c'].shape[1]
+
+        def last(series: np.ndarray, need: int) -> np.ndarray:
+            # None там, где настоящих свечей меньше need
+            values = series[:, -1] if n else np.empty(0)
+            return np.where(counts >= need, values, np.nan)
+
+        self.ema = {p: last(ema_series(m['c'], p), p) for p in ema_periods}
+        self.rsi = last(rsi_series(m['c'], rsi_period), rsi_period + 1)
+        self.atr = last(atr_series(m['h'], m['l'], m['c'], atr_period), atr_period + 1)
+        self.close = m['c'][:, -1] if n else np.empty(0)
+
+        # Последний объём к среднему предыдущих volume_period - 1 (как volume_strength)
+        v = m['v']
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if n >= volume_period:
+                previous = v[:, -volume_period:-1].mean(axis=1)
+                ratio = np.where(previous > 0, v[:, -1] / previous, np.nan)
+            else:
+                ratio = np.full(len(self.pairs), np.nan)
+            self.volume_ratio = np.where(counts >= volume_period, ratio, np.nan)
+
+            # Объём зелёных/красных из последних VOLUME_RECENT к среднему за VOLUME_AVERAGE
+            recent_v = v[:, -VOLUME_RECENT:]
+            green = (m['c'] > m['o'])[:, -VOLUME_RECENT:]
+            red = (m['c'] < m['o'])[:, -VOLUME_RECENT:]
+            average = v[:, -VOLUME_AVERAGE:].mean(axis=1) if n else np.empty(0)
+            enough = counts >= VOLUME_AVERAGE
+            self.green_volume_ratio = np.where(
+                enough, (recent_v * green).sum(axis=1) / green.sum(axis=1) / average, np.nan
+            )
+            self.red_volume_ratio = np.where(
+                enough, (recent_v * red).sum(axis=1) / red.sum(axis=1) / average, np.nan
+            )
+
+    def __contains__(self, pair: str) -> bool:
+        return pair in self._index
+
+    def __getitem__(self, pair: str) -> PairFeatures:
+        row = self._index[pair]
+        return PairFeatures(
+            ema={p: _scalar(values[row]) for p, values in self.ema.items()},
+            rsi=_scalar(self.rsi[row]),
+            atr=_scalar(self.atr[row]),
+            close=float(self.close[row]),
+            volume_ratio=_scalar(self.volume_ratio[row]),
+            green_volume_ratio=_scalar(self.green_volume_ratio[row]),
+            red_volume_ratio=_scalar(self.red_volume_ratio[row]),
+        )
+
+    def get(self, pair: str) -> Optional[PairFeatures]:
+        return self[pair] if pair in self._index else None
+
+
+def batch_features(storage, pairs: List[str], timeframes=("1h", "4h", "1d")) -> Dict[str, BatchFeatures]:
+    """{tf: BatchFeatures} для цикла анализа"""
+    return {tf: BatchFeatures(storage, pairs, tf) for tf in timeframes}
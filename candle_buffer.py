@@ -0,0 +1,300 @@
+"""
+candle_buffer.py - Колоночный кольцевой буфер свечей на NumPy
+
+- Одна серия (pair, tf) = массив float64 формы (6, 2 * capacity): t, o, h, l, c, v
+- Запись дублируется в две половины, поэтому последние N свечей
+  всегда лежат непрерывно - анализаторы получают срезы без копирования
+- Добавление O(1), без пересоздания списков при переполнении
+- upsert: одна свеча на время открытия - дубликаты не копятся,
+  опоздавшие и исправленные бары встают на место (бинарный поиск)
+- CandleView - совместимость со старым API (список словарей)
+"""
+from collections.abc import Sequence
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+FIELDS = ('t', 'o', 'h', 'l', 'c', 'v')
+
+
+class OHLCV(NamedTuple):
+    """Колонки серии (непрерывные view на буфер)"""
+    t: np.ndarray
+    o: np.ndarray
+    h: np.ndarray
+    l: np.ndarray
+    c: np.ndarray
+    v: np.ndarray
+
+    @property
+    def size(self) -> int:
+        """Число свечей (len() у кортежа - число колонок)"""
+        return len(self.t)
+
+    def head(self, count: int) -> 'OHLCV':
+        """Первые count свечей - view, без копирования"""
+        return OHLCV(*(column[:max(count, 0)] for column in self))
+
+
+class Upsert(NamedTuple):
+    """Итог upsert: что стало со свечами пачки"""
+    appended: int = 0    # новее последней
+    replaced: int = 0    # то же 't', другие значения (обновление/исправление)
+    inserted: int = 0    # опоздавшие - внутрь серии
+    duplicates: int = 0  # то же 't' и те же значения (в серии или внутри пачки)
+    dropped: int = 0     # старше окна заполненного буфера
+    gaps: int = 0        # новых разрывов в серии (пропущенных интервалов)
+    rebuilt: bool = False  # окно пересобрано (изменения не только в хвосте)
+
+    @property
+    def changed(self) -> int:
+        return self.appended + self.replaced + self.inserted
+
+
+def count_gaps(t: np.ndarray, step: float) -> int:
+    """Сколько соседних пар свечей разделено больше чем step"""
+    if not step or len(t) < 2:
+        return 0
+    return int(np.count_nonzero(np.diff(t) > step))
+
+
+def find_gaps(t: np.ndarray, step: float, start: Optional[float] = None,
+              end: Optional[float] = None) -> List[Tuple[float, float]]:
+    """
+    Пропущенные бары серии: [(первое, последнее время открытия), ...]
+
+    t - времена открытия по возрастанию, step - длительность бара.
+    start/end - ожидаемые первая и последняя свеча: недостающие
+    в начале (короткая история) и в конце (простой) тоже дыры.
+    """
+    if len(t) == 0:
+        return [(start, end)] if start is not None and end is not None and start <= end else []
+
+    holes = np.flatnonzero(np.diff(t) > step)
+    gaps = list(zip((t[holes] + step).tolist(), (t[holes + 1] - step).tolist()))
+    if start is not None and t[0] - step >= start:
+        gaps.insert(0, (float(start), float(t[0] - step)))
+    if end is not None and t[-1] + step <= end:
+        gaps.append((float(t[-1] + step), float(end)))
+    return gaps
+
+
+class CandleBuffer:
+    """Кольцевой буфер свечей фиксированной ёмкости"""
+
+    __slots__ = ('capacity', 'data', 'size', '_pos')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.zeros((len(FIELDS), 2 * capacity), dtype=np.float64)
+        self.size = 0
+        self._pos = -1  # индекс последней записанной свечи (0..capacity-1)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _window(self) -> np.ndarray:
+        end = self._pos + self.capacity + 1
+        return self.data[:, end - self.size:end]
+
+    def last_t(self) -> float:
+        return float(self.data[0, self._pos])
+
+    def append(self, row) -> None:
+        """Добавить свечу (t, o, h, l, c, v)"""
+        pos = (self._pos + 1) % self.capacity
+        self.data[:, pos] = row
+        self.data[:, pos + self.capacity] = row
+        self._pos = pos
+        if self.size < self.capacity:
+            self.size += 1
+
+    def replace_last(self, row) -> None:
+        """Заменить последнюю свечу (формирующийся бар)"""
+        self.data[:, self._pos] = row
+        self.data[:, self._pos + self.capacity] = row
+
+    def extend(self, columns: np.ndarray) -> None:
+        """Добавить пачку свечей: массив формы (6, n)"""
+        n = columns.shape[1]
+        if n == 0:
+            return
+        if n >= self.capacity:
+            tail = columns[:, n - self.capacity:]
+            self.data[:, :self.capacity] = tail
+            self.data[:, self.capacity:] = tail
+            self._pos = self.capacity - 1
+            self.size = self.capacity
+            return
+
+        idx = (self._pos + 1 + np.arange(n)) % self.capacity
+        self.data[:, idx] = columns
+        self.data[:, idx + self.capacity] = columns
+        self._pos = int(idx[-1])
+        self.size = min(self.capacity, self.size + n)
+
+    def upsert(self, columns: np.ndarray, step: float = 0) -> Tuple[Upsert, np.ndarray]:
+        """
+        Добавить/заменить свечи (6, n) по времени открытия
+
+        Пачка может быть не отсортирована и содержать повторы (побеждает
+        последняя версия). step - длительность бара для подсчёта разрывов.
+        Возвращает итог и изменившиеся свечи (для записи на диск).
+        """
+        n = columns.shape[1]
+        if n == 0:
+            return Upsert(), columns
+        t = columns[0]
+
+        # Частый случай - новые бары после последнего: O(1) проверка
+        if self.size == 0 or t[0] > self.last_t():
+            if n == 1 or (np.diff(t) > 0).all():
+                prev = [self.last_t()] if self.size else []
+                gaps = count_gaps(np.concatenate((prev, t)), step)
+                self.extend(columns)
+                return Upsert(appended=n, gaps=gaps), columns
+        elif n == 1 and t[0] == self.last_t():
+            if (self.data[:, self._pos] == columns[:, 0]).all():
+                return Upsert(duplicates=1), columns[:, :0]
+            self.replace_last(columns[:, 0])
+            return Upsert(replaced=1), columns
+
+        return self._merge(columns, step)
+
+    def _merge(self, columns: np.ndarray, step: float) -> Tuple[Upsert, np.ndarray]:
+        """Опоздавшие/повторные свечи: бинарный поиск по 't' и пересборка окна"""
+        window = self._window()
+        old_t = window[0]
+
+        # Внутри пачки - последняя версия каждого 't', по возрастанию
+        order = np.argsort(columns[0], kind="stable")
+        batch = columns[:, order]
+        keep = np.append(batch[0, 1:] != batch[0, :-1], True)
+        in_batch_dups = int(batch.shape[1] - keep.sum())
+        batch = batch[:, keep]
+        t = batch[0]
+
+        idx = np.searchsorted(old_t, t)
+        at = np.minimum(idx, max(self.size - 1, 0))
+        exists = (idx < self.size) & (old_t[at] == t) if self.size else np.zeros(len(t), dtype=bool)
+        same = exists & (window[:, at] == batch).all(axis=0)
+        replaced = exists & ~same
+        new = ~exists
+        dropped = new & (t < old_t[0]) if self.size == self.capacity else np.zeros(len(t), dtype=bool)
+        new &= ~dropped
+        appended = new & (t > old_t[-1]) if self.size else new
+
+        result = Upsert(
+            appended=int(appended.sum()),
+            replaced=int(replaced.sum()),
+            inserted=int((new & ~appended).sum()),
+            duplicates=int(same.sum()) + in_batch_dups,
+            dropped=int(dropped.sum()),
+        )
+        changed = batch[:, replaced | new]
+        if not result.changed:
+            return result, changed
+
+        merged = window.copy()
+        merged[:, idx[replaced]] = batch[:, replaced]
+        merged = np.insert(merged, idx[new], batch[:, new], axis=1)
+        gaps = max(0, count_gaps(merged[0], step) - count_gaps(old_t, step))
+
+        self.clear()
+        self.extend(merged)
+        return result._replace(gaps=gaps, rebuilt=True), changed
+
+    def clear(self) -> None:
+        self.size = 0
+        self._pos = -1
+
+    def arrays(self) -> OHLCV:
+        """Колонки последних size свечей без копирования"""
+        return OHLCV(*self._window())
+
+    def view(self) -> 'CandleView':
+        return CandleView(self._window())
+
+
+def rows_to_columns(candles: List[dict]) -> np.ndarray:
+    """Список словарей-свечей → массив формы (6, n)"""
+    if not candles:
+        return np.empty((len(FIELDS), 0), dtype=np.float64)
+    return np.array(
+        [(c['t'], c['o'], c['h'], c['l'], c['c'], c['v']) for c in candles],
+        dtype=np.float64
+    ).T
+
+
+def as_ohlcv(candles) -> OHLCV:
+    """
+    Колонки серии из любого формата свечей
+
+    OHLCV - как есть, CandleView - его колонки без копирования,
+    список словарей - один проход rows_to_columns.
+    """
+    if isinstance(candles, OHLCV):
+        return candles
+    arrays = getattr(candles, 'arrays', None)
+    if arrays is not None:
+        return arrays
+    return OHLCV(*rows_to_columns(list(candles)))
+
+
+def klines_to_columns(rows: List[list], newest_first: bool = False) -> np.ndarray:
+    """
+    Строки kline биржи → массив (6, n) без промежуточных словарей
+
+    rows - [open_time_ms, o, h, l, c, v, ...] (числа или строки, как в JSON
+    Binance/Bybit/OKX). newest_first - Bybit/OKX отдают новые свечи первыми.
+    """
+    if newest_first:
+        rows = rows[::-1]
+    columns = np.empty((len(FIELDS), len(rows)), dtype=np.float64)
+    if rows:
+        for j in range(len(FIELDS)):
+            columns[j] = [row[j] for row in rows]
+        columns[0] /= 1000
+    return columns
+
+
+class CandleView(Sequence):
+    """
+    Серия свечей в виде последовательности словарей (старый формат)
+
+    Держит view на буфер: актуален до следующей записи в серию.
+    Для расчётов используйте .arrays - там копирования нет вовсе.
+    """
+
+    __slots__ = ('_cols',)
+    __hash__ = None
+
+    def __init__(self, columns: np.ndarray):
+        self._cols = columns
+
+    @property
+    def arrays(self) -> OHLCV:
+        return OHLCV(*self._cols)
+
+    def __len__(self) -> int:
+        return self._cols.shape[1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [dict(zip(FIELDS, row)) for row in self._cols[:, index].T.tolist()]
+        return dict(zip(FIELDS, self._cols[:, index].tolist()))
+
+    def __iter__(self):
+        for row in self._cols.T.tolist():
+            yield dict(zip(FIELDS, row))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (CandleView, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"CandleView({len(self)} candles)"
+
+
+EMPTY_VIEW = CandleView(np.empty((len(FIELDS), 0), dtype=np.float64))
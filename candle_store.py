@@ -0,0 +1,184 @@
+"""
+candle_store.py - Постоянное хранилище свечей (SQLite)
+
+- Таблица candles с ключом (pair, tf, open_ts)
+- CandleStorage отдаёт сюда каждую изменённую свечу; запись копится
+  в памяти (обновления формирующейся свечи схлопываются по ключу) и
+  сбрасывается на диск раз в CANDLE_STORE_FLUSH_INTERVAL пачкой в одной
+  транзакции - в потоке, а не в event loop (run_flusher)
+- На старте история поднимается из файла, с биржи качается только дельта
+
+Используется синхронный sqlite3: CandleStorage вызывается из обычного
+(не async) кода. Соединение общее для потока сброса и чтений, доступ
+под блокировкой; чтения и close сначала сбрасывают накопленное.
+При аварийном завершении теряется не больше интервала сброса - эти
+свечи дозагрузятся с биржи как дельта.
+"""
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import CANDLES_DB_PATH, CANDLE_STORE_KEEP, CANDLE_STORE_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+CANDLES_SQL = """
+CREATE TABLE IF NOT EXISTS candles (
+    pair TEXT NOT NULL,
+    tf TEXT NOT NULL,
+    open_ts INTEGER NOT NULL,  -- миллисекунды
+    o REAL NOT NULL,
+    h REAL NOT NULL,
+    l REAL NOT NULL,
+    c REAL NOT NULL,
+    v REAL NOT NULL,
+    PRIMARY KEY (pair, tf, open_ts)
+) WITHOUT ROWID;
+"""
+
+
+class CandleStore:
+    """Свечи на диске"""
+
+    def __init__(self, path: str = CANDLES_DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.pending: Dict[Tuple[str, str, int], tuple] = {}  # (pair, tf, open_ts) -> строка
+        self._pending_lock = threading.Lock()
+        self._conn_lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="candle-store")
+        self._closed = False
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(CANDLES_SQL)
+        self.conn.commit()
+
+    def save(self, pair: str, tf: str, candles: List[dict]):
+        """Записать (или заменить) свечи серии"""
+        if not candles:
+            return
+        rows = [
+            (pair, tf, int(round(c['t'] * 1000)), c['o'], c['h'], c['l'], c['c'], c['v'])
+            for c in candles
+        ]
+        self._write(rows)
+
+    def save_columns(self, pair: str, tf: str, columns: np.ndarray):
+        """Записать свечи из массива (6, n) - без промежуточных словарей"""
+        if columns.shape[1] == 0:
+            return
+        open_ts = np.rint(columns[0] * 1000).astype(np.int64).tolist()
+        o, h, l, c, v = (columns[j].tolist() for j in range(1, 6))
+        self._write(zip(repeat(pair), repeat(tf), open_ts, o, h, l, c, v))
+
+    def _write(self, rows):
+        """Отложить запись: на диск уйдёт при следующем flush"""
+        with self._pending_lock:
+            for row in rows:
+                self.pending[row[:3]] = row
+
+    def flush(self) -> int:
+        """Записать накопленные свечи одной транзакцией; возвращает число строк"""
+        with self._conn_lock:
+            with self._pending_lock:
+                rows, self.pending = list(self.pending.values()), {}
+            if not rows:
+                return 0
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO candles (pair, tf, open_ts, o, h, l, c, v) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+            return len(rows)
+
+    async def run_flusher(self, interval: float = CANDLE_STORE_FLUSH_INTERVAL):
+        """Фоновый сброс накопленных свечей на диск (в потоке)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self._closed:
+                return
+            started = time.monotonic()
+            try:
+                written = await loop.run_in_executor(self._executor, self.flush)
+            except sqlite3.Error as e:
+                logger.error(f"Candle store flush failed: {e}")
+                continue
+            if written:
+                logger.debug(f"💾 Flushed {written} candles in {time.monotonic() - started:.3f}s")
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        """Чтение с учётом ещё не сброшенных свечей"""
+        with self._conn_lock:
+            self.flush()
+            return self.conn.execute(sql, params).fetchall()
+
+    def load(self, pair: str, tf: str, limit: int = 500) -> List[dict]:
+        """Последние limit свечей серии по возрастанию времени"""
+        rows = self._query(
+            "SELECT open_ts, o, h, l, c, v FROM candles WHERE pair=? AND tf=? "
+            "ORDER BY open_ts DESC LIMIT ?",
+            (pair, tf, limit)
+        )
+        rows.reverse()
+        return [
+            {'t': ts / 1000, 'o': o, 'h': h, 'l': l, 'c': c, 'v': v}
+            for ts, o, h, l, c, v in rows
+        ]
+
+    def load_columns(self, pair: str, tf: str, limit: int = 500) -> np.ndarray:
+        """То же, что load, но массивом (6, n) для CandleStorage"""
+        rows = self._query(
+            "SELECT open_ts, o, h, l, c, v FROM candles WHERE pair=? AND tf=? "
+            "ORDER BY open_ts DESC LIMIT ?",
+            (pair, tf, limit)
+        )
+        if not rows:
+            return np.empty((6, 0), dtype=np.float64)
+        columns = np.array(rows[::-1], dtype=np.float64).T.copy()
+        columns[0] /= 1000
+        return columns
+
+    def series(self) -> List[Tuple[str, str]]:
+        """Все (pair, tf), для которых есть свечи"""
+        return self._query("SELECT DISTINCT pair, tf FROM candles")
+
+    def last_open_ts(self, pair: str, tf: str) -> Optional[float]:
+        """Время открытия последней сохранённой свечи (секунды)"""
+        rows = self._query("SELECT MAX(open_ts) FROM candles WHERE pair=? AND tf=?", (pair, tf))
+        return rows[0][0] / 1000 if rows and rows[0][0] is not None else None
+
+    def prune(self, keep: int = CANDLE_STORE_KEEP) -> int:
+        """Оставить только последние keep свечей каждой серии"""
+        deleted = 0
+        with self._conn_lock:
+            for pair, tf in self.series():
+                cursor = self.conn.execute(
+                    "DELETE FROM candles WHERE pair=? AND tf=? AND open_ts < ("
+                    "  SELECT open_ts FROM candles WHERE pair=? AND tf=? "
+                    "  ORDER BY open_ts DESC LIMIT 1 OFFSET ?)",
+                    (pair, tf, pair, tf, keep - 1)
+                )
+                deleted += cursor.rowcount
+            self.conn.commit()
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        candles, series = self._query("SELECT COUNT(*), COUNT(DISTINCT pair || '/' || tf) FROM candles")[0]
+        return {'candles': candles, 'series': series, 'pending': len(self.pending)}
+
+    def close(self):
+        """Сбросить накопленное и закрыть файл"""
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        with self._conn_lock:
+            self.flush()
+            self.conn.close()
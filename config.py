@@ -35,6 +35,8 @@ else:
 # Проверяем существует ли /data (Persistent Disk на Render)
 _data_dir = "/data" if os.path.exists("/data") else "."
 DB_PATH = os.getenv("DB_PATH", f"{_data_dir}/bot.db")
+# Свечи храним отдельно от основной БД (история переживает рестарт)
+CANDLES_DB_PATH = os.getenv("CANDLES_DB_PATH", os.path.join(os.path.dirname(DB_PATH) or ".", "candles.db"))
 
 # ==================== CRYPTO BOT ====================
 CRYPTO_BOT_TOKEN = os.getenv("CRYPTO_BOT_TOKEN", "")
@@ -170,9 +172,100 @@ MAX_SPREAD_PERCENT = 0.5      # Максимальный спред 0.5%
 
 # ==================== OPTIMIZATION ====================
 PRICE_CACHE_TTL = 30
+PRICE_STALE_TTL = 120          # До 2 минут отдаём устаревшую цену и обновляем в фоне
 BATCH_SEND_SIZE = 30
 BATCH_SEND_DELAY = 0.05
 
+# ==================== АНАЛИЗ ====================
+# analyze_pair выполняется вне event loop (analysis_pool.py)
+ANALYZER_MEMO_SIZE = int(os.getenv("ANALYZER_MEMO_SIZE", "2048"))  # Тренды и зоны 4h/1d по закрытому бару (LRU; в process - свой на процесс)
+# thread - пул потоков (общий LRU анализатора), process - процессы
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "thread" if ANALYZER_MEMO_SIZE else "process")
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))     # 0 - по числу ядер
+
+# ==================== ЗАГРУЗКА ИСТОРИИ ====================
+# Сколько свечей загружать на старте по каждому таймфрейму
+HISTORY_CANDLES = {
+    '1h': 300,
+    '4h': 200,
+    '1d': 100
+}
+BOOTSTRAP_CONCURRENCY = int(os.getenv("BOOTSTRAP_CONCURRENCY", "8"))  # Параллельных загрузок
+CANDLE_STORE_KEEP = 1000          # Свечей на серию в candles.db
+CANDLE_STORE_FLUSH_INTERVAL = 30  # Как часто сбрасывать новые свечи в candles.db, сек
+CANDLE_BUFFER_CAPACITY = 500      # Свечей на серию в памяти (кольцевой буфер)
+TIMEFRAME_SECONDS = {'1h': 3600, '4h': 4 * 3600, '1d': 86400}
+BACKFILL_INTERVAL = 600           # Как часто искать и дозагружать дыры в свечах, сек
+BACKFILL_CHUNK = 300              # Свечей в одном запросе дозагрузки (лимит OKX)
+BACKFILL_EMPTY_TTL = 6 * 3600     # Сколько не перезапрашивать пустой на биржах диапазон, сек
+BACKFILL_RETRY_BASE = 1800        # Пауза после сбоя дозагрузки диапазона, дальше вдвое дольше
+BACKFILL_RETRY_MAX = 6 * 3600     # Но не больше 6 часов
+BACKFILL_SKIP_MAX = 10000         # Отложенных диапазонов в памяти (старые вытесняются)
+
+# Бюджет веса запросов на биржу в минуту (с запасом от официальных лимитов)
+# Расход уточняется по заголовкам ответов биржи (rate_limiter.py)
+EXCHANGE_WEIGHT_PER_MINUTE = {
+    "binance": 1200,
+    "bybit": 600,
+    "okx": 600,
+}
+# Вес одного запроса: ticker - одна пара, tickers - пачка (у Binance до 100 символов = 40,
+# до 20 - как ticker), tickers_all - полный список ticker/24hr без symbols
+REQUEST_WEIGHT = {
+    "binance": {"ticker": 2, "tickers": 40, "tickers_all": 80, "klines": 2, "ping": 1},
+    "bybit": {"ticker": 1, "tickers": 1, "klines": 1, "ping": 1},
+    "okx": {"ticker": 1, "tickers": 1, "klines": 1, "ping": 1},
+}
+RATE_LIMIT_BULK_RESERVE = 0.2     # Фоновая загрузка истории не трогает последние 20% бюджета
+
+# Здоровье источников (source_health.py): circuit breaker и выбор биржи
+SOURCE_HEALTH_WINDOW = 50         # Последних запросов в статистике источника
+SOURCE_FAILURE_THRESHOLD = 3      # Ошибок подряд до отключения источника
+SOURCE_COOLDOWN_BASE = 30.0       # Первое отключение - 30с (или Retry-After)
+SOURCE_COOLDOWN_MAX = 600.0       # Повторные - вдвое дольше, но не больше 10 минут
+SOURCE_PROBE_INTERVAL = 10        # Проверка отключённых источников в фоне
+
+# ==================== MARKET DATA STREAM ====================
+# WebSocket-поток свечей и тикеров (Binance → Bybit → OKX)
+# Если поток недоступен - работает обычный REST polling
+MARKET_STREAM_ENABLED = os.getenv("MARKET_STREAM", "0") == "1"
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443/stream")
+BYBIT_WS_URL = os.getenv("BYBIT_WS_URL", "wss://stream.bybit.com/v5/public/spot")
+OKX_WS_PUBLIC_URL = os.getenv("OKX_WS_PUBLIC_URL", "wss://ws.okx.com:8443/ws/v5/public")
+OKX_WS_BUSINESS_URL = os.getenv("OKX_WS_BUSINESS_URL", "wss://ws.okx.com:8443/ws/v5/business")
+STREAM_TIMEFRAMES = ["1h", "4h", "1d"]
+STREAM_STALE_SECONDS = 30         # Нет сообщений дольше - поток считается мёртвым
+STREAM_BACKOFF_BASE = 1.0         # Реконнект: 1с, 2с, 4с ... 
+STREAM_BACKOFF_MAX = 60.0         # ... но не дольше минуты
+STREAM_CHECK_INTERVAL = 30        # Как часто price_collector проверяет поток
+STREAM_TRACKING_INTERVAL = 5      # Интервал трекеров TP/SL при живом потоке
+
+# ==================== HTTP КЛИЕНТЫ ====================
+# Один клиент с пулом keep-alive соединений на каждый внешний хост
+# (см. http_clients.py). HTTP/2 включается, только если установлен h2
+HTTP2_ENABLED = os.getenv("HTTP2", "1") == "1"
+HTTP_HOSTS = {
+    # timeout - на запрос (klines и всё, что не указывает свой), connect - на установку
+    # соединения, retries - повторы при ошибке соединения (запрос ещё не отправлен)
+    "binance": {"timeout": 10.0, "connect": 5.0, "max_connections": 20, "keepalive": 10, "retries": 2},
+    "bybit": {"timeout": 10.0, "connect": 5.0, "max_connections": 20, "keepalive": 10, "retries": 2},
+    "okx": {"timeout": 10.0, "connect": 5.0, "max_connections": 20, "keepalive": 10, "retries": 2},
+    "cryptopay": {"timeout": 10.0, "connect": 5.0, "max_connections": 5, "keepalive": 2, "retries": 1},
+}
+# Цены (ticker) и проверка доступности биржи - короткий таймаут: зависший запрос
+# лучше быстро отдать следующей бирже, чем ждать 10с как klines
+TICKER_TIMEOUT = 5.0
+
+# REST API бирж (для нагрузочных тестов - адрес mock_exchange.py)
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://api.binance.com")
+BYBIT_API_URL = os.getenv("BYBIT_API_URL", "https://api.bybit.com")
+OKX_API_URL = os.getenv("OKX_API_URL", "https://www.okx.com")
+
+# Запись/воспроизведение ответов бирж (exchange_replay.py) - офлайн-прогоны
+EXCHANGE_RECORD_PATH = os.getenv("EXCHANGE_RECORD", "")    # писать ответы в архив .jsonl.gz
+EXCHANGE_REPLAY_PATH = os.getenv("EXCHANGE_REPLAY", "")    # отвечать из архива вместо сети
+EXCHANGE_REPLAY_REALTIME = os.getenv("EXCHANGE_REPLAY_REALTIME", "0") == "1"  # с исходными задержками
+
 # ==================== IMAGES ====================
 IMG_START = os.getenv("IMG_START", "")
 IMG_ALERTS = os.getenv("IMG_ALERTS", "")
@@ -8,9 +8,10 @@ import hmac
 import json
 import logging
 from typing import Optional, Dict
-import httpx
 from datetime import datetime, timedelta
 
+from http_clients import HTTP_CLIENTS
+
 logger = logging.getLogger(__name__)
 
 # ==================== КОНФИГУРАЦИЯ ====================
@@ -96,41 +97,40 @@ class CryptoPayAPI:
             }
         """
         try:
-            async with httpx.AsyncClient() as client:
-                data = {
-                    "amount": str(amount),
-                    "currency_type": "fiat",  # fiat для USD
-                    "fiat": "USD",
-                    "accepted_assets": currency,  # Какие криптовалюты принимать
-                    "description": description,
-                    "payload": payload,
-                    "allow_comments": allow_comments,
-                    "allow_anonymous": allow_anonymous
-                }
-                
-                response = await client.post(
-                    f"{self.api_url}/createInvoice",
-                    headers=self.headers,
-                    json=data,
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("ok"):
-                        invoice = result["result"]
-                        logger.info(f"Invoice created: {invoice['invoice_id']}")
-                        return {
-                            "invoice_id": invoice["invoice_id"],
-                            "pay_url": invoice.get("pay_url") or invoice.get("bot_invoice_url"),
-                            "amount": invoice.get("amount", str(amount)),
-                            "currency": invoice.get("asset") or invoice.get("fiat") or "USD"
-                        }
-                    else:
-                        logger.error(f"Crypto Bot API error: {result.get('error')}")
+            client = HTTP_CLIENTS.get("cryptopay")
+            data = {
+                "amount": str(amount),
+                "currency_type": "fiat",  # fiat для USD
+                "fiat": "USD",
+                "accepted_assets": currency,  # Какие криптовалюты принимать
+                "description": description,
+                "payload": payload,
+                "allow_comments": allow_comments,
+                "allow_anonymous": allow_anonymous
+            }
+            
+            response = await client.post(
+                f"{self.api_url}/createInvoice",
+                headers=self.headers,
+                json=data
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                if result.get("ok"):
+                    invoice = result["result"]
+                    logger.info(f"Invoice created: {invoice['invoice_id']}")
+                    return {
+                        "invoice_id": invoice["invoice_id"],
+                        "pay_url": invoice.get("pay_url") or invoice.get("bot_invoice_url"),
+                        "amount": invoice.get("amount", str(amount)),
+                        "currency": invoice.get("asset") or invoice.get("fiat") or "USD"
+                    }
                 else:
-                    logger.error(f"HTTP error: {response.status_code}")
-                    
+                    logger.error(f"Crypto Bot API error: {result.get('error')}")
+            else:
+                logger.error(f"HTTP error: {response.status_code}")
+                
         except Exception as e:
             logger.error(f"Create invoice error: {e}")
         
@@ -149,21 +149,20 @@ class CryptoPayAPI:
             }
         """
         try:
-            async with httpx.AsyncClient() as client:
-                params = {"invoice_ids": invoice_id}
-                
-                response = await client.get(
-                    f"{self.api_url}/getInvoices",
-                    headers=self.headers,
-                    params=params,
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("ok") and result["result"]["items"]:
-                        return result["result"]["items"][0]
-                        
+            client = HTTP_CLIENTS.get("cryptopay")
+            params = {"invoice_ids": invoice_id}
+            
+            response = await client.get(
+                f"{self.api_url}/getInvoices",
+                headers=self.headers,
+                params=params
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                if result.get("ok") and result["result"]["items"]:
+                    return result["result"]["items"][0]
+                    
         except Exception as e:
             logger.error(f"Get invoice error: {e}")
         
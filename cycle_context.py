@@ -0,0 +1,141 @@
+"""
+cycle_context.py - Общий контекст цикла анализа
+
+- Рыночные признаки, одинаковые для всех пар (состояние BTC, прокси
+  доминации BTC, ширина рынка), считаются один раз за цикл, а не на
+  каждую пару
+- Все пары цикла видят один снимок рынка на момент timestamp
+- Новый признак - функция (storage, pairs, context) -> значение,
+  зарегистрированная @market_feature("name"); признаки считаются в
+  порядке регистрации, поэтому могут опираться на предыдущие
+- Признаки, которые читает analyze_pair, регистрируются с analysis=True:
+  они входят в fingerprint() - ключ кэша результатов анализа
+
+Контекст - простые значения без ссылок на буферы: уходит в воркеры
+analysis_pool.py вместо свечей BTC в каждом задании.
+"""
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BTC_PAIR = "BTCUSDT"
+
+# name -> функция признака
+MARKET_FEATURES: Dict[str, Callable] = {}
+# Признаки, от которых зависит результат analyze_pair
+ANALYSIS_FEATURES: List[str] = []
+
+
+def market_feature(name: str, analysis: bool = False):
+    """Регистрация рыночного признака; analysis=True - его читает анализ пар"""
+    def register(func: Callable) -> Callable:
+        MARKET_FEATURES[name] = func
+        if analysis and name not in ANALYSIS_FEATURES:
+            ANALYSIS_FEATURES.append(name)
+        return func
+    return register
+
+
+def btc_state(closes) -> str:
+    """bullish/bearish, если BTC растёт/падает и за 4, и за 24 часа (1h закрытия)"""
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(closes) < 24:
+        return 'neutral'
+
+    change_4h = (closes[-1] - closes[-4]) / closes[-4] * 100
+    change_24h = (closes[-1] - closes[-24]) / closes[-24] * 100
+
+    if change_4h > 0.5 and change_24h > 1:
+        return 'bullish'
+    elif change_4h < -0.5 and change_24h < -1:
+        return 'bearish'
+    else:
+        return 'neutral'
+
+
+def _change_24h(storage, pair: str) -> Optional[float]:
+    closes = storage.get_arrays(pair, "1h").c
+    if len(closes) < 24 or closes[-24] <= 0:
+        return None
+    return float((closes[-1] - closes[-24]) / closes[-24] * 100)
+
+
+class CycleContext:
+    """Снимок рынка на цикл анализа"""
+
+    def __init__(self, timestamp: float, features: Dict[str, Any] = None):
+        self.timestamp = timestamp
+        self.features: Dict[str, Any] = features or {}
+
+    @classmethod
+    def build(cls, storage, pairs: Iterable[str], now: float = None) -> 'CycleContext':
+        """Посчитать все зарегистрированные признаки по хранилищу свечей"""
+        context = cls(time.time() if now is None else now)
+        pairs = list(pairs)
+        for name, func in MARKET_FEATURES.items():
+            try:
+                context.features[name] = func(storage, pairs, context)
+            except Exception as e:
+                logger.error(f"Market feature {name} failed: {e}")
+                context.features[name] = None
+        return context
+
+    def get(self, name: str, default: Any = None) -> Any:
+        value = self.features.get(name)
+        return default if value is None else value
+
+    def __getitem__(self, name: str) -> Any:
+        return self.features[name]
+
+    def fingerprint(self) -> tuple:
+        """Значения признаков анализа: тот же fingerprint - тот же рынок для analyze_pair"""
+        return tuple(self.features.get(name) for name in ANALYSIS_FEATURES)
+
+    @property
+    def btc_state(self) -> str:
+        return self.get('btc_state', 'neutral')
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+                           for k, v in self.features.items())
+        return f"CycleContext({values})"
+
+
+# ==================== ПРИЗНАКИ ====================
+@market_feature("btc_state", analysis=True)
+def _btc_state(storage, pairs: List[str], context: CycleContext) -> str:
+    return btc_state(storage.get_arrays(BTC_PAIR, "1h").c)
+
+
+@market_feature("btc_change_24h")
+def _btc_change(storage, pairs: List[str], context: CycleContext) -> Optional[float]:
+    return _change_24h(storage, BTC_PAIR)
+
+
+@market_feature("alt_change_24h")
+def _alt_change(storage, pairs: List[str], context: CycleContext) -> Optional[float]:
+    """Медианное изменение альткоинов за 24 часа"""
+    changes = [_change_24h(storage, pair) for pair in pairs if pair != BTC_PAIR]
+    changes = [c for c in changes if c is not None]
+    return float(np.median(changes)) if changes else None
+
+
+@market_feature("btc_dominance")
+def _btc_dominance(storage, pairs: List[str], context: CycleContext) -> Optional[float]:
+    """Прокси доминации: BTC минус медиана альтов за 24 часа, > 0 - деньги уходят в BTC"""
+    btc, alts = context.features.get('btc_change_24h'), context.features.get('alt_change_24h')
+    if btc is None or alts is None:
+        return None
+    return btc - alts
+
+
+@market_feature("breadth")
+def _breadth(storage, pairs: List[str], context: CycleContext) -> Optional[float]:
+    """Доля пар, выросших за 24 часа"""
+    changes = [_change_24h(storage, pair) for pair in pairs]
+    changes = [c for c in changes if c is not None]
+    return sum(c > 0 for c in changes) / len(changes) if changes else None
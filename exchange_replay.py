@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+exchange_replay.py - Запись и воспроизведение ответов бирж
+
+- RecordingTransport: пропускает запросы в сеть и пишет каждый
+  запрос/ответ с задержкой в архив (.jsonl.gz, одна строка на ответ)
+- ReplayTransport: отвечает из архива без сети, детерминированно;
+  быстро или в исходном темпе (realtime: ответ не раньше своего
+  смещения at + latency от начала воспроизведения)
+- Подключается к HTTP_CLIENTS переменными окружения:
+    EXCHANGE_RECORD=run.jsonl.gz python main.py   - запись
+    EXCHANGE_REPLAY=run.jsonl.gz python main.py   - воспроизведение
+    EXCHANGE_REPLAY_REALTIME=1                    - в исходном темпе
+
+Ответы на один и тот же запрос отдаются в порядке записи, последний
+повторяется. Запрос, которого нет в архиве, подбирается по пути без
+параметров limit/startTime/endTime, иначе - ошибка соединения
+(как при отсутствии сети: дальше работает обычный fallback).
+
+Просмотр архива: python exchange_replay.py run.jsonl.gz
+"""
+import sys
+import gzip
+import json
+import time
+import base64
+import asyncio
+import logging
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+KEPT_HEADERS = (
+    "content-type", "retry-after",
+    "x-mbx-used-weight-1m", "x-bapi-limit-status", "x-bapi-limit", "x-bapi-limit-reset-timestamp",
+)
+VOLATILE_PARAMS = {"limit", "startTime", "endTime", "start", "end", "after", "before"}
+# Тело в архиве и в пересобранном ответе уже распаковано - эти заголовки к нему не относятся
+BODY_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def request_key(method: str, url: httpx.URL, exact: bool = True) -> Tuple:
+    """Ключ запроса: метод, хост, путь и отсортированные параметры"""
+    params = sorted(
+        (k, v) for k, v in url.params.multi_items()
+        if exact or k not in VOLATILE_PARAMS
+    )
+    return method, url.host, url.path, tuple(params)
+
+
+def _encode_body(body: bytes) -> dict:
+    try:
+        return {"body": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(body).decode("ascii")}
+
+
+def _decode_body(record: dict) -> bytes:
+    if "body_b64" in record:
+        return base64.b64decode(record["body_b64"])
+    return record["body"].encode("utf-8")
+
+
+def load_archive(path: str) -> List[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ResponseArchive:
+    """Архив записанных ответов (общий для клиентов всех бирж)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.time()
+        self.recorded = 0
+        self._file = gzip.open(path, "at", encoding="utf-8")
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.recorded += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            logger.info(f"📼 Recorded {self.recorded} exchange responses to {self.path}")
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Транспорт-прослойка: настоящий запрос + запись в архив"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, archive: ResponseArchive):
+        self.inner = inner
+        self.archive = archive
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        sent_at = time.time()
+        response = await self.inner.handle_async_request(request)
+        body = await response.aread()
+        latency = time.time() - sent_at
+
+        record = {
+            "at": round(sent_at - self.archive.started, 4),
+            "latency": round(latency, 4),
+            "method": request.method,
+            "url": str(request.url),
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+        }
+        record.update(_encode_body(body))
+        self.archive.write(record)
+
+        return httpx.Response(
+            response.status_code,
+            headers=[(k, v) for k, v in response.headers.multi_items() if k.lower() not in BODY_HEADERS],
+            content=body,
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Ответы из архива вместо сети"""
+
+    def __init__(self, records: List[dict], realtime: bool = False):
+        self.realtime = realtime
+        self.served = 0
+        self._origin: Optional[float] = None  # начало записи на часах воспроизведения
+        self.misses = 0
+        self._exact: Dict[Tuple, deque] = defaultdict(deque)
+        self._loose: Dict[Tuple, deque] = defaultdict(deque)
+        for record in records:
+            url = httpx.URL(record["url"])
+            self._exact[request_key(record["method"], url)].append(record)
+            self._loose[request_key(record["method"], url, exact=False)].append(record)
+
+    @classmethod
+    def from_file(cls, path: str, realtime: bool = False) -> "ReplayTransport":
+        records = load_archive(path)
+        logger.info(f"📼 Replaying {len(records)} exchange responses from {path}")
+        return cls(records, realtime)
+
+    def _next(self, request: httpx.Request) -> Optional[dict]:
+        for index, exact in ((self._exact, True), (self._loose, False)):
+            queue = index.get(request_key(request.method, request.url, exact))
+            if queue:
+                # Последний ответ остаётся в очереди и повторяется
+                return queue.popleft() if len(queue) > 1 else queue[0]
+        return None
+
+    def _delay(self, record: dict) -> float:
+        """
+        Ожидание до ответа: до отметки at + latency от начала записи, но не
+        меньше исходной задержки (запоздавший или повторный запрос)
+        """
+        now = time.monotonic()
+        if self._origin is None:
+            # Первый запрос совмещается с моментом своей записи
+            self._origin = now - record["at"]
+        return max(self._origin + record["at"] + record["latency"] - now, record["latency"])
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        record = self._next(request)
+        if record is None:
+            self.misses += 1
+            raise httpx.ConnectError(f"No recorded response for {request.method} {request.url}", request=request)
+
+        if self.realtime:
+            await asyncio.sleep(self._delay(record))
+
+        self.served += 1
+        return httpx.Response(
+            record["status"],
+            headers=record["headers"],
+            content=_decode_body(record),
+            request=request,
+        )
+
+
+def _summary(path: str):
+    records = load_archive(path)
+    if not records:
+        print("Архив пуст")
+        return
+
+    by_endpoint = Counter(f"{httpx.URL(r['url']).host}{httpx.URL(r['url']).path}" for r in records)
+    statuses = Counter(r["status"] for r in records)
+    latencies = sorted(r["latency"] for r in records)
+
+    print(f"📼 {path}: {len(records)} ответов за {max(r['at'] for r in records):.0f}с")
+    print(f"   Статусы: {dict(statuses)}")
+    print(f"   Задержка p50={latencies[len(latencies) // 2]:.3f}с p95={latencies[int(len(latencies) * 0.95)]:.3f}с")
+    for endpoint, count in by_endpoint.most_common():
+        print(f"   {count:6d}  {endpoint}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Использование: python exchange_replay.py <archive.jsonl.gz>")
+        sys.exit(1)
+    _summary(sys.argv[1])
@@ -0,0 +1,124 @@
+"""
+extrema.py - Локальные максимумы/минимумы серии за O(n)
+
+- rolling_min / rolling_max - скользящий минимум/максимум окна w
+  алгоритмом van Herk / Gil-Werman: префиксные и суффиксные
+  accumulate по блокам длины w, без цикла по окнам
+- local_minima / local_maxima - бары, не хуже window соседей с каждой
+  стороны (как прежние циклы в анализаторах: равные соседи допускаются)
+- cluster_levels - зоны ±2% из экстремумов с касаниями, объёмом и силой
+
+Используется для уровней поддержки/сопротивления в indicators.py
+и professional_analyzer.py.
+"""
+import numpy as np
+
+
+def _rolling(values, w: int, ufunc, fill: float) -> np.ndarray:
+    """out[k] = ufunc над values[k:k + w], длина n - w + 1"""
+    x = np.asarray(values, dtype=np.float64)
+    n = len(x)
+    if w <= 1:
+        return x.copy()
+    if n < w:
+        return np.empty(0)
+
+    pad = (-n) % w
+    blocks = np.concatenate((x, np.full(pad, fill))).reshape(-1, w)
+    prefix = ufunc.accumulate(blocks, axis=1).ravel()
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    # Окно [k, k + w - 1] = хвост блока k + начало следующего блока
+    return ufunc(suffix[:n - w + 1], prefix[w - 1:n])
+
+
+def rolling_min(values, w: int) -> np.ndarray:
+    return _rolling(values, w, np.minimum, np.inf)
+
+
+def rolling_max(values, w: int) -> np.ndarray:
+    return _rolling(values, w, np.maximum, -np.inf)
+
+
+def local_minima(values, window: int) -> np.ndarray:
+    """Индексы i в [window, n - window): values[i] <= window соседей слева и справа"""
+    x = np.asarray(values, dtype=np.float64)
+    n = len(x)
+    if n < 2 * window + 1:
+        return np.empty(0, dtype=np.int64)
+    side = rolling_min(x, window)
+    i = np.arange(window, n - window)
+    return i[(x[i] <= side[i - window]) & (x[i] <= side[i + 1])]
+
+
+def local_maxima(values, window: int) -> np.ndarray:
+    """Индексы i в [window, n - window): values[i] >= window соседей слева и справа"""
+    x = np.asarray(values, dtype=np.float64)
+    n = len(x)
+    if n < 2 * window + 1:
+        return np.empty(0, dtype=np.int64)
+    side = rolling_max(x, window)
+    i = np.arange(window, n - window)
+    return i[(x[i] >= side[i - window]) & (x[i] >= side[i + 1])]
+
+
+def cluster_levels(prices, volumes, min_touches: int, tolerance: float = 0.02, limit: int = 5) -> list:
+    """
+    Зоны уровней из экстремумов (в порядке времени) - топ limit по силе
+
+    Та же группировка, что попарное сравнение с processed: первый по времени
+    свободный экстремум открывает зону и забирает все свободные с
+    |price - его price| / его price < tolerance. Кандидаты берутся из
+    отсортированного по цене массива (searchsorted), занятые позиции
+    перепрыгиваются указателями - O(k log k) вместо O(k²).
+    Касания, объём и сила - bincount по меткам зон.
+    """
+    p = np.asarray(prices, dtype=np.float64)
+    v = np.asarray(volumes, dtype=np.float64)
+    k = len(p)
+    if k == 0:
+        return []
+
+    order = np.argsort(p, kind='stable')
+    sorted_p = p[order]
+    # Границы с запасом на округление, точное условие проверяется ниже
+    slack = np.abs(p) * 1e-9
+    lo = np.searchsorted(sorted_p, p - p * tolerance - slack, 'left').tolist()
+    hi = np.searchsorted(sorted_p, p + p * tolerance + slack, 'right').tolist()
+
+    price, position = p.tolist(), order.tolist()
+    free = list(range(k + 1))  # free[r] ведёт к первой свободной позиции >= r
+
+    def next_free(r: int) -> int:
+        while free[r] != r:
+            free[r] = free[free[r]]
+            r = free[r]
+        return r
+
+    labels = [-1] * k
+    for i in range(k):
+        if labels[i] >= 0:
+            continue
+        anchor = price[i]
+        r = next_free(lo[i])
+        while r < hi[i]:
+            j = position[r]
+            if abs(anchor - price[j]) / anchor < tolerance:
+                labels[j] = i
+                free[r] = r + 1
+            r = next_free(r + 1)
+
+    # Метки - индексы открывших зону, unique сохраняет их порядок по времени
+    _, zone = np.unique(labels, return_inverse=True)
+    touches = np.bincount(zone)
+    price_sum = np.bincount(zone, weights=p)
+    volume = np.bincount(zone, weights=v)
+    strength = touches * np.log1p(volume)
+
+    kept = np.flatnonzero(touches >= min_touches)
+    top = kept[np.argsort(-strength[kept], kind='stable')][:limit]
+    return [{
+        'price': float(price_sum[z] / touches[z]),
+        'touches': int(touches[z]),
+        'volume': float(volume[z]),
+        'strength': float(strength[z]),
+    } for z in top]
@@ -0,0 +1,104 @@
+"""
+http_clients.py - Общие HTTP-клиенты для всех внешних запросов
+
+- Один httpx.AsyncClient на внешний хост (биржи, Crypto Pay)
+- Keep-alive пул: TCP/TLS рукопожатие один раз, а не на каждый запрос
+- Таймауты, лимиты соединений и повторы - из HTTP_HOSTS (config.py)
+- HTTP/2, если установлен пакет h2
+- Ответы бирж передаются в RATE_LIMITS (заголовки лимитов)
+- EXCHANGE_RECORD / EXCHANGE_REPLAY - запись и офлайн-воспроизведение бирж
+
+Клиенты создаются в main.on_startup и закрываются в on_shutdown.
+Скрипты и тесты могут просто вызвать get() - клиент создастся по требованию.
+"""
+import importlib.util
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+from config import (
+    HTTP_HOSTS, HTTP2_ENABLED, EXCHANGE_RECORD_PATH, EXCHANGE_REPLAY_PATH, EXCHANGE_REPLAY_REALTIME
+)
+from exchange_replay import ResponseArchive, RecordingTransport, ReplayTransport
+from rate_limiter import RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class HttpClients:
+    """Реестр клиентов по имени хоста"""
+
+    def __init__(self, hosts: Dict[str, dict] = None, record_path: str = EXCHANGE_RECORD_PATH,
+                 replay_path: str = EXCHANGE_REPLAY_PATH, replay_realtime: bool = EXCHANGE_REPLAY_REALTIME):
+        self.hosts = hosts or HTTP_HOSTS
+        self.http2 = HTTP2_ENABLED and HTTP2_AVAILABLE
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+        # Запись/воспроизведение ответов бирж (exchange_replay.py); Crypto Pay - всегда в сеть
+        self.record_path = record_path
+        self.replay_path = replay_path
+        self.replay_realtime = replay_realtime
+        self._archive: Optional[ResponseArchive] = None
+        self._replay: Optional[ReplayTransport] = None
+
+    def _exchange_transport(self, transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+        if self.replay_path:
+            if self._replay is None:
+                self._replay = ReplayTransport.from_file(self.replay_path, self.replay_realtime)
+            return self._replay
+        if self.record_path:
+            if self._archive is None:
+                self._archive = ResponseArchive(self.record_path)
+            return RecordingTransport(transport, self._archive)
+        return transport
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        profile = self.hosts[name]
+        transport = httpx.AsyncHTTPTransport(
+            http2=self.http2,
+            retries=profile["retries"],
+            limits=httpx.Limits(
+                max_connections=profile["max_connections"],
+                max_keepalive_connections=profile["keepalive"]
+            )
+        )
+        # Заголовки лимитов каждого ответа биржи уходят в её RateGovernor
+        event_hooks = {}
+        if name in RATE_LIMITS:
+            async def observe(response: httpx.Response):
+                RATE_LIMITS[name].observe(response)
+            event_hooks["response"] = [observe]
+            transport = self._exchange_transport(transport)
+
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(profile["timeout"], connect=profile["connect"]),
+            event_hooks=event_hooks
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Клиент хоста (создаётся при первом обращении)"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._create(name)
+        return client
+
+    async def start(self):
+        """Создать клиенты всех хостов заранее"""
+        for name in self.hosts:
+            self.get(name)
+        logger.info(f"✅ HTTP clients ready: {', '.join(self.hosts)} (HTTP/2: {'on' if self.http2 else 'off'})")
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+HTTP_CLIENTS = HttpClients()
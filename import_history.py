@@ -9,57 +9,35 @@ import_history_FIXED.py - Импорт исторических данных (И
 """
 import sys
 import asyncio
-import httpx
-from indicators import CANDLES
+from indicators import CANDLES, load_history
+from http_clients import HTTP_CLIENTS
+from candle_store import CandleStore
+from config import CANDLES_DB_PATH, BOOTSTRAP_CONCURRENCY
+
+def open_store():
+    """Подключить candles.db: импорт пишет туда, бот поднимает историю на старте"""
+    CANDLES.attach_store(CandleStore(CANDLES_DB_PATH))
+    loaded = CANDLES.load_from_store()
+    print(f"💾 {CANDLES_DB_PATH}: уже сохранено {loaded} свечей")
 
 async def import_history(pair: str, tf: str, count: int):
-    """Импортировать историю с Binance"""
+    """Импортировать историю (с биржи качается только то, чего нет в candles.db)"""
+    pair = pair.upper()
     print(f"📥 Импорт {count} свечей {tf} для {pair}...")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            url = "https://api.binance.com/api/v3/klines"
-            params = {
-                "symbol": pair.upper(),
-                "interval": tf,
-                "limit": min(count, 1000)
-            }
-            
-            print(f"  🔗 Запрос к Binance API...")
-            resp = await client.get(url, params=params, timeout=10.0)
-            resp.raise_for_status()
-            
-            klines = resp.json()
-            print(f"  ✅ Получено {len(klines)} свечей {tf}")
-            
-            # Добавляем в хранилище
-            added = 0
-            for kline in klines:
-                open_time = kline[0] / 1000
-                candle = {
-                    "ts": open_time,
-                    "t": open_time,
-                    "o": float(kline[1]),
-                    "h": float(kline[2]),
-                    "l": float(kline[3]),
-                    "c": float(kline[4]),
-                    "v": float(kline[5])
-                }
-                
-                CANDLES.add_candle(pair.upper(), tf, candle)
-                added += 1
-            
-            print(f"  ✅ Добавлено {added} свечей в хранилище")
-            
-            # Проверка
-            total = len(CANDLES.get_candles(pair, tf))
-            print(f"  📊 Всего свечей {tf} для {pair}: {total}")
-            
-            return True
-            
-        except Exception as e:
-            print(f"  ❌ Ошибка: {e}")
-            return False
+    try:
+        loaded = await load_history([pair], {tf: count}, concurrency=1)
+        print(f"  ✅ Получено/обновлено {loaded[(pair, tf)]} свечей {tf}")
+        
+        # Проверка
+        total = len(CANDLES.get_candles(pair, tf))
+        print(f"  📊 Всего свечей {tf} для {pair}: {total}")
+        
+        return total > 0
+        
+    except Exception as e:
+        print(f"  ❌ Ошибка: {e}")
+        return False
 
 async def import_all_default():
     """
@@ -86,22 +64,18 @@ async def import_all_default():
         '1d': 100   # Было ~12, теперь 100!
     }
     
+    # Все пары и таймфреймы параллельно (дельта к candles.db)
+    loaded = await load_history(DEFAULT_PAIRS, timeframes_config, BOOTSTRAP_CONCURRENCY)
+    
     total_success = 0
     total_failed = 0
     
-    for pair in DEFAULT_PAIRS:
-        print(f"\n🔄 Загрузка {pair}...")
-        print("-" * 80)
-        
-        for tf, count in timeframes_config.items():
-            success = await import_history(pair, tf, count)
-            if success:
-                total_success += 1
-            else:
-                total_failed += 1
-                print(f"  ⚠️ Пропускаем {pair} {tf}")
-            
-            await asyncio.sleep(0.5)
+    for pair, tf in loaded:
+        if CANDLES.get_candles(pair, tf):
+            total_success += 1
+        else:
+            total_failed += 1
+            print(f"  ⚠️ Пропускаем {pair} {tf}")
     
     print()
     print("=" * 80)
@@ -165,36 +139,41 @@ async def main():
     print("=" * 80)
     print()
     
-    if command == "ALL":
-        await import_all_default()
-    else:
-        if len(sys.argv) < 3:
-            print("❌ Укажи таймфрейм: 1h, 4h или 1d")
-            print("   Пример: python import_history_FIXED.py BTCUSDT 4h")
-            sys.exit(1)
-        
-        pair = sys.argv[1].upper()
-        tf = sys.argv[2].lower()
-        
-        if tf not in ['1h', '4h', '1d']:
-            print(f"❌ Неверный таймфрейм: {tf}")
-            print("   Доступны: 1h, 4h, 1d")
-            sys.exit(1)
-        
-        counts = {'1h': 300, '4h': 200, '1d': 100}
-        count = counts[tf]
-        
-        success = await import_history(pair, tf, count)
-        
-        if success:
-            print()
-            print("=" * 80)
-            print("✅ ИМПОРТ ЗАВЕРШЁН!")
-            print("=" * 80)
+    open_store()
+    
+    try:
+        if command == "ALL":
+            await import_all_default()
         else:
-            print()
-            print("❌ Импорт не удался")
-            sys.exit(1)
+            if len(sys.argv) < 3:
+                print("❌ Укажи таймфрейм: 1h, 4h или 1d")
+                print("   Пример: python import_history_FIXED.py BTCUSDT 4h")
+                sys.exit(1)
+            
+            pair = sys.argv[1].upper()
+            tf = sys.argv[2].lower()
+            
+            if tf not in ['1h', '4h', '1d']:
+                print(f"❌ Неверный таймфрейм: {tf}")
+                print("   Доступны: 1h, 4h, 1d")
+                sys.exit(1)
+            
+            counts = {'1h': 300, '4h': 200, '1d': 100}
+            count = counts[tf]
+            
+            success = await import_history(pair, tf, count)
+            
+            if success:
+                print()
+                print("=" * 80)
+                print("✅ ИМПОРТ ЗАВЕРШЁН!")
+                print("=" * 80)
+            else:
+                print()
+                print("❌ Импорт не удался")
+                sys.exit(1)
+    finally:
+        await HTTP_CLIENTS.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
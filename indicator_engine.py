@@ -0,0 +1,201 @@
+"""
+indicator_engine.py - Векторизованные индикаторы на NumPy
+
+- Каждая функция *_series считает весь ряд за один O(n) проход,
+  без Python-циклов по свечам
+- last_* - значение на последней свече (None, если данных мало -
+  как у старых calculate_* в indicators.py)
+- Семантика совпадает со старыми реализациями: EMA стартует с первого
+  значения, RSI и ATR - простое среднее за period (RSI Уайлдера -
+  wilder=True), Bollinger - стандартное отклонение генеральной совокупности
+
+Ряды выровнены по входу: значения до первого полного окна - NaN.
+Вход - 1-D ряд или 2-D матрица (пары × время): расчёт идёт по
+последней оси, все пары одним вызовом (см. batch_indicators.py).
+"""
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from config import RSI_PERIOD, MACD_FAST, MACD_SLOW, MACD_SIGNAL, BB_PERIOD, BB_STD
+
+# Длина блока рекурсии: d ** -m не должно выходить за пределы float64
+_MAX_DECAY_EXP = 300.0
+
+
+def _as_array(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def smooth(values: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    """
+    Рекурсия y[i] = alpha * x[i] + (1 - alpha) * y[i-1], y[-1] = initial
+
+    Считается блоками в замкнутой форме (cumsum с весами d^-i),
+    состояние переносится между блоками. Для матрицы initial - по строке.
+    """
+    x = _as_array(values)
+    n = x.shape[-1]
+    decay = 1.0 - alpha
+    if n == 0 or decay <= 0.0:
+        return x.copy()
+
+    block = max(1, int(_MAX_DECAY_EXP / -math.log(decay)))
+    out = np.empty_like(x)
+    powers = decay ** np.arange(1, min(block, n) + 1, dtype=np.float64)
+    state = np.asarray(initial, dtype=np.float64)[..., None]
+    for start in range(0, n, block):
+        chunk = x[..., start:start + block]
+        p = powers[:chunk.shape[-1]]
+        ys = p * (state + alpha * np.cumsum(chunk / p, axis=-1))
+        out[..., start:start + chunk.shape[-1]] = ys
+        state = ys[..., -1:]
+    return out
+
+
+def rolling_mean(values: np.ndarray, period: int) -> np.ndarray:
+    """Скользящее среднее, NaN до первого полного окна"""
+    x = _as_array(values)
+    out = np.full(x.shape, np.nan)
+    if period <= 0 or x.shape[-1] < period:
+        return out
+    sums = np.zeros(x.shape[:-1] + (x.shape[-1] + 1,))
+    np.cumsum(x, axis=-1, out=sums[..., 1:])
+    out[..., period - 1:] = (sums[..., period:] - sums[..., :-period]) / period
+    return out
+
+
+def ema_series(values, period: int) -> np.ndarray:
+    """EMA, начиная с первого значения (как calculate_ema)"""
+    x = _as_array(values)
+    if x.shape[-1] == 0:
+        return x.copy()
+    return smooth(x, 2.0 / (period + 1), x[..., 0])
+
+
+def sma_series(values, period: int) -> np.ndarray:
+    return rolling_mean(values, period)
+
+
+def macd_series(closes, fast: int = MACD_FAST, slow: int = MACD_SLOW,
+                signal: int = MACD_SIGNAL) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    MACD: линия, сигнальная, гистограмма
+
+    Сигнальная - EMA линии MACD начиная со свечи slow-1
+    (первая, где определены обе EMA), до неё - NaN.
+    """
+    x = _as_array(closes)
+    line = ema_series(x, fast) - ema_series(x, slow)
+    signal_line = np.full(x.shape, np.nan)
+    if x.shape[-1] >= slow:
+        signal_line[..., slow - 1:] = ema_series(line[..., slow - 1:], signal)
+    return line, signal_line, line - signal_line
+
+
+def rsi_series(closes, period: int = RSI_PERIOD, wilder: bool = False) -> np.ndarray:
+    """
+    RSI: средний рост / среднее падение за period
+
+    wilder=False - простое среднее последних period изменений (как calculate_rsi),
+    wilder=True - сглаживание Уайлдера (старт с простого среднего первых period).
+    Без падений RSI = 100.
+    """
+    x = _as_array(closes)
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] < period + 1:
+        return out
+
+    deltas = np.diff(x, axis=-1)
+    gains = np.maximum(deltas, 0.0)
+    losses = np.maximum(-deltas, 0.0)
+
+    if wilder:
+        alpha = 1.0 / period
+        seed_gain = gains[..., :period].mean(axis=-1)
+        seed_loss = losses[..., :period].mean(axis=-1)
+        avg_gain = np.concatenate((seed_gain[..., None], smooth(gains[..., period:], alpha, seed_gain)), axis=-1)
+        avg_loss = np.concatenate((seed_loss[..., None], smooth(losses[..., period:], alpha, seed_loss)), axis=-1)
+    else:
+        avg_gain = rolling_mean(gains, period)[..., period - 1:]
+        avg_loss = rolling_mean(losses, period)[..., period - 1:]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    out[..., period:] = np.where(avg_loss == 0, 100.0, rsi)
+    return out
+
+
+def true_range(highs, lows, closes) -> np.ndarray:
+    """True Range начиная со второй свечи (длина n-1)"""
+    h, l, c = _as_array(highs)[..., 1:], _as_array(lows)[..., 1:], _as_array(closes)
+    prev_close = c[..., :-1]
+    return np.maximum.reduce([h - l, np.abs(h - prev_close), np.abs(l - prev_close)])
+
+
+def atr_series(highs, lows, closes, period: int = 14) -> np.ndarray:
+    """ATR - простое среднее True Range за period (как atr)"""
+    c = _as_array(closes)
+    out = np.full(c.shape, np.nan)
+    if c.shape[-1] < period + 1:
+        return out
+    out[..., 1:] = rolling_mean(true_range(highs, lows, c), period)
+    return out
+
+
+def bollinger_series(closes, period: int = BB_PERIOD,
+                     std_dev: float = BB_STD) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Bollinger: верхняя, средняя, нижняя"""
+    x = _as_array(closes)
+    if x.shape[-1] == 0:
+        return x.copy(), x.copy(), x.copy()
+    # Сдвиг к среднему - сумма квадратов без потери точности на больших ценах
+    center = x.mean(axis=-1, keepdims=True)
+    shifted = x - center
+    middle = rolling_mean(shifted, period)
+    variance = np.maximum(rolling_mean(shifted * shifted, period) - middle * middle, 0.0)
+    std = np.sqrt(variance)
+    middle = middle + center
+    return middle + std * std_dev, middle, middle - std * std_dev
+
+
+# ==================== ПОСЛЕДНЕЕ ЗНАЧЕНИЕ ====================
+def _last(series: np.ndarray) -> Optional[float]:
+    if len(series) == 0 or np.isnan(series[-1]):
+        return None
+    return float(series[-1])
+
+
+def last_ema(values, period: int) -> Optional[float]:
+    if len(values) < period:
+        return None
+    return _last(ema_series(values, period))
+
+
+def last_sma(values, period: int) -> Optional[float]:
+    return _last(sma_series(values, period))
+
+
+def last_macd(closes, fast: int = MACD_FAST, slow: int = MACD_SLOW,
+              signal: int = MACD_SIGNAL) -> Optional[Tuple[float, float, float]]:
+    if len(closes) < slow + signal:
+        return None
+    line, signal_line, histogram = macd_series(closes, fast, slow, signal)
+    return float(line[-1]), float(signal_line[-1]), float(histogram[-1])
+
+
+def last_rsi(closes, period: int = RSI_PERIOD, wilder: bool = False) -> Optional[float]:
+    return _last(rsi_series(closes, period, wilder))
+
+
+def last_atr(highs, lows, closes, period: int = 14) -> Optional[float]:
+    return _last(atr_series(highs, lows, closes, period))
+
+
+def last_bollinger(closes, period: int = BB_PERIOD,
+                   std_dev: float = BB_STD) -> Optional[Tuple[float, float, float]]:
+    if len(closes) < period:
+        return None
+    upper, middle, lower = bollinger_series(_as_array(closes)[-period:], period, std_dev)
+    return float(upper[-1]), float(middle[-1]), float(lower[-1])
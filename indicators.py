@@ -6,37 +6,172 @@ indicators.py - Профессиональная логика анализа (И
 3. Улучшен расчёт ATR и TP/SL
 4. FALLBACK: Binance → Bybit → OKX при блокировке
 """
+import json
 import time
+import asyncio
 import logging
-from typing import Optional, Dict, List, Tuple
-from collections import defaultdict
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, Optional, Dict, List, Tuple
 import httpx
+import numpy as np
+
+try:
+    import orjson  # Быстрый JSON для больших ответов с klines (необязателен)
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 from config import *
+from http_clients import HTTP_CLIENTS
+from single_flight import SingleFlight
+from rate_limiter import RATE_LIMITS, PRIORITY_LIVE, PRIORITY_BULK
+from source_health import SOURCE_HEALTH, ExchangeError, is_rate_limited, error_status
+from streaming_indicators import SeriesIndicators
+from extrema import local_minima, local_maxima
+from indicator_engine import last_ema, last_sma, last_macd, last_rsi, last_atr, last_bollinger
+from candle_buffer import (
+    CandleBuffer, CandleView, OHLCV, Upsert, EMPTY_VIEW, rows_to_columns, klines_to_columns, find_gaps
+)
 
 logger = logging.getLogger(__name__)
 
-# Текущий активный источник данных
+# Источник, ответивший последним (для логов); порядок запросов - по SOURCE_HEALTH
 ACTIVE_SOURCE = "binance"  # binance, bybit, okx
 
 class CandleStorage:
-    def __init__(self):
-        self.candles: Dict[str, Dict[str, list]] = defaultdict(lambda: defaultdict(list))
-    
-    def add_candle(self, pair: str, tf: str, candle: dict):
-        self.candles[pair][tf].append(candle)
-        if len(self.candles[pair][tf]) > 500:
-            self.candles[pair][tf] = self.candles[pair][tf][-500:]
-    
-    def get_candles(self, pair: str, tf: str) -> List[dict]:
-        return self.candles[pair].get(tf, [])
+    def __init__(self, capacity: int = CANDLE_BUFFER_CAPACITY):
+        self.capacity = capacity
+        self.buffers: Dict[Tuple[str, str], CandleBuffer] = {}
+        self.store = None  # CandleStore (запись на диск пачками), см. attach_store
+        self.integrity: Dict[Tuple[str, str], Counter] = {}  # дубликаты/разрывы по сериям
+        self.indicators: Dict[Tuple[str, str], SeriesIndicators] = {}  # см. get_indicators
+        self.versions: Dict[Tuple[str, str], int] = {}  # растёт при каждом изменении серии
+    
+    def attach_store(self, store):
+        """Подключить постоянное хранилище: дальше каждая изменённая свеча уходит и туда"""
+        self.store = store
+    
+    def _buffer(self, pair: str, tf: str) -> CandleBuffer:
+        buffer = self.buffers.get((pair, tf))
+        if buffer is None:
+            buffer = self.buffers[(pair, tf)] = CandleBuffer(self.capacity)
+        return buffer
+    
+    def _touch(self, pair: str, tf: str):
+        self.versions[(pair, tf)] = self.versions.get((pair, tf), 0) + 1
+    
+    def version(self, pair: str, tf: str) -> int:
+        """
+        Версия серии: та же - свечи не менялись
+        
+        Анализ пары с теми же версиями входов можно не повторять (analysis_pool.py).
+        """
+        return self.versions.get((pair, tf), 0)
+    
+    def load_from_store(self, limit: int = CANDLE_BUFFER_CAPACITY) -> int:
+        """Поднять историю из постоянного хранилища (без записи обратно)"""
+        if self.store is None:
+            return 0
+        total = 0
+        for pair, tf in self.store.series():
+            columns = self.store.load_columns(pair, tf, limit)
+            buffer = self._buffer(pair, tf)
+            buffer.clear()
+            buffer.upsert(columns)
+            self.indicators.pop((pair, tf), None)
+            self._touch(pair, tf)
+            total += columns.shape[1]
+        return total
+    
+    def add_candle(self, pair: str, tf: str, candle: dict) -> Upsert:
+        """Добавить свечу; свеча с уже известным 't' заменяет прежнюю"""
+        return self.upsert_columns(pair, tf, rows_to_columns([candle]))
+    
+    def set_candles(self, pair: str, tf: str, candles: List[dict]):
+        """Заменить серию целиком (полная перезагрузка истории)"""
+        self.set_columns(pair, tf, rows_to_columns(candles))
+    
+    def set_columns(self, pair: str, tf: str, columns: np.ndarray):
+        """Заменить серию целиком массивом (6, n)"""
+        self._buffer(pair, tf).clear()
+        self.indicators.pop((pair, tf), None)
+        self._touch(pair, tf)
+        self.upsert_columns(pair, tf, columns)
+    
+    def merge_candles(self, pair: str, tf: str, candles: List[dict]) -> int:
+        """
+        Слить пачку свечей в серию
+        
+        Новее последней - добавляются, с известным 't' - заменяют прежние,
+        опоздавшие встают на своё место. Возвращает число изменённых свечей.
+        """
+        return self.merge_columns(pair, tf, rows_to_columns(candles))
+    
+    def merge_columns(self, pair: str, tf: str, columns: np.ndarray) -> int:
+        """merge_candles для массива (6, n)"""
+        return self.upsert_columns(pair, tf, columns).changed
+    
+    def upsert_columns(self, pair: str, tf: str, columns: np.ndarray) -> Upsert:
+        """
+        Одна свеча на время открытия: добавить, заменить или вставить
+        
+        Дубликаты и разрывы считаются в self.integrity[(pair, tf)].
+        """
+        result, changed = self._buffer(pair, tf).upsert(columns, TIMEFRAME_SECONDS.get(tf, 0))
+        
+        if result.duplicates or result.gaps or result.dropped:
+            counters = self.integrity.setdefault((pair, tf), Counter())
+            counters.update(duplicates=result.duplicates, gaps=result.gaps, dropped=result.dropped)
+            if result.gaps:
+                logger.warning(f"🕳 {pair} {tf}: {result.gaps} new gap(s) in candles")
+        
+        if result.changed:
+            self._touch(pair, tf)
+        
+        state = self.indicators.get((pair, tf))
+        if state is not None and result.changed:
+            # Хвост - O(1) на свечу; вставка в середину - пересчёт по серии
+            if result.rebuilt or not all(state.push(row) for row in changed.T):
+                state.rebuild(self._buffer(pair, tf).arrays())
+        
+        if changed.shape[1] and self.store is not None:
+            self.store.save_columns(pair, tf, changed)
+        return result
+    
+    def update_candle(self, pair: str, tf: str, candle: dict):
+        """Обновить формирующуюся свечу (та же 't') или добавить новую"""
+        self.merge_candles(pair, tf, [candle])
+    
+    def get_candles(self, pair: str, tf: str) -> CandleView:
+        """Свечи серии в старом формате (последовательность словарей)"""
+        buffer = self.buffers.get((pair, tf))
+        return buffer.view() if buffer is not None else EMPTY_VIEW
+    
+    def get_arrays(self, pair: str, tf: str) -> OHLCV:
+        """Колонки t/o/h/l/c/v серии без копирования"""
+        buffer = self.buffers.get((pair, tf))
+        return buffer.arrays() if buffer is not None else EMPTY_VIEW.arrays
+    
+    def get_indicators(self, pair: str, tf: str) -> SeriesIndicators:
+        """
+        Текущие индикаторы серии (EMA, RSI, ATR, Bollinger)
+        
+        Первый вызов считает их по истории, дальше они обновляются
+        при каждой записи в серию - O(1) на свечу.
+        """
+        state = self.indicators.get((pair, tf))
+        if state is None:
+            state = self.indicators[(pair, tf)] = SeriesIndicators()
+            state.rebuild(self.get_arrays(pair, tf))
+        return state
 
 CANDLES = CandleStorage()
 
 class PriceCache:
-    def __init__(self, ttl: int = 30):
+    def __init__(self, ttl: int = PRICE_CACHE_TTL, stale_ttl: int = PRICE_STALE_TTL):
         self.cache = {}
         self.ttl = ttl
+        self.stale_ttl = stale_ttl  # stale-while-revalidate: сколько ещё можно отдавать старую цену
     
     def get(self, pair: str):
         if pair in self.cache:
@@ -45,15 +180,27 @@ class PriceCache:
                 return price, volume
         return None
     
+    def get_stale(self, pair: str):
+        """Устаревшая (но не старше stale_ttl) цена - пока идёт обновление"""
+        if pair in self.cache:
+            price, volume, cached_at = self.cache[pair]
+            if time.time() - cached_at < self.stale_ttl:
+                return price, volume
+        return None
+    
     def set(self, pair: str, price: float, volume: float):
         self.cache[pair] = (price, volume, time.time())
     
     def clear_old(self):
         now = time.time()
-        self.cache = {k: v for k, v in self.cache.items() if now - v[2] < self.ttl}
+        self.cache = {k: v for k, v in self.cache.items() if now - v[2] < self.stale_ttl}
 
 PRICE_CACHE = PriceCache()
 
+# Один запрос в полёте на пару / серию свечей (см. single_flight.py)
+PRICE_FLIGHT = SingleFlight("price")
+CANDLE_FLIGHT = SingleFlight("candles")
+
 # ==================== КОНВЕРТАЦИЯ СИМВОЛОВ ====================
 def to_okx_symbol(pair: str) -> str:
     """BTCUSDT -> BTC-USDT"""
@@ -70,51 +217,45 @@ def from_okx_symbol(symbol: str) -> str:
 async def fetch_price_binance(client: httpx.AsyncClient, pair: str) -> Optional[Tuple[float, float]]:
     """Получить цену с Binance"""
     try:
-        url = f"https://api.binance.com/api/v3/ticker/24hr?symbol={pair.upper()}"
-        resp = await client.get(url, timeout=5.0)
+        url = f"{BINANCE_API_URL}/api/v3/ticker/24hr?symbol={pair.upper()}"
+        resp = await client.get(url, timeout=TICKER_TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
         price = float(data["lastPrice"])
         volume = float(data["volume"])
         return price, volume
     except Exception as e:
-        if "418" in str(e):
-            logger.warning(f"Binance blocked (418), switching to fallback")
+        if is_rate_limited(e):
+            logger.warning(f"Binance blocked (HTTP {error_status(e)}), switching to fallback")
         raise
 
-async def fetch_candles_binance_internal(client: httpx.AsyncClient, pair: str, tf: str, limit: int = 100) -> List[dict]:
-    """Получение свечей с Binance"""
+async def fetch_candles_binance_internal(client: httpx.AsyncClient, pair: str, tf: str, limit: int = 100,
+                                         start: float = None, end: float = None) -> np.ndarray:
+    """Получение свечей с Binance - массив (6, n): t, o, h, l, c, v
+    
+    start/end - диапазон времени открытия в секундах (для дозагрузки дыр)
+    """
     tf_map = {"1h": "1h", "4h": "4h", "1d": "1d"}
     interval = tf_map.get(tf, "1h")
     
-    url = f"https://api.binance.com/api/v3/klines"
+    url = f"{BINANCE_API_URL}/api/v3/klines"
     params = {"symbol": pair, "interval": interval, "limit": limit}
+    if start is not None:
+        params["startTime"] = int(start * 1000)
+    if end is not None:
+        params["endTime"] = int(end * 1000)
     
-    response = await client.get(url, params=params, timeout=10.0)
+    response = await client.get(url, params=params)
     response.raise_for_status()
     
-    klines = response.json()
-    candles = []
-    
-    for kline in klines:
-        candle = {
-            't': kline[0] / 1000,
-            'o': float(kline[1]),
-            'h': float(kline[2]),
-            'l': float(kline[3]),
-            'c': float(kline[4]),
-            'v': float(kline[5])
-        }
-        candles.append(candle)
-    
-    return candles
+    return klines_to_columns(json_loads(response.content))
 
 # ==================== BYBIT API ====================
 async def fetch_price_bybit(client: httpx.AsyncClient, pair: str) -> Optional[Tuple[float, float]]:
     """Получить цену с Bybit"""
     try:
-        url = f"https://api.bybit.com/v5/market/tickers?category=spot&symbol={pair.upper()}"
-        resp = await client.get(url, timeout=5.0)
+        url = f"{BYBIT_API_URL}/v5/market/tickers?category=spot&symbol={pair.upper()}"
+        resp = await client.get(url, timeout=TICKER_TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
         
@@ -128,46 +269,37 @@ async def fetch_price_bybit(client: httpx.AsyncClient, pair: str) -> Optional[Tu
         logger.error(f"Bybit error {pair}: {e}")
         raise
 
-async def fetch_candles_bybit(client: httpx.AsyncClient, pair: str, tf: str, limit: int = 100) -> List[dict]:
-    """Получение свечей с Bybit"""
+async def fetch_candles_bybit(client: httpx.AsyncClient, pair: str, tf: str, limit: int = 100,
+                              start: float = None, end: float = None) -> np.ndarray:
+    """Получение свечей с Bybit - массив (6, n)"""
     # Bybit intervals: 1, 3, 5, 15, 30, 60, 120, 240, 360, 720, D, M, W
     tf_map = {"1h": "60", "4h": "240", "1d": "D"}
     interval = tf_map.get(tf, "60")
     
-    url = f"https://api.bybit.com/v5/market/kline"
+    url = f"{BYBIT_API_URL}/v5/market/kline"
     params = {"category": "spot", "symbol": pair.upper(), "interval": interval, "limit": limit}
+    if start is not None:
+        params["start"] = int(start * 1000)
+    if end is not None:
+        params["end"] = int(end * 1000)
     
-    response = await client.get(url, params=params, timeout=10.0)
+    response = await client.get(url, params=params)
     response.raise_for_status()
     
-    data = response.json()
+    data = json_loads(response.content)
     if data.get("retCode") != 0:
-        raise Exception(f"Bybit API error: {data.get('retMsg')}")
-    
-    klines = data.get("result", {}).get("list", [])
-    candles = []
+        raise ExchangeError(f"Bybit API error: {data.get('retMsg')}")
     
     # Bybit возвращает в обратном порядке (новые первые)
-    for kline in reversed(klines):
-        candle = {
-            't': int(kline[0]) / 1000,
-            'o': float(kline[1]),
-            'h': float(kline[2]),
-            'l': float(kline[3]),
-            'c': float(kline[4]),
-            'v': float(kline[5])
-        }
-        candles.append(candle)
-    
-    return candles
+    return klines_to_columns(data.get("result", {}).get("list", []), newest_first=True)
 
 # ==================== OKX API ====================
 async def fetch_price_okx(client: httpx.AsyncClient, pair: str) -> Optional[Tuple[float, float]]:
     """Получить цену с OKX"""
     try:
         okx_symbol = to_okx_symbol(pair)
-        url = f"https://www.okx.com/api/v5/market/ticker?instId={okx_symbol}"
-        resp = await client.get(url, timeout=5.0)
+        url = f"{OKX_API_URL}/api/v5/market/ticker?instId={okx_symbol}"
+        resp = await client.get(url, timeout=TICKER_TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
         
@@ -181,63 +313,180 @@ async def fetch_price_okx(client: httpx.AsyncClient, pair: str) -> Optional[Tupl
         logger.error(f"OKX error {pair}: {e}")
         raise
 
-async def fetch_candles_okx(client: httpx.AsyncClient, pair: str, tf: str, limit: int = 100) -> List[dict]:
-    """Получение свечей с OKX"""
+async def fetch_candles_okx(client: httpx.AsyncClient, pair: str, tf: str, limit: int = 100,
+                            start: float = None, end: float = None) -> np.ndarray:
+    """Получение свечей с OKX - массив (6, n)"""
     # OKX intervals: 1m, 3m, 5m, 15m, 30m, 1H, 2H, 4H, 6H, 12H, 1D, 1W, 1M
     tf_map = {"1h": "1H", "4h": "4H", "1d": "1D"}
     interval = tf_map.get(tf, "1H")
     
     okx_symbol = to_okx_symbol(pair)
-    url = f"https://www.okx.com/api/v5/market/candles"
+    url = f"{OKX_API_URL}/api/v5/market/candles"
     params = {"instId": okx_symbol, "bar": interval, "limit": str(limit)}
+    # OKX: after - свечи старше ts, before - новее ts (границы не включаются)
+    if end is not None:
+        params["after"] = str(int(end * 1000) + 1)
+    if start is not None:
+        params["before"] = str(int(start * 1000) - 1)
     
-    response = await client.get(url, params=params, timeout=10.0)
+    response = await client.get(url, params=params)
     response.raise_for_status()
     
-    data = response.json()
+    data = json_loads(response.content)
     if data.get("code") != "0":
-        raise Exception(f"OKX API error: {data.get('msg')}")
-    
-    klines = data.get("data", [])
-    candles = []
+        raise ExchangeError(f"OKX API error: {data.get('msg')}")
     
     # OKX возвращает в обратном порядке (новые первые)
-    for kline in reversed(klines):
-        candle = {
-            't': int(kline[0]) / 1000,
-            'o': float(kline[1]),
-            'h': float(kline[2]),
-            'l': float(kline[3]),
-            'c': float(kline[4]),
-            'v': float(kline[5])
-        }
-        candles.append(candle)
-    
-    return candles
+    return klines_to_columns(data.get("data", []), newest_first=True)
+
+# ==================== ПАКЕТНЫЕ ТИКЕРЫ ====================
+# Один запрос на биржу вместо запроса на каждую пару
+BINANCE_TICKER_BATCH = 100  # Символов в одном запросе ticker/24hr
+
+def binance_tickers_weight(count: int) -> int:
+    """Вес ticker/24hr?symbols=[...] по числу символов (1-20, 21-100, больше - как весь список)"""
+    weights = REQUEST_WEIGHT["binance"]
+    if count <= 20:
+        return weights["ticker"]
+    return weights["tickers"] if count <= 100 else weights["tickers_all"]
+
+async def fetch_prices_binance(client: httpx.AsyncClient, pairs: List[str]) -> Dict[str, Tuple[float, float]]:
+    """
+    Получить цены пачкой с Binance (ticker/24hr?symbols=[...])
+    
+    Вес каждого запроса (пачки и запасного полного списка) списывается
+    в RATE_LIMITS до отправки.
+    """
+    url = f"{BINANCE_API_URL}/api/v3/ticker/24hr"
+    governor = RATE_LIMITS["binance"]
+    # Сортируем: одинаковый набор пар - одинаковый запрос (запись/воспроизведение)
+    wanted = sorted(p.upper() for p in pairs)
+    result = {}
+    
+    for i in range(0, len(wanted), BINANCE_TICKER_BATCH):
+        chunk = wanted[i:i + BINANCE_TICKER_BATCH]
+        params = {"symbols": json.dumps(chunk, separators=(",", ":"))}
+        await governor.acquire(binance_tickers_weight(len(chunk)))
+        resp = await client.get(url, params=params, timeout=TICKER_TIMEOUT)
+        
+        full_list = resp.status_code == 400
+        if full_list:
+            # Один неизвестный символ валит весь пакет - полный список тикеров
+            # запрашивается один раз: он покрывает и эту пачку, и оставшиеся
+            logger.warning(f"Binance rejected symbols batch ({resp.text[:100]}), using full ticker list")
+            chunk = wanted[i:]
+            await governor.acquire(REQUEST_WEIGHT["binance"]["tickers_all"])
+            resp = await client.get(url, timeout=TICKER_TIMEOUT)
+        
+        resp.raise_for_status()
+        chunk_set = set(chunk)
+        for ticker in resp.json():
+            symbol = ticker.get("symbol")
+            if symbol in chunk_set:
+                result[symbol] = (float(ticker["lastPrice"]), float(ticker["volume"]))
+        if full_list:
+            break
+    
+    return result
+
+async def fetch_prices_bybit(client: httpx.AsyncClient, pairs: List[str]) -> Dict[str, Tuple[float, float]]:
+    """Получить цены пачкой с Bybit (все спот-тикеры одним запросом)"""
+    url = f"{BYBIT_API_URL}/v5/market/tickers"
+    await RATE_LIMITS["bybit"].acquire(REQUEST_WEIGHT["bybit"]["tickers"])
+    resp = await client.get(url, params={"category": "spot"}, timeout=TICKER_TIMEOUT)
+    resp.raise_for_status()
+    
+    data = resp.json()
+    if data.get("retCode") != 0:
+        raise ExchangeError(f"Bybit API error: {data.get('retMsg')}")
+    
+    wanted = {p.upper() for p in pairs}
+    result = {}
+    for ticker in data.get("result", {}).get("list", []):
+        symbol = ticker.get("symbol")
+        if symbol in wanted:
+            result[symbol] = (float(ticker["lastPrice"]), float(ticker.get("volume24h", 0)))
+    
+    return result
+
+async def fetch_prices_okx(client: httpx.AsyncClient, pairs: List[str]) -> Dict[str, Tuple[float, float]]:
+    """Получить цены пачкой с OKX (все спот-тикеры одним запросом)"""
+    url = f"{OKX_API_URL}/api/v5/market/tickers"
+    await RATE_LIMITS["okx"].acquire(REQUEST_WEIGHT["okx"]["tickers"])
+    resp = await client.get(url, params={"instType": "SPOT"}, timeout=TICKER_TIMEOUT)
+    resp.raise_for_status()
+    
+    data = resp.json()
+    if data.get("code") != "0":
+        raise ExchangeError(f"OKX API error: {data.get('msg')}")
+    
+    wanted = {p.upper() for p in pairs}
+    result = {}
+    for ticker in data.get("data", []):
+        symbol = from_okx_symbol(ticker.get("instId", ""))
+        if symbol in wanted:
+            result[symbol] = (float(ticker["last"]), float(ticker.get("vol24h", 0)))
+    
+    return result
 
 # ==================== УНИВЕРСАЛЬНЫЕ ФУНКЦИИ С FALLBACK ====================
-async def fetch_price(client: httpx.AsyncClient, pair: str) -> Optional[Tuple[float, float]]:
-    """Получить цену с автоматическим fallback"""
-    global ACTIVE_SOURCE
+def _by_health(sources: Dict[str, Callable]) -> List[Tuple[str, Callable]]:
+    """Рабочие источники в порядке здоровья (SOURCE_HEALTH.ranked)"""
+    return [(name, sources[name]) for name in SOURCE_HEALTH.ranked()]
+
+PROBE_URLS = {
+    "binance": f"{BINANCE_API_URL}/api/v3/ping",
+    "bybit": f"{BYBIT_API_URL}/v5/market/time",
+    "okx": f"{OKX_API_URL}/api/v5/public/time",
+}
+
+async def probe_source(source_name: str):
+    """Лёгкий запрос к бирже для проверки отключённого источника"""
+    await RATE_LIMITS[source_name].acquire(REQUEST_WEIGHT[source_name]["ping"])
+    client = HTTP_CLIENTS.get(source_name)
+    resp = await client.get(PROBE_URLS[source_name], timeout=TICKER_TIMEOUT)
+    resp.raise_for_status()
+
+async def fetch_price(pair: str, client: httpx.AsyncClient = None) -> Optional[Tuple[float, float]]:
+    """Получить цену с автоматическим fallback
+    
+    Свежая цена - из PRICE_CACHE. Устаревшая (до PRICE_STALE_TTL) отдаётся
+    сразу, а обновление идёт в фоне; одновременные запросы одной пары
+    склеиваются в один (PRICE_FLIGHT).
+    
+    client - только для тестов; по умолчанию общий клиент каждой биржи (HTTP_CLIENTS)
+    """
+    pair = pair.upper()
     
     # Проверяем кэш
     cached = PRICE_CACHE.get(pair)
     if cached:
         return cached
     
-    sources = [
-        ("binance", fetch_price_binance),
-        ("bybit", fetch_price_bybit),
-        ("okx", fetch_price_okx),
-    ]
+    stale = PRICE_CACHE.get_stale(pair)
+    if stale:
+        PRICE_FLIGHT.refresh(pair, lambda: _fetch_price_upstream(pair, client))
+        return stale
     
-    # Начинаем с активного источника
-    if ACTIVE_SOURCE != "binance":
-        sources = sorted(sources, key=lambda x: 0 if x[0] == ACTIVE_SOURCE else 1)
+    return await PRICE_FLIGHT.do(pair, lambda: _fetch_price_upstream(pair, client))
+
+async def _fetch_price_upstream(pair: str, client: httpx.AsyncClient = None) -> Optional[Tuple[float, float]]:
+    """Запрос цены на биржи (без кэша)"""
+    global ACTIVE_SOURCE
+    
+    sources = {
+        "binance": fetch_price_binance,
+        "bybit": fetch_price_bybit,
+        "okx": fetch_price_okx,
+    }
+    
+    # Самый здоровый источник первым, отключённые (circuit open) пропускаются
+    sources = _by_health(sources)
     
     for source_name, fetch_func in sources:
         try:
-            result = await fetch_func(client, pair)
+            await RATE_LIMITS[source_name].acquire(REQUEST_WEIGHT[source_name]["ticker"])
+            result = await SOURCE_HEALTH.call(source_name, fetch_func, client or HTTP_CLIENTS.get(source_name), pair)
             if result:
                 price, volume = result
                 PRICE_CACHE.set(pair, price, volume)
@@ -248,70 +497,344 @@ async def fetch_price(client: httpx.AsyncClient, pair: str) -> Optional[Tuple[fl
                 
                 return price, volume
         except Exception as e:
-            if "418" in str(e) or "teapot" in str(e).lower():
-                logger.warning(f"⚠️ {source_name.upper()} blocked, trying next...")
+            if is_rate_limited(e):
+                logger.warning(f"⚠️ {source_name.upper()} blocked (HTTP {error_status(e)}), trying next...")
             continue
     
     logger.error(f"❌ All sources failed for {pair}")
     return None
 
-async def fetch_candles_binance(pair: str, tf: str, limit: int = 100):
-    """Получение свечей с автоматическим fallback"""
+async def fetch_prices(pairs: List[str], client: httpx.AsyncClient = None) -> Dict[str, Tuple[float, float]]:
+    """
+    Получить цены для списка пар пачкой с автоматическим fallback
+    
+    Свежие цены берутся из PRICE_CACHE, остальные - одним запросом
+    на биржу. Пары, которых нет у источника, пробуем у следующего.
+    Все полученные цены кладутся в PRICE_CACHE.
+    
+    Устаревшие цены (до PRICE_STALE_TTL) отдаются сразу и обновляются
+    в фоне. Пары, которые уже запрашивает кто-то другой, не запрашиваются
+    повторно - ждём тот же ответ (PRICE_FLIGHT).
+    """
+    prices = {}
+    missing = []
+    stale = []
+    for pair in dict.fromkeys(p.upper() for p in pairs):
+        cached = PRICE_CACHE.get(pair)
+        if cached:
+            prices[pair] = cached
+            continue
+        
+        stale_value = PRICE_CACHE.get_stale(pair)
+        if stale_value:
+            prices[pair] = stale_value
+            stale.append(pair)
+        else:
+            missing.append(pair)
+    
+    if stale:
+        PRICE_FLIGHT.refresh_many(stale, lambda todo: _fetch_prices_upstream(todo, client))
+    
+    if missing:
+        fetched = await PRICE_FLIGHT.do_many(missing, lambda todo: _fetch_prices_upstream(todo, client))
+        prices.update({pair: value for pair, value in fetched.items() if value})
+    
+    return prices
+
+async def _fetch_prices_upstream(missing: List[str], client: httpx.AsyncClient = None) -> Dict[str, Tuple[float, float]]:
+    """Пакетный запрос цен на биржи (без кэша)"""
     global ACTIVE_SOURCE
     
-    sources = [
-        ("binance", fetch_candles_binance_internal),
-        ("bybit", fetch_candles_bybit),
-        ("okx", fetch_candles_okx),
-    ]
+    prices = {}
+    sources = {
+        "binance": fetch_prices_binance,
+        "bybit": fetch_prices_bybit,
+        "okx": fetch_prices_okx,
+    }
+    
+    # Самый здоровый источник первым, отключённые (circuit open) пропускаются
+    sources = _by_health(sources)
+    
+    served = False
+    for source_name, fetch_func in sources:
+        try:
+            # Вес списывается внутри fetch_prices_*: по запросу, их может быть несколько
+            batch = await SOURCE_HEALTH.call(source_name, fetch_func, client or HTTP_CLIENTS.get(source_name), missing)
+        except Exception as e:
+            if is_rate_limited(e):
+                logger.warning(f"⚠️ {source_name.upper()} blocked (HTTP {error_status(e)}), trying next...")
+            else:
+                logger.error(f"Error {source_name} tickers batch: {e}")
+            continue
+        
+        if not batch:
+            continue
+        
+        for pair, (price, volume) in batch.items():
+            PRICE_CACHE.set(pair, price, volume)
+            prices[pair] = (price, volume)
+        
+        # Переключаемся только если предыдущие источники не ответили вовсе,
+        # а не просто не знают часть пар
+        if source_name != ACTIVE_SOURCE and not served:
+            logger.info(f"✅ Switched to {source_name.upper()} for price data")
+            ACTIVE_SOURCE = source_name
+        served = True
+        
+        missing = [p for p in missing if p not in batch]
+        if not missing:
+            break
     
-    # Начинаем с активного источника
-    if ACTIVE_SOURCE != "binance":
-        sources = sorted(sources, key=lambda x: 0 if x[0] == ACTIVE_SOURCE else 1)
-    
-    async with httpx.AsyncClient() as client:
-        for source_name, fetch_func in sources:
-            try:
-                candles = await fetch_func(client, pair, tf, limit)
-                if candles:
-                    if source_name != ACTIVE_SOURCE:
-                        logger.info(f"✅ Switched to {source_name.upper()} for candle data")
-                        ACTIVE_SOURCE = source_name
-                    
-                    return candles
-            except Exception as e:
-                if "418" in str(e) or "teapot" in str(e).lower():
-                    logger.warning(f"⚠️ {source_name.upper()} blocked for {pair} {tf}, trying next...")
-                else:
-                    logger.error(f"Error {source_name} {pair} {tf}: {e}")
-                continue
+    if missing:
+        logger.error(f"❌ All sources failed for {', '.join(missing)}")
+    
+    return prices
+
+async def fetch_candles_binance(pair: str, tf: str, limit: int = 100, client: httpx.AsyncClient = None,
+                                priority: int = PRIORITY_LIVE, start: float = None,
+                                end: float = None) -> Optional[np.ndarray]:
+    """Получение свечей с автоматическим fallback - массив (6, n): t, o, h, l, c, v
+    
+    Одинаковые одновременные запросы (pair, tf, limit, start, end) одного
+    приоритета склеиваются в один; живой запрос не присоединяется к
+    фоновому, который стоит в очереди BULK.
+    priority - очередь в RATE_LIMITS (PRIORITY_BULK для загрузки истории)
+    start/end - диапазон времени открытия в секундах (дозагрузка дыр)
+    client - только для тестов; по умолчанию общий клиент каждой биржи (HTTP_CLIENTS)
+    """
+    return await CANDLE_FLIGHT.do(
+        (pair, tf, limit, start, end, priority), lambda: _fetch_candles_upstream(pair, tf, limit, client, priority, start, end)
+    )
+
+async def _fetch_candles_upstream(pair: str, tf: str, limit: int, client: httpx.AsyncClient = None,
+                                  priority: int = PRIORITY_LIVE, start: float = None, end: float = None):
+    """Запрос свечей на биржи"""
+    global ACTIVE_SOURCE
+    
+    sources = {
+        "binance": fetch_candles_binance_internal,
+        "bybit": fetch_candles_bybit,
+        "okx": fetch_candles_okx,
+    }
+    
+    # Самый здоровый источник первым, отключённые (circuit open) пропускаются
+    sources = _by_health(sources)
+    
+    for source_name, fetch_func in sources:
+        try:
+            await RATE_LIMITS[source_name].acquire(REQUEST_WEIGHT[source_name]["klines"], priority)
+            candles = await SOURCE_HEALTH.call(
+                source_name, fetch_func, client or HTTP_CLIENTS.get(source_name), pair, tf, limit, start, end
+            )
+            if candles.shape[1]:
+                if source_name != ACTIVE_SOURCE:
+                    logger.info(f"✅ Switched to {source_name.upper()} for candle data")
+                    ACTIVE_SOURCE = source_name
+                
+                return candles
+        except Exception as e:
+            if is_rate_limited(e):
+                logger.warning(f"⚠️ {source_name.upper()} blocked for {pair} {tf} (HTTP {error_status(e)}), trying next...")
+            else:
+                logger.error(f"Error {source_name} {pair} {tf}: {e}")
+            continue
     
     logger.error(f"❌ All sources failed for {pair} {tf}")
     return None
 
-# ==================== ИНДИКАТОРЫ ====================
-def calculate_rsi(closes: List[float], period: int = RSI_PERIOD) -> Optional[float]:
-    """Расчёт RSI"""
-    if len(closes) < period + 1:
-        return None
+async def load_history(pairs: List[str], timeframes_config: Dict[str, int],
+                       concurrency: int = BOOTSTRAP_CONCURRENCY) -> Dict[Tuple[str, str], int]:
+    """
+    Параллельная загрузка истории в CANDLES
     
-    gains, losses = [], []
-    for i in range(1, len(closes)):
-        change = closes[i] - closes[i-1]
-        gains.append(max(0, change))
-        losses.append(max(0, -change))
+    Все (pair, tf) качаются через общие клиенты бирж (HTTP_CLIENTS),
+    не больше concurrency запросов одновременно; вес запросов
+    ограничен RATE_LIMITS каждой биржи с низким приоритетом (живые
+    цены идут вперёд). Если серия уже поднята из candles.db,
+    запрашиваются только свечи новее последней.
     
-    if len(gains) < period:
-        return None
+    Returns:
+        {(pair, tf): количество загруженных/обновлённых свечей}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def load(pair: str, tf: str, limit: int) -> int:
+        existing = CANDLES.get_arrays(pair, tf)
+        full = len(existing.t) < limit
+        if not full:
+            # История уже есть (candles.db) - качаем только свечи новее последней
+            # (+ сама последняя: она могла быть ещё не закрыта)
+            bars_since = int((time.time() - existing.t[-1]) // TIMEFRAME_SECONDS[tf])
+            limit = min(limit, bars_since + 1)
+        
+        async with semaphore:
+            columns = await fetch_candles_binance(pair, tf, limit, priority=PRIORITY_BULK)
+        if columns is None:
+            return 0
+        
+        if full:
+            CANDLES.set_columns(pair, tf, columns)
+            return columns.shape[1]
+        return CANDLES.merge_columns(pair, tf, columns)
+    
+    jobs = [(pair, tf, limit) for pair in pairs for tf, limit in timeframes_config.items()]
+    results = await asyncio.gather(*(load(*job) for job in jobs), return_exceptions=True)
+    
+    loaded = {}
+    for (pair, tf, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.error(f"  ❌ {pair} {tf}: {result}")
+            result = 0
+        loaded[(pair, tf)] = result
+    
+    return loaded
+
+# Чего нет ни на одной бирже - повторно не запрашивается:
+# начало истории серии (листинг позже) и пропущенные диапазоны
+_HISTORY_START: Dict[Tuple[str, str], float] = {}
+# (pair, tf, start, end) -> до какого момента диапазон не запрашивать:
+# пустой на биржах - BACKFILL_EMPTY_TTL (бар мог не дойти до биржи вовремя),
+# не отданный ни одной биржей (сбой) - с backoff от BACKFILL_RETRY_BASE, чтобы
+# во время простоя те же дыры не запрашивались каждый BACKFILL_INTERVAL.
+# Не больше BACKFILL_SKIP_MAX записей: старые вытесняются
+_SKIPPED_RANGES: "OrderedDict[Tuple[str, str, float, float], float]" = OrderedDict()
+_RANGE_FAILURES: Dict[Tuple[str, str, float, float], int] = {}  # сбоев подряд по диапазону
+
+def _skipped(key: Tuple[str, str, float, float], now: float) -> bool:
+    until = _SKIPPED_RANGES.get(key)
+    if until is None:
+        return False
+    if now >= until:
+        del _SKIPPED_RANGES[key]
+        return False
+    return True
+
+def _skip_range(key: Tuple[str, str, float, float], until: float):
+    _SKIPPED_RANGES[key] = until
+    _SKIPPED_RANGES.move_to_end(key)
+    while len(_SKIPPED_RANGES) > BACKFILL_SKIP_MAX:
+        old, _ = _SKIPPED_RANGES.popitem(last=False)
+        _RANGE_FAILURES.pop(old, None)
+
+def _mark_empty(key: Tuple[str, str, float, float], now: float):
+    _RANGE_FAILURES.pop(key, None)
+    _skip_range(key, now + BACKFILL_EMPTY_TTL)
+
+def _mark_failed(key: Tuple[str, str, float, float], now: float):
+    failures = _RANGE_FAILURES[key] = _RANGE_FAILURES.get(key, 0) + 1
+    _skip_range(key, now + min(BACKFILL_RETRY_MAX, BACKFILL_RETRY_BASE * 2 ** (failures - 1)))
+
+def scan_gaps(pair: str, tf: str, depth: int, now: float = None) -> List[Tuple[float, float]]:
+    """
+    Дыры серии (pair, tf): [(первое, последнее время открытия), ...]
     
-    avg_gain = sum(gains[-period:]) / period
-    avg_loss = sum(losses[-period:]) / period
+    Серия должна покрывать depth последних баров вплоть до текущего;
+    пропуски внутри, недостающая история в начале и простой в конце.
+    """
+    step = TIMEFRAME_SECONDS[tf]
+    now = time.time() if now is None else now
+    current_open = now // step * step
+    first_open = max(current_open - (depth - 1) * step, _HISTORY_START.get((pair, tf), 0))
+    
+    t = CANDLES.get_arrays(pair, tf).t
+    gaps = find_gaps(t[t >= first_open], step, first_open, current_open)
+    return [gap for gap in gaps if not _skipped((pair, tf) + gap, now)]
+
+async def backfill_gaps(pairs: List[str], timeframes_config: Dict[str, int],
+                        concurrency: int = BOOTSTRAP_CONCURRENCY) -> Dict[Tuple[str, str], int]:
+    """
+    Дозагрузить только пропущенные бары (startTime/endTime), а не всю историю
     
-    if avg_loss == 0:
-        return 100.0
+    Запросы - с низким приоритетом (PRIORITY_BULK), дыра длиннее
+    BACKFILL_CHUNK баров режется на несколько запросов.
     
-    rs = avg_gain / avg_loss
-    return 100 - (100 / (1 + rs))
+    Returns:
+        {(pair, tf): количество вставленных свечей} - только по сериям с дырами
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    now = time.time()
+    
+    async def fill(pair: str, tf: str, start: float, end: float) -> int:
+        step = TIMEFRAME_SECONDS[tf]
+        received = filled = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + (BACKFILL_CHUNK - 1) * step)
+            limit = int((chunk_end - chunk_start) // step) + 1
+            async with semaphore:
+                columns = await fetch_candles_binance(
+                    pair, tf, limit, priority=PRIORITY_BULK, start=chunk_start, end=chunk_end
+                )
+            if columns is None:
+                # Биржи недоступны - остаток дыры повторим позже, с растущей паузой
+                _mark_failed((pair, tf, chunk_start, end), now)
+                return filled
+            columns = columns[:, (columns[0] >= chunk_start) & (columns[0] <= chunk_end)]
+            received += columns.shape[1]
+            filled += CANDLES.merge_columns(pair, tf, columns)
+            chunk_start = chunk_end + step
+        
+        _RANGE_FAILURES.pop((pair, tf, start, end), None)
+        if not received:
+            t = CANDLES.get_arrays(pair, tf).t
+            if len(t) == 0 or t[0] > end:
+                _HISTORY_START[(pair, tf)] = end + step
+            elif end + step <= now // step * step:
+                # Диапазон с формирующимся баром не отмечается: его ещё нет на бирже
+                _mark_empty((pair, tf, start, end), now)
+        return filled
+    
+    jobs = [
+        (pair, tf, start, end)
+        for pair in pairs
+        for tf, depth in timeframes_config.items()
+        for start, end in scan_gaps(pair, tf, depth, now)
+    ]
+    if not jobs:
+        return {}
+    logger.info(f"🩹 Backfilling {len(jobs)} candle gap(s)...")
+    results = await asyncio.gather(*(fill(*job) for job in jobs), return_exceptions=True)
+    
+    filled = {}
+    for (pair, tf, start, end), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.error(f"  ❌ Backfill {pair} {tf}: {result}")
+            result = 0
+        filled[(pair, tf)] = filled.get((pair, tf), 0) + result
+    return filled
+
+async def refresh_recent_bars(pairs: List[str], timeframes: Iterable[str], bars: int = 2,
+                              concurrency: int = BOOTSTRAP_CONCURRENCY) -> int:
+    """
+    Последние bars свечей каждой серии с биржи поверх баров из тиков
+    
+    В режиме polling бары строит BarAggregator только по цене: закрывшийся
+    и формирующийся бары берутся с биржи с настоящим объёмом.
+    Возвращает число изменённых свечей.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def refresh(pair: str, tf: str) -> int:
+        async with semaphore:
+            columns = await fetch_candles_binance(pair, tf, bars, priority=PRIORITY_BULK)
+        return CANDLES.merge_columns(pair, tf, columns) if columns is not None else 0
+    
+    jobs = [(pair, tf) for pair in pairs for tf in timeframes]
+    results = await asyncio.gather(*(refresh(*job) for job in jobs), return_exceptions=True)
+    
+    changed = 0
+    for (pair, tf), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.error(f"  ❌ Refresh {pair} {tf}: {result}")
+            continue
+        changed += result
+    return changed
+
+# ==================== ИНДИКАТОРЫ ====================
+# Расчёт - в indicator_engine.py (NumPy, O(n)); здесь прежний интерфейс
+def calculate_rsi(closes: List[float], period: int = RSI_PERIOD) -> Optional[float]:
+    """Расчёт RSI"""
+    return last_rsi(closes, period)
 
 
 # Алиас для совместимости с test_indicators.py
@@ -322,14 +845,7 @@ def rsi(closes: List[float], period: int = RSI_PERIOD) -> Optional[float]:
 
 def calculate_ema(values: List[float], period: int) -> Optional[float]:
     """Exponential Moving Average"""
-    if len(values) < period:
-        return None
-    
-    k = 2 / (period + 1)
-    ema_val = values[0]
-    for value in values[1:]:
-        ema_val = value * k + ema_val * (1 - k)
-    return ema_val
+    return last_ema(values, period)
 
 
 # Алиас для совместимости с test_indicators.py
@@ -340,42 +856,12 @@ def ema(values: List[float], period: int) -> Optional[float]:
 
 def sma(values: List[float], period: int) -> Optional[float]:
     """Simple Moving Average"""
-    if len(values) < period:
-        return None
-    return sum(values[-period:]) / period
+    return last_sma(values, period)
 
 
 def calculate_macd(closes: List[float]) -> Optional[Tuple[float, float, float]]:
     """MACD с сигнальной линией и гистограммой"""
-    if len(closes) < MACD_SLOW + MACD_SIGNAL:
-        return None
-    
-    ema_fast = calculate_ema(closes, MACD_FAST)
-    ema_slow = calculate_ema(closes, MACD_SLOW)
-    
-    if ema_fast is None or ema_slow is None:
-        return None
-    
-    macd_line = ema_fast - ema_slow
-    
-    # Рассчитываем MACD для всех точек чтобы получить сигнальную линию
-    macd_values = []
-    for i in range(MACD_SLOW, len(closes) + 1):
-        ema_f = calculate_ema(closes[:i], MACD_FAST)
-        ema_s = calculate_ema(closes[:i], MACD_SLOW)
-        if ema_f and ema_s:
-            macd_values.append(ema_f - ema_s)
-    
-    if len(macd_values) < MACD_SIGNAL:
-        signal_line = macd_line
-    else:
-        signal_line = calculate_ema(macd_values, MACD_SIGNAL)
-        if signal_line is None:
-            signal_line = macd_line
-    
-    histogram = macd_line - signal_line
-    
-    return macd_line, signal_line, histogram
+    return last_macd(closes, MACD_FAST, MACD_SLOW, MACD_SIGNAL)
 
 
 # Алиас для совместимости с test_indicators.py
@@ -386,20 +872,7 @@ def macd(closes: List[float]) -> Optional[Tuple[float, float, float]]:
 
 def bollinger_bands(closes: List[float], period: int = BB_PERIOD, std_dev: float = BB_STD) -> Optional[Tuple[float, float, float]]:
     """Bollinger Bands"""
-    if len(closes) < period:
-        return None
-    
-    recent = closes[-period:]
-    middle = sum(recent) / period
-    
-    # Стандартное отклонение
-    variance = sum((x - middle) ** 2 for x in recent) / period
-    std = variance ** 0.5
-    
-    upper = middle + (std * std_dev)
-    lower = middle - (std * std_dev)
-    
-    return upper, middle, lower
+    return last_bollinger(closes, period, std_dev)
 
 
 def volume_strength(candles: List[dict], period: int = 20) -> Optional[float]:
@@ -422,23 +895,15 @@ def atr(candles: List[dict], period: int = 14) -> Optional[float]:
     if len(candles) < period + 1:
         return None
     
-    true_ranges = []
-    for i in range(1, len(candles)):
-        high = candles[i].get('h', 0)
-        low = candles[i].get('l', 0)
-        prev_close = candles[i-1].get('c', 0)
-        
-        tr = max(
-            high - low,
-            abs(high - prev_close),
-            abs(low - prev_close)
-        )
-        true_ranges.append(tr)
-    
-    if len(true_ranges) < period:
-        return None
+    if isinstance(candles, CandleView):
+        arrays = candles.arrays
+        return last_atr(arrays.h, arrays.l, arrays.c, period)
     
-    return sum(true_ranges[-period:]) / period
+    # Хватает последних period + 1 свечей
+    recent = candles[-(period + 1):]
+    return last_atr(
+        [c.get('h', 0) for c in recent], [c.get('l', 0) for c in recent], [c.get('c', 0) for c in recent], period
+    )
 
 
 def calculate_tp_sl(entry: float, side: str, atr_value: float) -> Dict:
@@ -535,36 +1000,17 @@ def find_support_resistance_levels(candles: List[dict], window: int = 5) -> Tupl
     if len(candles) < window * 3:
         return [], []
     
-    highs = [c['h'] for c in candles]
-    lows = [c['l'] for c in candles]
-    closes = [c['c'] for c in candles]
-    
-    resistance_levels = []
-    support_levels = []
+    if isinstance(candles, CandleView):
+        arrays = candles.arrays
+        highs, lows, closes = arrays.h, arrays.l, arrays.c.tolist()
+    else:
+        highs = np.array([c['h'] for c in candles], dtype=np.float64)
+        lows = np.array([c['l'] for c in candles], dtype=np.float64)
+        closes = [c['c'] for c in candles]
     
-    # Ищем локальные экстремумы
-    for i in range(window, len(candles) - window):
-        current_high = highs[i]
-        current_low = lows[i]
-        
-        # Проверяем максимум
-        is_local_max = True
-        for j in range(1, window + 1):
-            if current_high < highs[i - j] or current_high < highs[i + j]:
-                is_local_max = False
-                break
-        
-        # Проверяем минимум
-        is_local_min = True
-        for j in range(1, window + 1):
-            if current_low > lows[i - j] or current_low > lows[i + j]:
-                is_local_min = False
-                break
-        
-        if is_local_max:
-            resistance_levels.append(current_high)
-        if is_local_min:
-            support_levels.append(current_low)
+    # Локальные экстремумы: не хуже window свечей с каждой стороны
+    resistance_levels = highs[local_maxima(highs, window)].tolist()
+    support_levels = lows[local_minima(lows, window)].tolist()
     
     # Фильтруем и группируем уровни
     resistance_levels = _filter_and_group_levels(resistance_levels, closes)
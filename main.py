@@ -8,7 +8,7 @@ from aiogram import Bot, Dispatcher
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiohttp import web
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, DEFAULT_PAIRS, MARKET_STREAM_ENABLED, CANDLES_DB_PATH
 from database import init_db, close_db
 from handlers import setup_handlers
 from crypto_payment import handle_crypto_webhook
@@ -16,6 +16,12 @@ from crypto_payment import handle_crypto_webhook
 from tasks import price_collector, signal_analyzer, subscription_manager, signal_tracker, no_signals_notifier
 from pnl_tracker import pnl_tracker
 from pnl_tasks import track_signals_pnl
+from market_stream import MARKET_STREAM
+from indicators import CANDLES, probe_source
+from source_health import SOURCE_HEALTH
+from candle_store import CandleStore
+from http_clients import HTTP_CLIENTS
+from analysis_pool import ANALYSIS_POOL
 
 # Настройка логирования
 logging.basicConfig(
@@ -64,6 +70,15 @@ async def on_startup(dp):
     await init_db()
     logger.info("✅ Database initialized")
     
+    # Свечи с диска: после рестарта с биржи качается только дельта
+    CANDLES.attach_store(CandleStore(CANDLES_DB_PATH))
+    CANDLES.store.prune()
+    loaded = CANDLES.load_from_store()
+    logger.info(f"✅ Candle store loaded: {loaded} candles from {CANDLES_DB_PATH}")
+    
+    # Общие HTTP-клиенты (пул соединений к биржам и Crypto Pay)
+    await HTTP_CLIENTS.start()
+    
     # Инициализация PnL tracker
     await pnl_tracker.init_db()
     logger.info("✅ PnL tracker initialized")
@@ -100,6 +115,10 @@ async def on_shutdown(dp):
     
     # Закрываем соединения
     await close_db()
+    if CANDLES.store is not None:
+        CANDLES.store.close()
+    await HTTP_CLIENTS.close()
+    ANALYSIS_POOL.close()
     await bot.close()
     await storage.close()
     
@@ -117,6 +136,20 @@ async def main():
         asyncio.create_task(price_collector(bot))
         logger.info("✅ Price collector started (System 2)")
         
+        # WebSocket-поток свечей и цен (опционально, fallback на REST)
+        if MARKET_STREAM_ENABLED:
+            MARKET_STREAM.set_pairs(DEFAULT_PAIRS)
+            asyncio.create_task(MARKET_STREAM.run())
+            logger.info("✅ Market stream started")
+        
+        # Сброс новых свечей в candles.db пачками, вне event loop
+        asyncio.create_task(CANDLES.store.run_flusher())
+        logger.info("✅ Candle store flusher started")
+        
+        # Фоновая проверка отключённых бирж (circuit breaker)
+        asyncio.create_task(SOURCE_HEALTH.run_probes(probe_source))
+        logger.info("✅ Source health probes started")
+        
         # Запуск анализатора сигналов (каждые 5 минут)
         asyncio.create_task(signal_analyzer(bot))
         logger.info("✅ Signal analyzer started (System 2)")
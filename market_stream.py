@@ -0,0 +1,351 @@
+"""
+market_stream.py - Потоковые рыночные данные через WebSocket
+
+- Подписка на kline (1h/4h/1d) и тикеры для всех отслеживаемых пар
+- Источники: Binance → Bybit → OKX (тот же порядок fallback, что и в fetch_price)
+- Обновления сразу пишутся в CANDLES и PRICE_CACHE
+- Реконнект с экспоненциальной задержкой
+- Пока поток не живой, price_collector работает через REST polling
+
+Включается переменной окружения MARKET_STREAM=1
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import List, Optional, Tuple
+
+import aiohttp
+
+from config import (
+    BINANCE_WS_URL, BYBIT_WS_URL, OKX_WS_PUBLIC_URL, OKX_WS_BUSINESS_URL,
+    STREAM_TIMEFRAMES, STREAM_STALE_SECONDS, STREAM_BACKOFF_BASE, STREAM_BACKOFF_MAX,
+    STREAM_TRACKING_INTERVAL
+)
+from indicators import CANDLES, PRICE_CACHE, to_okx_symbol, from_okx_symbol
+
+logger = logging.getLogger(__name__)
+
+
+def _chunks(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# ==================== ИСТОЧНИКИ ====================
+# Парсер источника возвращает список событий:
+#   ("ticker", pair, price, volume)
+#   ("kline", pair, tf, candle)
+
+class BinanceStream:
+    """Binance combined stream: <symbol>@kline_<interval> + <symbol>@miniTicker"""
+    name = "binance"
+    ping_payload = None  # Binance сам шлёт ping, aiohttp отвечает автоматически
+    intervals = {"1h": "1h", "4h": "4h", "1d": "1d"}
+
+    def __init__(self, url: str = None):
+        self.url = url or BINANCE_WS_URL
+        self._tf_by_interval = {v: k for k, v in self.intervals.items()}
+
+    def endpoints(self, pairs: List[str], timeframes: List[str]) -> List[Tuple[str, List[str]]]:
+        """[(url, [сообщения подписки])]"""
+        params = []
+        for pair in pairs:
+            symbol = pair.lower()
+            params.append(f"{symbol}@miniTicker")
+            for tf in timeframes:
+                params.append(f"{symbol}@kline_{self.intervals[tf]}")
+
+        messages = [
+            json.dumps({"method": "SUBSCRIBE", "params": chunk, "id": i + 1})
+            for i, chunk in enumerate(_chunks(params, 100))
+        ]
+        return [(self.url, messages)]
+
+    def parse(self, raw: str) -> List[tuple]:
+        msg = json.loads(raw)
+        data = msg.get("data", msg)
+        event = data.get("e") if isinstance(data, dict) else None
+
+        if event == "kline":
+            k = data["k"]
+            tf = self._tf_by_interval.get(k["i"])
+            if tf is None:
+                return []
+            candle = {
+                't': k["t"] / 1000,
+                'o': float(k["o"]),
+                'h': float(k["h"]),
+                'l': float(k["l"]),
+                'c': float(k["c"]),
+                'v': float(k["v"])
+            }
+            return [("kline", data["s"], tf, candle)]
+
+        if event == "24hrMiniTicker":
+            return [("ticker", data["s"], float(data["c"]), float(data["v"]))]
+
+        return []
+
+
+class BybitStream:
+    """Bybit v5 spot: tickers.<symbol> + kline.<interval>.<symbol>"""
+    name = "bybit"
+    ping_payload = json.dumps({"op": "ping"})
+    ping_interval = 20
+    intervals = {"1h": "60", "4h": "240", "1d": "D"}
+
+    def __init__(self, url: str = None):
+        self.url = url or BYBIT_WS_URL
+        self._tf_by_interval = {v: k for k, v in self.intervals.items()}
+
+    def endpoints(self, pairs: List[str], timeframes: List[str]) -> List[Tuple[str, List[str]]]:
+        args = []
+        for pair in pairs:
+            args.append(f"tickers.{pair}")
+            for tf in timeframes:
+                args.append(f"kline.{self.intervals[tf]}.{pair}")
+
+        # Spot: не больше 10 топиков в одном запросе
+        messages = [json.dumps({"op": "subscribe", "args": chunk}) for chunk in _chunks(args, 10)]
+        return [(self.url, messages)]
+
+    def parse(self, raw: str) -> List[tuple]:
+        msg = json.loads(raw)
+        topic = msg.get("topic", "")
+
+        if topic.startswith("tickers."):
+            d = msg["data"]
+            return [("ticker", d["symbol"], float(d["lastPrice"]), float(d.get("volume24h", 0)))]
+
+        if topic.startswith("kline."):
+            _, interval, symbol = topic.split(".", 2)
+            tf = self._tf_by_interval.get(interval)
+            if tf is None:
+                return []
+            events = []
+            for k in msg.get("data", []):
+                candle = {
+                    't': int(k["start"]) / 1000,
+                    'o': float(k["open"]),
+                    'h': float(k["high"]),
+                    'l': float(k["low"]),
+                    'c': float(k["close"]),
+                    'v': float(k["volume"])
+                }
+                events.append(("kline", symbol, tf, candle))
+            return events
+
+        return []
+
+
+class OKXStream:
+    """OKX v5: tickers (public) + candle<bar> (business) - два соединения"""
+    name = "okx"
+    ping_payload = "ping"
+    ping_interval = 25
+    intervals = {"1h": "1H", "4h": "4H", "1d": "1D"}
+
+    def __init__(self, public_url: str = None, business_url: str = None):
+        self.public_url = public_url or OKX_WS_PUBLIC_URL
+        self.business_url = business_url or OKX_WS_BUSINESS_URL
+        self._tf_by_channel = {f"candle{v}": k for k, v in self.intervals.items()}
+
+    def endpoints(self, pairs: List[str], timeframes: List[str]) -> List[Tuple[str, List[str]]]:
+        tickers = [{"channel": "tickers", "instId": to_okx_symbol(p)} for p in pairs]
+        candles = [
+            {"channel": f"candle{self.intervals[tf]}", "instId": to_okx_symbol(p)}
+            for p in pairs for tf in timeframes
+        ]
+
+        def subscribe(args):
+            return [json.dumps({"op": "subscribe", "args": chunk}) for chunk in _chunks(args, 20)]
+
+        return [(self.public_url, subscribe(tickers)), (self.business_url, subscribe(candles))]
+
+    def parse(self, raw: str) -> List[tuple]:
+        if raw == "pong":
+            return []
+
+        msg = json.loads(raw)
+        channel = msg.get("arg", {}).get("channel", "")
+        data = msg.get("data")
+        if not data:
+            return []
+
+        if channel == "tickers":
+            return [
+                ("ticker", from_okx_symbol(d["instId"]), float(d["last"]), float(d.get("vol24h", 0)))
+                for d in data
+            ]
+
+        tf = self._tf_by_channel.get(channel)
+        if tf is not None:
+            pair = from_okx_symbol(msg["arg"]["instId"])
+            events = []
+            for row in data:
+                candle = {
+                    't': int(row[0]) / 1000,
+                    'o': float(row[1]),
+                    'h': float(row[2]),
+                    'l': float(row[3]),
+                    'c': float(row[4]),
+                    'v': float(row[5])
+                }
+                events.append(("kline", pair, tf, candle))
+            return events
+
+        return []
+
+
+# ==================== ПОТОК ====================
+class MarketStream:
+    """
+    Менеджер WebSocket-потока с failover по источникам
+
+    Держит одно подключение (у OKX - два) к текущему источнику.
+    Соединение, проработавшее дольше STREAM_STALE_SECONDS, после
+    обрыва переподключается снова с Binance; быстрые отказы
+    переводят на следующий источник с растущей задержкой.
+    """
+
+    def __init__(self, sources: List = None, backoff_base: float = STREAM_BACKOFF_BASE,
+                 backoff_max: float = STREAM_BACKOFF_MAX):
+        self.sources = sources or [BinanceStream(), BybitStream(), OKXStream()]
+        self.timeframes = list(STREAM_TIMEFRAMES)
+        self.pairs: List[str] = []
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.active_source: Optional[str] = None
+        self.last_message_at = 0.0
+        self.reconnects = 0
+        self._reconnect: Optional[asyncio.Event] = None
+
+    def is_live(self) -> bool:
+        """Поток подключён и данные свежие"""
+        return (
+            self.active_source is not None and
+            time.time() - self.last_message_at < STREAM_STALE_SECONDS
+        )
+
+    def tracking_interval(self, default: float) -> float:
+        """Интервал трекеров: при живом потоке цены в кэше всегда свежие"""
+        return STREAM_TRACKING_INTERVAL if self.is_live() else default
+
+    def set_pairs(self, pairs: List[str]):
+        """Обновить список пар; при изменении - переподписка"""
+        new_pairs = sorted({p.upper() for p in pairs})
+        if new_pairs != self.pairs:
+            self.pairs = new_pairs
+            if self._reconnect is not None:
+                self._reconnect.set()
+
+    async def run(self):
+        """Основной цикл: подключение, чтение, реконнект"""
+        self._reconnect = asyncio.Event()
+        index = 0
+        attempt = 0
+
+        logger.info("📡 Market stream started")
+
+        while True:
+            if not self.pairs:
+                await asyncio.sleep(1)
+                continue
+
+            source = self.sources[index]
+            self._reconnect.clear()
+            started = time.time()
+
+            try:
+                await self._consume(source)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ {source.name.upper()} stream error: {e}")
+            finally:
+                self.active_source = None
+
+            if self._reconnect.is_set():
+                # Изменился список пар - сразу переподписываемся
+                continue
+
+            self.reconnects += 1
+            if time.time() - started > STREAM_STALE_SECONDS:
+                # Соединение успело поработать - начинаем снова с Binance
+                attempt = 0
+                index = 0
+            else:
+                attempt += 1
+                index = (index + 1) % len(self.sources)
+
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+            delay *= random.uniform(0.5, 1.0)
+            logger.info(f"🔄 Stream reconnect via {self.sources[index].name.upper()} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _consume(self, source):
+        """Подключиться к источнику и читать до обрыва"""
+        async with aiohttp.ClientSession() as session:
+            sockets = []
+            tasks = []
+            try:
+                for url, subscriptions in source.endpoints(self.pairs, self.timeframes):
+                    ws = await session.ws_connect(url, heartbeat=20, receive_timeout=STREAM_STALE_SECONDS)
+                    sockets.append(ws)
+                    for message in subscriptions:
+                        await ws.send_str(message)
+
+                logger.info(f"📡 {source.name.upper()} stream connected ({len(self.pairs)} pairs)")
+
+                tasks = [asyncio.create_task(self._read(source, ws)) for ws in sockets]
+                if source.ping_payload:
+                    tasks.append(asyncio.create_task(self._keepalive(source, sockets)))
+                tasks.append(asyncio.create_task(self._reconnect.wait()))
+
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception():
+                        raise task.exception()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                for ws in sockets:
+                    await ws.close()
+
+    async def _read(self, source, ws: aiohttp.ClientWebSocketResponse):
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                self._apply(source, source.parse(msg.data))
+            elif msg.type in (aiohttp.WSMsgType.ERROR, aiohttp.WSMsgType.CLOSED):
+                break
+        raise ConnectionError(f"{source.name} stream closed")
+
+    async def _keepalive(self, source, sockets: List[aiohttp.ClientWebSocketResponse]):
+        while True:
+            await asyncio.sleep(source.ping_interval)
+            for ws in sockets:
+                await ws.send_str(source.ping_payload)
+
+    def _apply(self, source, events: List[tuple]):
+        """Записать события в CANDLES и PRICE_CACHE"""
+        if not events:
+            return
+
+        for event in events:
+            if event[0] == "ticker":
+                _, pair, price, volume = event
+                PRICE_CACHE.set(pair, price, volume)
+            else:
+                _, pair, tf, candle = event
+                CANDLES.update_candle(pair, tf, candle)
+
+        self.last_message_at = time.time()
+        if self.active_source != source.name:
+            self.active_source = source.name
+            logger.info(f"✅ Market stream live via {source.name.upper()}")
+
+
+MARKET_STREAM = MarketStream()
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+mock_exchange.py - Локальная заглушка биржи для офлайн- и нагрузочных тестов
+
+WebSocket в формате Binance combined stream (/stream, /ws):
+- <symbol>@kline_1h / kline_4h / kline_1d и <symbol>@miniTicker
+- подписка через ?streams=... или сообщением SUBSCRIBE
+
+REST - те же эндпоинты, что использует indicators.py, на одном порту:
+- Binance: /api/v3/ticker/24hr, /api/v3/klines, /api/v3/ping
+- Bybit:   /v5/market/tickers, /v5/market/kline, /v5/market/time
+- OKX:     /api/v5/market/ticker(s), /api/v5/market/candles, /api/v5/public/time
+
+Цена - случайное блуждание (seed для воспроизводимости) или заданный
+ряд цен (set_price_path). Деградация каждой биржи настраивается
+(Conditions): задержка, доля 500, 418 и 429 с Retry-After, недоступность.
+Binance считает вес запросов и отдаёт X-MBX-USED-WEIGHT-1M.
+
+Запуск: python mock_exchange.py [port] [--latency 0.2] [--error-rate 0.05] ...
+Бот:    BINANCE_API_URL=http://127.0.0.1:<port> BYBIT_API_URL=http://127.0.0.1:<port> \
+        OKX_API_URL=http://127.0.0.1:<port> python main.py
+Поток:  MARKET_STREAM=1 BINANCE_WS_URL=ws://127.0.0.1:<port>/stream python main.py
+"""
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import logging
+from collections import Counter, deque
+from typing import Dict, List, Optional, Set
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_SECONDS = {"1h": 3600, "4h": 4 * 3600, "1d": 86400}
+BYBIT_INTERVALS = {"60": "1h", "240": "4h", "D": "1d"}
+OKX_BARS = {"1H": "1h", "4H": "4h", "1D": "1d"}
+
+# Вес запросов Binance (как у настоящего API)
+BINANCE_WEIGHTS = {"ticker": 2, "tickers": 40, "all_tickers": 80, "klines": 2, "ping": 1}
+
+
+class Conditions:
+    """Деградация одной биржи"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 ban_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: int = 30,
+                 down: bool = False):
+        self.latency = latency              # задержка ответа, сек
+        self.jitter = jitter                # + случайно до jitter сек
+        self.error_rate = error_rate        # доля ответов 500
+        self.ban_rate = ban_rate            # доля ответов 418
+        self.rate_limit_rate = rate_limit_rate  # доля ответов 429
+        self.retry_after = retry_after      # Retry-After для 418/429
+        self.down = down                    # 503 на всё
+
+
+class MockExchange:
+    """Заглушка биржи на aiohttp"""
+
+    def __init__(self, tick_interval: float = 1.0, seed: Optional[int] = None,
+                 start_prices: Optional[Dict[str, float]] = None, volatility: float = 0.001,
+                 binance_weight_limit: int = 6000, symbols: Optional[List[str]] = None):
+        self.tick_interval = tick_interval
+        self.volatility = volatility
+        self.rng = random.Random(seed)
+        self.prices: Dict[str, float] = dict(start_prices or {})
+        self.volumes: Dict[str, float] = {}
+        self.bars: Dict[tuple, dict] = {}
+        self.history: Dict[tuple, List[dict]] = {}  # REST klines: (pair, interval) -> бары
+        self.price_paths: Dict[str, deque] = {}
+        self.symbols: Set[str] = set(symbols or ())  # листинг для полных списков тикеров
+
+        self.conditions = {name: Conditions() for name in ("binance", "bybit", "okx")}
+        self.requests = Counter()  # (биржа, статус) -> количество
+        self.binance_weight_limit = binance_weight_limit
+        self._binance_weight = deque()  # (ts, weight) за последнюю минуту
+
+        self.connections = 0
+        self._sockets: Set[web.WebSocketResponse] = set()
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application(middlewares=[self._degrade])
+        self.app.router.add_get("/stream", self.binance_ws)
+        self.app.router.add_get("/ws", self.binance_ws)
+
+        self.app.router.add_get("/api/v3/ping", self.binance_ping)
+        self.app.router.add_get("/api/v3/ticker/24hr", self.binance_ticker)
+        self.app.router.add_get("/api/v3/klines", self.binance_klines)
+        self.app.router.add_get("/v5/market/time", self.bybit_time)
+        self.app.router.add_get("/v5/market/tickers", self.bybit_tickers)
+        self.app.router.add_get("/v5/market/kline", self.bybit_kline)
+        self.app.router.add_get("/api/v5/public/time", self.okx_time)
+        self.app.router.add_get("/api/v5/market/ticker", self.okx_ticker)
+        self.app.router.add_get("/api/v5/market/tickers", self.okx_tickers)
+        self.app.router.add_get("/api/v5/market/candles", self.okx_candles)
+
+    # ==================== ЦЕНЫ ====================
+    def tick(self, pair: str) -> float:
+        """Следующая цена пары (заданный ряд или случайное блуждание)"""
+        path = self.price_paths.get(pair)
+        if path:
+            price = path[0]
+            path.rotate(-1)
+        else:
+            price = self.prices.get(pair)
+            if price is None:
+                price = self.rng.uniform(1, 1000)
+            price *= 1 + self.rng.gauss(0, self.volatility)
+        self.prices[pair] = price
+        self.volumes[pair] = self.volumes.get(pair, 0.0) + self.rng.uniform(0, 10)
+        return price
+
+    def listed(self) -> List[str]:
+        """Пары полного списка тикеров: листинг + все, что уже спрашивали"""
+        return sorted(self.symbols.union(self.prices))
+
+    def set_price_path(self, pair: str, prices: List[float]):
+        """Воспроизводить цены пары по кругу вместо случайного блуждания"""
+        self.price_paths[pair] = deque(prices)
+
+    def bar(self, pair: str, interval: str, price: float, now: float) -> dict:
+        """Текущий бар таймфрейма с учётом новой цены"""
+        tf_sec = INTERVAL_SECONDS[interval]
+        open_ts = int(now // tf_sec * tf_sec)
+        key = (pair, interval)
+        bar = self.bars.get(key)
+
+        if bar is None or bar["t"] != open_ts:
+            bar = {"t": open_ts, "o": price, "h": price, "l": price, "c": price, "v": 0.0}
+            self.bars[key] = bar
+
+        bar["h"] = max(bar["h"], price)
+        bar["l"] = min(bar["l"], price)
+        bar["c"] = price
+        bar["v"] += self.rng.uniform(0, 1)
+        return bar
+
+    # ==================== BINANCE WEBSOCKET ====================
+    async def binance_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        streams = {s for s in request.query.get("streams", "").split("/") if s}
+        self.connections += 1
+        self._sockets.add(ws)
+        pump = asyncio.create_task(self._binance_pump(ws, streams))
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if data.get("method") == "SUBSCRIBE":
+                    streams.update(data.get("params", []))
+                elif data.get("method") == "UNSUBSCRIBE":
+                    streams.difference_update(data.get("params", []))
+                await ws.send_json({"result": None, "id": data.get("id")})
+        finally:
+            pump.cancel()
+            self._sockets.discard(ws)
+
+        return ws
+
+    async def _binance_pump(self, ws: web.WebSocketResponse, streams: Set[str]):
+        while not ws.closed:
+            await asyncio.sleep(self.tick_interval)
+            now = time.time()
+            event_ms = int(now * 1000)
+
+            prices = {}
+            for stream in sorted(streams):
+                symbol, _, kind = stream.partition("@")
+                pair = symbol.upper()
+                if pair not in prices:
+                    prices[pair] = self.tick(pair)
+                price = prices[pair]
+
+                if kind == "miniTicker":
+                    data = {
+                        "e": "24hrMiniTicker", "E": event_ms, "s": pair,
+                        "c": f"{price:.8f}", "v": f"{self.volumes[pair]:.8f}"
+                    }
+                elif kind.startswith("kline_"):
+                    interval = kind[len("kline_"):]
+                    if interval not in INTERVAL_SECONDS:
+                        continue
+                    bar = self.bar(pair, interval, price, now)
+                    data = {
+                        "e": "kline", "E": event_ms, "s": pair,
+                        "k": {
+                            "t": bar["t"] * 1000,
+                            "T": (bar["t"] + INTERVAL_SECONDS[interval]) * 1000 - 1,
+                            "s": pair, "i": interval,
+                            "o": f"{bar['o']:.8f}", "h": f"{bar['h']:.8f}",
+                            "l": f"{bar['l']:.8f}", "c": f"{bar['c']:.8f}",
+                            "v": f"{bar['v']:.8f}", "x": False
+                        }
+                    }
+                else:
+                    continue
+
+                await ws.send_str(json.dumps({"stream": stream, "data": data}))
+
+    # ==================== ИСТОРИЯ СВЕЧЕЙ (REST) ====================
+    def _new_bar(self, t: int, open_: float, close: float, tf_sec: int) -> dict:
+        spread = self.volatility * math.sqrt(tf_sec) / 2
+        return {
+            "t": t, "o": open_, "c": close,
+            "h": max(open_, close) * (1 + abs(self.rng.gauss(0, spread))),
+            "l": min(open_, close) * (1 - abs(self.rng.gauss(0, spread))),
+            "v": self.rng.uniform(10, 1000),
+        }
+
+    def klines(self, pair: str, interval: str, limit: int,
+               start: Optional[int] = None, end: Optional[int] = None) -> List[dict]:
+        """
+        Бары (pair, interval) по возрастанию времени, последний - формирующийся
+
+        start/end - секунды (включительно); со start - первые limit баров,
+        иначе - последние limit баров до end.
+        """
+        tf_sec = INTERVAL_SECONDS[interval]
+        now = time.time()
+        current_open = int(now // tf_sec * tf_sec)
+        price = self.tick(pair)
+        step = self.volatility * math.sqrt(tf_sec)
+
+        bars = self.history.setdefault((pair, interval), [])
+        if not bars:
+            bars.append(self._new_bar(current_open, price, price, tf_sec))
+
+        # Вперёд: новые бары до текущего, формирующийся бар идёт за ценой
+        while bars[-1]["t"] < current_open:
+            prev = bars[-1]["c"]
+            bars.append(self._new_bar(bars[-1]["t"] + tf_sec, prev, prev, tf_sec))
+        last = bars[-1]
+        last["c"] = price
+        last["h"] = max(last["h"], price)
+        last["l"] = min(last["l"], price)
+
+        # Назад: догенерировать историю, которой ещё нет
+        oldest_needed = start if start is not None else (end if end is not None else current_open) - (limit - 1) * tf_sec
+        oldest_needed = max(oldest_needed, current_open - 5000 * tf_sec)
+        older = []
+        t = bars[0]["t"]
+        close = bars[0]["o"]
+        while t > oldest_needed:
+            t -= tf_sec
+            open_ = close / (1 + self.rng.gauss(0, step))
+            older.append(self._new_bar(t, open_, close, tf_sec))
+            close = open_
+        if older:
+            bars[:0] = older[::-1]
+
+        if start is not None:
+            selected = [b for b in bars if b["t"] >= start and (end is None or b["t"] <= end)][:limit]
+        else:
+            selected = [b for b in bars if end is None or b["t"] <= end][-limit:]
+        return selected
+
+    # ==================== ДЕГРАДАЦИЯ ====================
+    @staticmethod
+    def _exchange(path: str) -> Optional[str]:
+        if path.startswith("/api/v3/"):
+            return "binance"
+        if path.startswith("/v5/"):
+            return "bybit"
+        if path.startswith("/api/v5/"):
+            return "okx"
+        return None
+
+    @web.middleware
+    async def _degrade(self, request: web.Request, handler):
+        exchange = self._exchange(request.path)
+        if exchange is None:
+            return await handler(request)
+
+        cond = self.conditions[exchange]
+        if cond.latency or cond.jitter:
+            await asyncio.sleep(cond.latency + self.rng.uniform(0, cond.jitter))
+
+        response = self._injected_error(exchange, cond)
+        if response is None:
+            response = await handler(request)
+        self.requests[(exchange, response.status)] += 1
+        return response
+
+    def _injected_error(self, exchange: str, cond: Conditions) -> Optional[web.Response]:
+        if cond.down:
+            return web.Response(status=503, text="Service Unavailable")
+        roll = self.rng.random()
+        headers = {"Retry-After": str(cond.retry_after)}
+        if roll < cond.ban_rate:
+            return web.Response(status=418, headers=headers, text="I'm a teapot")
+        roll -= cond.ban_rate
+        if roll < cond.rate_limit_rate:
+            return web.Response(status=429, headers=headers, text="Too Many Requests")
+        roll -= cond.rate_limit_rate
+        if roll < cond.error_rate:
+            return web.Response(status=500, text="Internal Server Error")
+        return None
+
+    def _binance_json(self, data, weight: int) -> web.Response:
+        """Ответ Binance с учётом веса за минуту (X-MBX-USED-WEIGHT-1M, 429 при превышении)"""
+        now = time.time()
+        while self._binance_weight and now - self._binance_weight[0][0] >= 60:
+            self._binance_weight.popleft()
+        self._binance_weight.append((now, weight))
+        used = sum(w for _, w in self._binance_weight)
+        headers = {"X-MBX-USED-WEIGHT-1M": str(used)}
+
+        if used > self.binance_weight_limit:
+            oldest = self._binance_weight[0][0]
+            headers["Retry-After"] = str(max(1, int(60 - (now - oldest))))
+            return web.json_response({"code": -1003, "msg": "Too much request weight used"}, status=429, headers=headers)
+        return web.json_response(data, headers=headers)
+
+    # ==================== BINANCE REST ====================
+    @staticmethod
+    def _valid_symbol(symbol: str) -> bool:
+        return symbol.isalnum() and symbol.isupper() and symbol.endswith("USDT")
+
+    def _binance_ticker_data(self, symbol: str) -> dict:
+        price = self.tick(symbol)
+        return {"symbol": symbol, "lastPrice": f"{price:.8f}", "volume": f"{self.volumes[symbol]:.8f}"}
+
+    async def binance_ping(self, request: web.Request) -> web.Response:
+        return self._binance_json({}, BINANCE_WEIGHTS["ping"])
+
+    async def binance_ticker(self, request: web.Request) -> web.Response:
+        invalid = {"code": -1121, "msg": "Invalid symbol."}
+        if "symbol" in request.query:
+            symbol = request.query["symbol"]
+            if not self._valid_symbol(symbol):
+                return web.json_response(invalid, status=400)
+            return self._binance_json(self._binance_ticker_data(symbol), BINANCE_WEIGHTS["ticker"])
+
+        if "symbols" in request.query:
+            symbols = json.loads(request.query["symbols"])
+            if not all(self._valid_symbol(s) for s in symbols):
+                return web.json_response(invalid, status=400)
+            return self._binance_json([self._binance_ticker_data(s) for s in symbols], BINANCE_WEIGHTS["tickers"])
+
+        return self._binance_json([self._binance_ticker_data(s) for s in self.listed()], BINANCE_WEIGHTS["all_tickers"])
+
+    async def binance_klines(self, request: web.Request) -> web.Response:
+        symbol = request.query.get("symbol", "")
+        interval = request.query.get("interval", "1h")
+        if not self._valid_symbol(symbol) or interval not in INTERVAL_SECONDS:
+            return web.json_response({"code": -1121, "msg": "Invalid symbol."}, status=400)
+
+        limit = min(int(request.query.get("limit", 500)), 1000)
+        start = int(request.query["startTime"]) // 1000 if "startTime" in request.query else None
+        end = int(request.query["endTime"]) // 1000 if "endTime" in request.query else None
+        tf_ms = INTERVAL_SECONDS[interval] * 1000
+
+        rows = [
+            [b["t"] * 1000, f"{b['o']:.8f}", f"{b['h']:.8f}", f"{b['l']:.8f}", f"{b['c']:.8f}",
+             f"{b['v']:.8f}", b["t"] * 1000 + tf_ms - 1, "0", 0, "0", "0", "0"]
+            for b in self.klines(symbol, interval, limit, start, end)
+        ]
+        return self._binance_json(rows, BINANCE_WEIGHTS["klines"])
+
+    # ==================== BYBIT REST ====================
+    @staticmethod
+    def _bybit(result: dict) -> web.Response:
+        return web.json_response({"retCode": 0, "retMsg": "OK", "result": result, "time": int(time.time() * 1000)})
+
+    async def bybit_time(self, request: web.Request) -> web.Response:
+        return self._bybit({"timeSecond": str(int(time.time()))})
+
+    async def bybit_tickers(self, request: web.Request) -> web.Response:
+        symbol = request.query.get("symbol")
+        symbols = [symbol] if symbol else self.listed()
+        tickers = []
+        for s in symbols:
+            price = self.tick(s)
+            tickers.append({"symbol": s, "lastPrice": f"{price:.8f}", "volume24h": f"{self.volumes[s]:.8f}"})
+        return self._bybit({"category": "spot", "list": tickers})
+
+    async def bybit_kline(self, request: web.Request) -> web.Response:
+        symbol = request.query.get("symbol", "")
+        interval = BYBIT_INTERVALS.get(request.query.get("interval", ""))
+        if not self._valid_symbol(symbol) or interval is None:
+            return web.json_response({"retCode": 10001, "retMsg": "Invalid params", "result": {}})
+
+        limit = min(int(request.query.get("limit", 200)), 1000)
+        start = int(request.query["start"]) // 1000 if "start" in request.query else None
+        end = int(request.query["end"]) // 1000 if "end" in request.query else None
+        bars = self.klines(symbol, interval, limit, start, end)
+        rows = [
+            [str(b["t"] * 1000), f"{b['o']:.8f}", f"{b['h']:.8f}", f"{b['l']:.8f}", f"{b['c']:.8f}",
+             f"{b['v']:.8f}", f"{b['v'] * b['c']:.8f}"]
+            for b in reversed(bars)
+        ]
+        return self._bybit({"category": "spot", "symbol": symbol, "list": rows})
+
+    # ==================== OKX REST ====================
+    @staticmethod
+    def _okx(data: list) -> web.Response:
+        return web.json_response({"code": "0", "msg": "", "data": data})
+
+    def _okx_ticker_data(self, pair: str) -> dict:
+        price = self.tick(pair)
+        return {"instId": f"{pair[:-4]}-USDT", "last": f"{price:.8f}", "vol24h": f"{self.volumes[pair]:.8f}"}
+
+    async def okx_time(self, request: web.Request) -> web.Response:
+        return self._okx([{"ts": str(int(time.time() * 1000))}])
+
+    async def okx_ticker(self, request: web.Request) -> web.Response:
+        pair = request.query.get("instId", "").replace("-", "")
+        if not self._valid_symbol(pair):
+            return web.json_response({"code": "51001", "msg": "Instrument ID does not exist", "data": []})
+        return self._okx([self._okx_ticker_data(pair)])
+
+    async def okx_tickers(self, request: web.Request) -> web.Response:
+        return self._okx([self._okx_ticker_data(pair) for pair in self.listed()])
+
+    async def okx_candles(self, request: web.Request) -> web.Response:
+        pair = request.query.get("instId", "").replace("-", "")
+        interval = OKX_BARS.get(request.query.get("bar", "1H"))
+        if not self._valid_symbol(pair) or interval is None:
+            return web.json_response({"code": "51000", "msg": "Parameter error", "data": []})
+
+        limit = min(int(request.query.get("limit", 100)), 300)
+        # after - свечи старше этого времени, before - новее
+        end = (int(request.query["after"]) - 1) // 1000 if "after" in request.query else None
+        start = int(request.query["before"]) // 1000 + 1 if "before" in request.query else None
+        bars = self.klines(pair, interval, limit, start, end)
+        current_open = int(time.time() // INTERVAL_SECONDS[interval] * INTERVAL_SECONDS[interval])
+        rows = [
+            [str(b["t"] * 1000), f"{b['o']:.8f}", f"{b['h']:.8f}", f"{b['l']:.8f}", f"{b['c']:.8f}",
+             f"{b['v']:.8f}", f"{b['v'] * b['c']:.8f}", f"{b['v'] * b['c']:.8f}",
+             "0" if b["t"] == current_open else "1"]
+            for b in reversed(bars)
+        ]
+        return self._okx(rows)
+
+    async def drop_connections(self):
+        """Оборвать все WebSocket-соединения (проверка реконнекта)"""
+        for ws in list(self._sockets):
+            await ws.close()
+
+    # ==================== ЗАПУСК ====================
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить сервер, вернуть базовый адрес ws://host:port (REST - http://host:port)"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        self.http_url = f"http://{host}:{bound_port}"
+        logger.info(f"🧪 Mock exchange on {host}:{bound_port}")
+        return f"ws://{host}:{bound_port}"
+
+    async def stop(self):
+        await self.drop_connections()
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def _serve(args):
+    symbols = args.pairs + [f"T{i:04d}USDT" for i in range(args.synthetic_pairs)]
+    exchange = MockExchange(seed=args.seed, symbols=symbols)
+    for name in exchange.conditions:
+        exchange.conditions[name] = Conditions(
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+            ban_rate=args.ban_rate if name in args.ban else 0.0,
+            rate_limit_rate=args.rate_limit_rate, down=name in args.down
+        )
+    base = await exchange.start("127.0.0.1", args.port)
+    print(f"🧪 Mock exchange: {base}/stream, REST {exchange.http_url}")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"   Запросов: {dict(exchange.requests)}")
+    finally:
+        await exchange.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка Binance/Bybit/OKX")
+    parser.add_argument("port", nargs="?", type=int, default=9900)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--pairs", nargs="*", default=["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT"])
+    parser.add_argument("--synthetic-pairs", type=int, default=0, help="ещё N пар T0000USDT... для нагрузки")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+ случайная задержка до, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--ban-rate", type=float, default=0.0, help="доля ответов 418 (для бирж из --ban)")
+    parser.add_argument("--ban", nargs="*", default=["binance"], help="биржи, которым включён --ban-rate")
+    parser.add_argument("--down", nargs="*", default=[], help="полностью недоступные биржи (503)")
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
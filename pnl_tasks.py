@@ -3,12 +3,12 @@ pnl_tasks.py - Фоновые задачи для отслеживания PnL
 """
 import asyncio
 import logging
-import httpx
 from aiogram import Bot
 
 from pnl_tracker import pnl_tracker
-from indicators import fetch_price, PRICE_CACHE
+from indicators import fetch_prices, PRICE_CACHE
 from database import get_all_user_ids
+from market_stream import MARKET_STREAM
 
 logger = logging.getLogger(__name__)
 
@@ -19,42 +19,45 @@ async def track_signals_pnl(bot: Bot):
     """
     logger.info("PnL tracker task started")
     
-    async with httpx.AsyncClient() as client:
-        while True:
-            try:
-                # Получить все активные сигналы
-                active_signals = await pnl_tracker.get_active_signals()
+    while True:
+        try:
+            # Получить все активные сигналы
+            active_signals = await pnl_tracker.get_active_signals()
+            
+            if not active_signals:
+                await asyncio.sleep(60)
+                continue
+            
+            # Цены всех пар одним запросом (общий PRICE_CACHE с signal_tracker)
+            prices = await fetch_prices([s['pair'] for s in active_signals])
+            
+            # Проверить каждый сигнал
+            for signal in active_signals:
+                pair = signal['pair']
+                signal_id = signal['id']
                 
-                if not active_signals:
-                    await asyncio.sleep(60)
+                # Получить текущую цену
+                price_data = prices.get(pair.upper())
+                if not price_data:
                     continue
                 
-                # Проверить каждый сигнал
-                for signal in active_signals:
-                    pair = signal['pair']
-                    signal_id = signal['id']
-                    
-                    # Получить текущую цену
-                    price_data = await fetch_price(client, pair)
-                    if not price_data:
-                        continue
-                    
-                    current_price, _ = price_data
-                    
-                    # Проверить достигла ли цена TP/SL
-                    result = await pnl_tracker.check_signal(signal_id, current_price)
-                    
-                    if result:
-                        # Отправить уведомление пользователям
-                        await notify_users_about_result(bot, signal, result)
+                current_price, _ = price_data
                 
-                # Очистить старый кэш
-                PRICE_CACHE.clear_old()
+                # Проверить достигла ли цена TP/SL
+                result = await pnl_tracker.check_signal(signal_id, current_price)
                 
-            except Exception as e:
-                logger.error(f"PnL tracker error: {e}")
+                if result:
+                    # Отправить уведомление пользователям
+                    await notify_users_about_result(bot, signal, result)
+            
+            # Очистить старый кэш
+            PRICE_CACHE.clear_old()
             
-            await asyncio.sleep(60)  # Проверять каждую минуту
+        except Exception as e:
+            logger.error(f"PnL tracker error: {e}")
+        
+        # Проверять каждую минуту (при живом потоке - чаще)
+        await asyncio.sleep(MARKET_STREAM.tracking_interval(60))
 
 async def notify_users_about_result(bot: Bot, signal: dict, result: dict):
     """
@@ -10,10 +10,19 @@ professional_analyzer.py - ОПТИМИЗИРОВАННАЯ версия
 РЕЗУЛЬТАТ: 8-12 сигналов в день
 """
 import logging
+import threading
 import time
-from typing import Dict, List, Optional, Tuple
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
 import numpy as np
 
+from config import TIMEFRAME_SECONDS, ANALYZER_MEMO_SIZE
+from indicator_engine import last_ema, last_rsi, last_atr
+from streaming_indicators import SeriesIndicators
+from extrema import local_minima, local_maxima, cluster_levels
+from cycle_context import CycleContext, btc_state
+from candle_buffer import OHLCV, as_ohlcv
+
 logger = logging.getLogger(__name__)
 
 # Кэш последних сигналов для предотвращения дубликатов
@@ -48,6 +57,12 @@ class CryptoMickyAnalyzer:
         # Объём
         self.min_volume_ratio = 1.0       # Было 1.3, теперь 1.0
         
+        # Тренды и зоны 4h/1d меняются только на закрытии бара - LRU по закрытому бару
+        self.memo_size = ANALYZER_MEMO_SIZE
+        self.memo_stats = Counter()
+        self._memo: OrderedDict = OrderedDict()
+        self._memo_lock = threading.Lock()
+        
         self.long_conditions = [
             'price_at_support',
             'support_level_confirmed',
@@ -65,31 +80,57 @@ class CryptoMickyAnalyzer:
         ]
     
     def analyze_pair(self, pair: str, candles_1h: List, candles_4h: List, 
-                     candles_1d: List, btc_candles_1h: List = None) -> Optional[Dict]:
+                     candles_1d: List, btc_candles_1h: List = None,
+                     indicators: Dict[str, SeriesIndicators] = None,
+                     context: CycleContext = None) -> Optional[Dict]:
+        """
+        Главный метод анализа (свечи - CandleView или списки словарей)
+        
+        Переводит серии в колонки один раз и вызывает analyze_arrays.
+        """
+        try:
+            btc = as_ohlcv(btc_candles_1h) if btc_candles_1h is not None else None
+            return self.analyze_arrays(
+                pair, as_ohlcv(candles_1h), as_ohlcv(candles_4h), as_ohlcv(candles_1d),
+                btc, indicators, context
+            )
+        except Exception as e:
+            logger.error(f"Error analyzing {pair}: {e}")
+            return None
+    
+    def analyze_arrays(self, pair: str, ohlcv_1h: OHLCV, ohlcv_4h: OHLCV, ohlcv_1d: OHLCV,
+                       btc_1h: OHLCV = None, indicators: Dict[str, SeriesIndicators] = None,
+                       context: CycleContext = None) -> Optional[Dict]:
         """
-        Главный метод анализа
+        Анализ по колонкам серий (candle_buffer.OHLCV) - без словарей свечей
+        
+        indicators - {tf: индикаторы серии}: SeriesIndicators из
+        CANDLES.get_indicators или срезы BatchFeatures (batch_indicators.py).
+        Тренд 1h, RSI и объёмы берутся из indicators['1h'], без пересчёта
+        по всей истории; тренды и зоны 4h/1d - по закрытым барам из LRU
+        
+        context - рыночный снимок цикла (cycle_context.py): состояние BTC
+        берётся из него, btc_1h тогда не нужны
         """
         try:
             # 1. Проверка данных
-            if not self._validate_data(candles_1h, candles_4h, candles_1d):
+            if not self._validate_data(ohlcv_1h, ohlcv_4h, ohlcv_1d):
                 logger.info(f"⚠️ {pair}: Invalid data")
                 return None
             
-            # Получаем текущую цену для проверки дублей
-            last_candle = candles_1h[-1]
-            if isinstance(last_candle, dict):
-                current_price = float(last_candle.get('c', last_candle.get('close', 0)))
-            else:
-                current_price = float(last_candle[4])  # Close price для списка
-            
-            # 3. Анализ трендов на ВСЕХ таймфреймах
-            trend_1h = self._determine_trend(candles_1h)
-            trend_4h = self._determine_trend(candles_4h)
-            trend_1d = self._determine_trend(candles_1d)
+            # 2. Анализ трендов на ВСЕХ таймфреймах
+            indicators = indicators or {}
+            trend_1h = self._determine_trend(ohlcv_1h, indicators.get('1h'))
+            # 4h/1d - по закрытым барам, пересчёт раз в бар
+            now = context.timestamp if context is not None else time.time()
+            closed_4h = self._closed_bars(ohlcv_4h, '4h', now)
+            closed_1d = self._closed_bars(ohlcv_1d, '1d', now)
+            trend_4h = self._memoized('trend', pair, '4h', closed_4h, self._determine_trend)
+            trend_1d = self._memoized('trend', pair, '1d', closed_1d, self._determine_trend)
             
             logger.info(f"📊 {pair}: 1H={trend_1h}, 4H={trend_4h}, 1D={trend_1d}")
             
-            # 4. MTF Confluence
+            # 3. MTF Confluence
             if self.require_mtf_confluence:
                 mtf_result = self._check_mtf_confluence(trend_1h, trend_4h, trend_1d)
                 if mtf_result is None:
@@ -107,20 +148,23 @@ class CryptoMickyAnalyzer:
                 elif trend_1h == trend_4h or trend_4h == trend_1d:
                     mtf_bonus = 10
             
-            # 5. Поиск уровней
-            supports = self._find_support_zones(candles_4h)
-            resistances = self._find_resistance_zones(candles_4h)
+            # 4. Поиск уровней
+            supports = self._memoized('supports', pair, '4h', closed_4h, self._find_support_zones)
+            resistances = self._memoized('resistances', pair, '4h', closed_4h, self._find_resistance_zones)
             
-            # 6. Анализ BTC (обязательно)
-            btc_state = self._analyze_btc(btc_candles_1h) if btc_candles_1h else 'neutral'
+            # 5. Анализ BTC (обязательно)
+            if context is not None:
+                btc_trend = context.btc_state
+            else:
+                btc_trend = self._analyze_btc(btc_1h) if btc_1h is not None else 'neutral'
             
-            logger.info(f"📊 {pair}: BTC={btc_state}, allowed={allowed_side}, supports={len(supports)}, resistances={len(resistances)}")
+            logger.info(f"📊 {pair}: BTC={btc_trend}, allowed={allowed_side}, supports={len(supports)}, resistances={len(resistances)}")
             
-            # 7. Проверяем LONG
+            # 6. Проверяем LONG
             # Убраны жёсткие фильтры - качество контролируется внутри _check_long_setup
             if allowed_side in ['LONG', 'BOTH']:
                 long_signal = self._check_long_setup(
-                    pair, candles_1h, candles_4h, supports, btc_state, mtf_bonus
+                    pair, ohlcv_1h, ohlcv_4h, supports, btc_trend, mtf_bonus, indicators.get('1h')
                 )
                 if long_signal:
                     logger.info(f"🔍 {pair} LONG: conf={long_signal['confidence']}% (min={self.min_confidence}%)")
@@ -133,10 +177,10 @@ class CryptoMickyAnalyzer:
                             logger.info(f"✅ {pair} LONG SIGNAL: {long_signal['confidence']}%")
                             return long_signal
             
-            # 8. Проверяем SHORT
+            # 7. Проверяем SHORT
             if allowed_side in ['SHORT', 'BOTH']:
                 short_signal = self._check_short_setup(
-                    pair, candles_1h, candles_4h, resistances, btc_state, mtf_bonus
+                    pair, ohlcv_1h, ohlcv_4h, resistances, btc_trend, mtf_bonus, indicators.get('1h')
                 )
                 if short_signal:
                     logger.info(f"🔍 {pair} SHORT: conf={short_signal['confidence']}% (min={self.min_confidence}%)")
@@ -220,6 +264,38 @@ class CryptoMickyAnalyzer:
         
         _signal_cache[pair].append(new_signal)
     
+    def _closed_bars(self, candles: OHLCV, tf: str, now: float) -> OHLCV:
+        """Свечи без формирующейся (её бар ещё не закрыт к моменту now)"""
+        candles = as_ohlcv(candles)
+        if candles.size and candles.t[-1] + TIMEFRAME_SECONDS[tf] > now:
+            return candles.head(candles.size - 1)
+        return candles
+    
+    def _memoized(self, kind: str, pair: str, tf: str, candles: OHLCV, compute: Callable):
+        """
+        Результат compute(candles) из LRU-кэша
+        
+        Ключ - (kind, pair, tf) и границы серии закрытых баров: последний
+        закрытый бар, первый бар и их число (дозагрузка истории тоже
+        сбрасывает запись). Значения не изменяются вызывающим кодом.
+        """
+        if not candles.size:
+            return compute(candles)
+        key = (kind, pair, tf, candles.size, float(candles.t[0]), float(candles.t[-1]))
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self.memo_stats['hits'] += 1
+                return self._memo[key]
+        
+        value = compute(candles)
+        with self._memo_lock:
+            self.memo_stats['misses'] += 1
+            self._memo[key] = value
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return value
+    
     def _check_mtf_confluence(self, trend_1h: str, trend_4h: str, trend_1d: str) -> Optional[Tuple[str, int]]:
         """
         Проверка Multi-Timeframe Confluence
@@ -254,15 +330,17 @@ class CryptoMickyAnalyzer:
         # Конфликт трендов - НЕ торгуем
         return None
     
-    def _determine_trend(self, candles: List) -> str:
+    def _determine_trend(self, candles: OHLCV, state: SeriesIndicators = None) -> str:
         """
         СТРОГОЕ определение тренда (требуется 2/4 условий)
+        
+        state - инкрементальные индикаторы серии; без него EMA/RSI
+        считаются по всей истории
         """
-        if len(candles) < 50:
+        closes = as_ohlcv(candles).c
+        if len(closes) < 50:
             return 'mixed'
         
-        closes = np.array([c['c'] for c in candles])
-        
         bull_score = 0
         bear_score = 0
         
@@ -273,8 +351,16 @@ class CryptoMickyAnalyzer:
         if self._check_lower_lows(recent_closes):
             bear_score += 1
         
+        if state is not None:
+            rsi = state.rsi
+            ema_20, ema_50, ema_100 = state.ema[20], state.ema[50], state.ema[100]
+        else:
+            rsi = self._calculate_rsi(closes)
+            ema_20 = self._calculate_ema(closes, 20)
+            ema_50 = self._calculate_ema(closes, 50)
+            ema_100 = self._calculate_ema(closes, 100)
+        
         # 2. RSI
-        rsi = self._calculate_rsi(closes)
         if rsi:
             if rsi > 55:
                 bull_score += 1
@@ -282,10 +368,6 @@ class CryptoMickyAnalyzer:
                 bear_score += 1
         
         # 3. EMA alignment
-        ema_20 = self._calculate_ema(closes, 20)
-        ema_50 = self._calculate_ema(closes, 50)
-        ema_100 = self._calculate_ema(closes, 100)
-        
         if ema_20 and ema_50 and ema_100:
             if ema_20 > ema_50 > ema_100:
                 bull_score += 1
@@ -294,9 +376,9 @@ class CryptoMickyAnalyzer:
         
         # 4. Цена относительно EMA
         if ema_50:
-            if closes[-1] > ema_50 * 1.01:  # Цена выше EMA50 на 1%+
+            if recent_closes[-1] > ema_50 * 1.01:  # Цена выше EMA50 на 1%+
                 bull_score += 1
-            elif closes[-1] < ema_50 * 0.99:  # Цена ниже EMA50 на 1%+
+            elif recent_closes[-1] < ema_50 * 0.99:  # Цена ниже EMA50 на 1%+
                 bear_score += 1
         
         # Требуется минимум 2 условия для определения тренда
@@ -314,11 +396,9 @@ class CryptoMickyAnalyzer:
         if len(closes) < 10:
             return False
         
-        peaks = []
-        for i in range(2, len(closes) - 2):
-            if closes[i] > closes[i-1] and closes[i] > closes[i-2] and \
-               closes[i] > closes[i+1] and closes[i] > closes[i+2]:
-                peaks.append(closes[i])
+        # Выше двух соседей с каждой стороны
+        mid = closes[2:-2]
+        peaks = mid[(mid > closes[1:-3]) & (mid > closes[:-4]) & (mid > closes[3:-1]) & (mid > closes[4:])]
         
         if len(peaks) < 2:
             return False
@@ -331,11 +411,9 @@ class CryptoMickyAnalyzer:
         if len(closes) < 10:
             return False
         
-        troughs = []
-        for i in range(2, len(closes) - 2):
-            if closes[i] < closes[i-1] and closes[i] < closes[i-2] and \
-               closes[i] < closes[i+1] and closes[i] < closes[i+2]:
-                troughs.append(closes[i])
+        # Ниже двух соседей с каждой стороны
+        mid = closes[2:-2]
+        troughs = mid[(mid < closes[1:-3]) & (mid < closes[:-4]) & (mid < closes[3:-1]) & (mid < closes[4:])]
         
         if len(troughs) < 2:
             return False
@@ -343,127 +421,47 @@ class CryptoMickyAnalyzer:
         # Последний минимум ниже предыдущего
         return troughs[-1] < troughs[-2]
     
-    def _find_support_zones(self, candles: List) -> List[Dict]:
+    def _find_support_zones(self, candles: OHLCV) -> List[Dict]:
         """Поиск зон поддержки с подсчётом касаний"""
-        if len(candles) < 50:
-            return []
-        
-        lows = np.array([c['l'] for c in candles])
-        volumes = np.array([c['v'] for c in candles])
-        
-        # Ищем локальные минимумы
-        local_lows = []
-        for i in range(10, len(lows) - 10):
-            if lows[i] <= lows[i-10:i].min() and lows[i] <= lows[i+1:i+11].min():
-                local_lows.append({
-                    'price': lows[i],
-                    'index': i,
-                    'volume': volumes[i]
-                })
-        
-        if not local_lows:
+        candles = as_ohlcv(candles)
+        if candles.size < 50:
             return []
         
-        # Группируем близкие уровни (±2%)
-        support_zones = []
-        processed = set()
-        
-        for i, low1 in enumerate(local_lows):
-            if i in processed:
-                continue
-            
-            touches = [low1]
-            processed.add(i)
-            
-            for j, low2 in enumerate(local_lows[i+1:], i+1):
-                if j in processed:
-                    continue
-                
-                # Если цены близки (в пределах 2%)
-                if abs(low1['price'] - low2['price']) / low1['price'] < 0.02:
-                    touches.append(low2)
-                    processed.add(j)
-            
-            # Только уровни с минимум N касаниями
-            if len(touches) >= self.min_level_touches:
-                avg_price = np.mean([t['price'] for t in touches])
-                total_volume = sum(t['volume'] for t in touches)
-                
-                support_zones.append({
-                    'price': avg_price,
-                    'touches': len(touches),
-                    'volume': total_volume,
-                    'strength': len(touches) * np.log1p(total_volume)
-                })
+        lows, volumes = candles.l, candles.v
         
-        # Сортируем по силе уровня
-        support_zones.sort(key=lambda x: x['strength'], reverse=True)
+        # Локальные минимумы (не выше 10 свечей с каждой стороны)
+        pivots = local_minima(lows, 10)
         
-        return support_zones[:5]  # Топ 5 уровней
+        # Группируем близкие уровни (±2%), только с минимум N касаниями; топ 5 по силе
+        return cluster_levels(lows[pivots], volumes[pivots], self.min_level_touches)
     
-    def _find_resistance_zones(self, candles: List) -> List[Dict]:
+    def _find_resistance_zones(self, candles: OHLCV) -> List[Dict]:
         """Поиск зон сопротивления с подсчётом касаний"""
-        if len(candles) < 50:
+        candles = as_ohlcv(candles)
+        if candles.size < 50:
             return []
         
-        highs = np.array([c['h'] for c in candles])
-        volumes = np.array([c['v'] for c in candles])
+        highs, volumes = candles.h, candles.v
         
-        # Ищем локальные максимумы
-        local_highs = []
-        for i in range(10, len(highs) - 10):
-            if highs[i] >= highs[i-10:i].max() and highs[i] >= highs[i+1:i+11].max():
-                local_highs.append({
-                    'price': highs[i],
-                    'index': i,
-                    'volume': volumes[i]
-                })
+        # Локальные максимумы (не ниже 10 свечей с каждой стороны)
+        pivots = local_maxima(highs, 10)
         
-        if not local_highs:
-            return []
-        
-        # Группируем близкие уровни (±2%)
-        resistance_zones = []
-        processed = set()
-        
-        for i, high1 in enumerate(local_highs):
-            if i in processed:
-                continue
-            
-            touches = [high1]
-            processed.add(i)
-            
-            for j, high2 in enumerate(local_highs[i+1:], i+1):
-                if j in processed:
-                    continue
-                
-                if abs(high1['price'] - high2['price']) / high1['price'] < 0.02:
-                    touches.append(high2)
-                    processed.add(j)
-            
-            if len(touches) >= self.min_level_touches:
-                avg_price = np.mean([t['price'] for t in touches])
-                total_volume = sum(t['volume'] for t in touches)
-                
-                resistance_zones.append({
-                    'price': avg_price,
-                    'touches': len(touches),
-                    'volume': total_volume,
-                    'strength': len(touches) * np.log1p(total_volume)
-                })
-        
-        resistance_zones.sort(key=lambda x: x['strength'], reverse=True)
-        
-        return resistance_zones[:5]
+        # Группируем близкие уровни (±2%), только с минимум N касаниями; топ 5 по силе
+        return cluster_levels(highs[pivots], volumes[pivots], self.min_level_touches)
     
-    def _check_long_setup(self, pair: str, candles_1h: List, candles_4h: List,
-                          supports: List[Dict], btc_state: str, mtf_bonus: int) -> Optional[Dict]:
+    def _check_long_setup(self, pair: str, candles_1h: OHLCV, candles_4h: OHLCV,
+                          supports: List[Dict], btc_state: str, mtf_bonus: int,
+                          features=None) -> Optional[Dict]:
         """Проверка условий для LONG со СТРОГИМИ фильтрами"""
         if not supports:
             return None
         
-        current_price = candles_1h[-1]['c']
-        closes = [c['c'] for c in candles_1h]
+        candles_1h = as_ohlcv(candles_1h)
+        current_price = float(candles_1h.c[-1])
+        if features is not None:
+            rsi = features.rsi
+        else:
+            rsi = self._calculate_rsi(candles_1h.c[-50:], 14)
         
         for support in supports[:3]:  # Проверяем только топ-3 уровня
             level = support['price']
@@ -486,13 +484,12 @@ class CryptoMickyAnalyzer:
                 conditions_desc.append(f"✅ Уровень подтверждён ({support['touches']} касаний)")
             
             # Условие 3: RSI в оптимальной зоне для LONG
-            rsi = self._calculate_rsi(np.array(closes[-50:]), 14)
             if rsi and self.rsi_oversold_min <= rsi <= self.rsi_oversold_max:
                 conditions_met.append('rsi_optimal')
                 conditions_desc.append(f"📊 RSI оптимален ({rsi:.1f})")
             
             # Условие 4: Объём подтверждает
-            if self._check_volume_confirmation(candles_1h, 'long'):
+            if self._check_volume_confirmation(candles_1h, 'long', features):
                 conditions_met.append('volume_confirms')
                 conditions_desc.append("📈 Объём подтверждает разворот")
             
@@ -510,14 +507,19 @@ class CryptoMickyAnalyzer:
         
         return None
     
-    def _check_short_setup(self, pair: str, candles_1h: List, candles_4h: List,
-                           resistances: List[Dict], btc_state: str, mtf_bonus: int) -> Optional[Dict]:
+    def _check_short_setup(self, pair: str, candles_1h: OHLCV, candles_4h: OHLCV,
+                           resistances: List[Dict], btc_state: str, mtf_bonus: int,
+                           features=None) -> Optional[Dict]:
         """Проверка условий для SHORT со СТРОГИМИ фильтрами"""
         if not resistances:
             return None
         
-        current_price = candles_1h[-1]['c']
-        closes = [c['c'] for c in candles_1h]
+        candles_1h = as_ohlcv(candles_1h)
+        current_price = float(candles_1h.c[-1])
+        if features is not None:
+            rsi = features.rsi
+        else:
+            rsi = self._calculate_rsi(candles_1h.c[-50:], 14)
         
         for resistance in resistances[:3]:
             level = resistance['price']
@@ -539,13 +541,12 @@ class CryptoMickyAnalyzer:
                 conditions_desc.append(f"✅ Уровень подтверждён ({resistance['touches']} касаний)")
             
             # Условие 3: RSI в оптимальной зоне для SHORT
-            rsi = self._calculate_rsi(np.array(closes[-50:]), 14)
             if rsi and self.rsi_overbought_min <= rsi <= self.rsi_overbought_max:
                 conditions_met.append('rsi_optimal')
                 conditions_desc.append(f"📊 RSI оптимален ({rsi:.1f})")
             
             # Условие 4: Объём подтверждает
-            if self._check_volume_confirmation(candles_1h, 'short'):
+            if self._check_volume_confirmation(candles_1h, 'short', features):
                 conditions_met.append('volume_confirms')
                 conditions_desc.append("📉 Объём подтверждает разворот")
             
@@ -562,38 +563,37 @@ class CryptoMickyAnalyzer:
         
         return None
     
-    def _check_volume_confirmation(self, candles: List, side: str) -> bool:
+    def _check_volume_confirmation(self, candles: OHLCV, side: str, features=None) -> bool:
         """
         Проверка подтверждения объёмом
         Для LONG: объём на зелёных свечах должен расти
         Для SHORT: объём на красных свечах должен расти
         """
-        if len(candles) < 10:
+        candles = as_ohlcv(candles)
+        if candles.size < 10:
             return False
         
-        recent = candles[-10:]
-        avg_volume = np.mean([c['v'] for c in candles[-30:]])
+        ratio = getattr(features, 'green_volume_ratio' if side == 'long' else 'red_volume_ratio', None)
+        if ratio is not None:
+            return ratio > self.min_volume_ratio
+        
+        avg_volume = candles.v[-30:].mean()
+        recent_v, recent_c, recent_o = candles.v[-10:], candles.c[-10:], candles.o[-10:]
         
         if side == 'long':
             # Ищем зелёные свечи с повышенным объёмом
-            green_candles = [c for c in recent if c['c'] > c['o']]
-            if not green_candles:
-                return False
-            
-            green_volume = np.mean([c['v'] for c in green_candles])
-            return green_volume > avg_volume * self.min_volume_ratio
+            chosen = recent_c > recent_o
         else:
             # Ищем красные свечи с повышенным объёмом
-            red_candles = [c for c in recent if c['c'] < c['o']]
-            if not red_candles:
-                return False
-            
-            red_volume = np.mean([c['v'] for c in red_candles])
-            return red_volume > avg_volume * self.min_volume_ratio
+            chosen = recent_c < recent_o
+        if not chosen.any():
+            return False
+        
+        return recent_v[chosen].mean() > avg_volume * self.min_volume_ratio
     
     def _create_signal(self, pair: str, side: str, current_price: float,
                        level: float, level_strength: int, conditions_met: List[str],
-                       conditions_desc: List[str], candles_1h: List, mtf_bonus: int) -> Dict:
+                       conditions_desc: List[str], candles_1h: OHLCV, mtf_bonus: int) -> Dict:
         """Создание сигнала"""
         
         confidence = self._calculate_confidence(conditions_met, level_strength, mtf_bonus)
@@ -647,7 +647,7 @@ class CryptoMickyAnalyzer:
         
         return entry_min, entry_max
     
-    def _calculate_stop_loss(self, side: str, level: float, candles: List) -> float:
+    def _calculate_stop_loss(self, side: str, level: float, candles: OHLCV) -> float:
         """Расчёт стоп-лосса на основе ATR"""
         atr_val = self._calculate_atr(candles)
         
@@ -669,7 +669,7 @@ class CryptoMickyAnalyzer:
         return sl
     
     def _calculate_take_profits(self, side: str, entry_price: float, 
-                                level: float, candles_1h: List) -> Tuple[float, float, float]:
+                                level: float, candles_1h: OHLCV) -> Tuple[float, float, float]:
         """Расчёт целей на основе ATR (R:R 2:1, 4:1, 6:1)
         
         Используем level (уровень входа) для расчёта TP, 
@@ -718,82 +718,37 @@ class CryptoMickyAnalyzer:
         else:
             return "3-5% депо"
     
-    def _calculate_atr(self, candles: List, period: int = 14) -> float:
+    def _calculate_atr(self, candles: OHLCV, period: int = 14) -> float:
         """Расчёт ATR"""
-        if len(candles) < period + 1:
+        candles = as_ohlcv(candles)
+        if candles.size < period + 1:
             return 0
         
-        true_ranges = []
-        for i in range(1, len(candles)):
-            high = candles[i]['h']
-            low = candles[i]['l']
-            prev_close = candles[i-1]['c']
-            
-            tr = max(
-                high - low,
-                abs(high - prev_close),
-                abs(low - prev_close)
-            )
-            true_ranges.append(tr)
-        
-        return np.mean(true_ranges[-period:])
+        tail = -(period + 1)
+        return last_atr(candles.h[tail:], candles.l[tail:], candles.c[tail:], period)
     
-    def _analyze_btc(self, btc_candles_1h: List) -> str:
+    def _analyze_btc(self, btc_candles_1h: OHLCV) -> str:
         """Анализ состояния BTC"""
-        if not btc_candles_1h or len(btc_candles_1h) < 24:
+        if btc_candles_1h is None:
             return 'neutral'
         
-        closes = np.array([c['c'] for c in btc_candles_1h])
-        
-        # Изменение за последние 4 часа
-        change_4h = (closes[-1] - closes[-4]) / closes[-4] * 100
-        
-        # Изменение за последние 24 часа
-        change_24h = (closes[-1] - closes[-24]) / closes[-24] * 100
-        
-        # BTC bullish если растёт на обоих таймфреймах
-        if change_4h > 0.5 and change_24h > 1:
-            return 'bullish'
-        elif change_4h < -0.5 and change_24h < -1:
-            return 'bearish'
-        else:
-            return 'neutral'
+        # BTC bullish если растёт и за 4, и за 24 часа (меньше 24 свечей - neutral)
+        return btc_state(as_ohlcv(btc_candles_1h).c)
     
     def _calculate_rsi(self, closes: np.ndarray, period: int = 14) -> Optional[float]:
         """Расчёт RSI"""
-        if len(closes) < period + 1:
-            return None
-        
-        deltas = np.diff(closes)
-        gains = np.where(deltas > 0, deltas, 0)
-        losses = np.where(deltas < 0, -deltas, 0)
-        
-        avg_gain = np.mean(gains[-period:])
-        avg_loss = np.mean(losses[-period:])
-        
-        if avg_loss == 0:
-            return 100.0
-        
-        rs = avg_gain / avg_loss
-        return 100 - (100 / (1 + rs))
+        return last_rsi(closes, period)
     
     def _calculate_ema(self, values: np.ndarray, period: int) -> Optional[float]:
         """Расчёт EMA"""
-        if len(values) < period:
-            return None
-        
-        k = 2 / (period + 1)
-        ema = values[0]
-        for value in values[1:]:
-            ema = value * k + ema * (1 - k)
-        return ema
+        return last_ema(values, period)
     
-    def _validate_data(self, candles_1h: List, candles_4h: List, candles_1d: List) -> bool:
+    def _validate_data(self, candles_1h: OHLCV, candles_4h: OHLCV, candles_1d: OHLCV) -> bool:
         """Проверка достаточности данных"""
         return (
-            len(candles_1h) >= 100 and
-            len(candles_4h) >= 100 and
-            len(candles_1d) >= 30
+            as_ohlcv(candles_1h).size >= 100 and
+            as_ohlcv(candles_4h).size >= 100 and
+            as_ohlcv(candles_1d).size >= 30
         )
 
 
@@ -0,0 +1,142 @@
+"""
+rate_limiter.py - Ограничение частоты запросов к биржам
+
+- Token bucket на каждую биржу: бюджет веса в минуту (EXCHANGE_WEIGHT_PER_MINUTE)
+- Бюджет уточняется по заголовкам ответов:
+  Binance X-MBX-USED-WEIGHT-1M (минута), Bybit X-Bapi-Limit-Status
+  (остаток в окне endpoint до X-Bapi-Limit-Reset-Timestamp), везде Retry-After
+- Запрос ждёт заранее, а не получает 418/429
+- Приоритеты: живые цены (LIVE) раньше фоновой загрузки истории (BULK);
+  BULK вдобавок не трогает резерв RATE_LIMIT_BULK_RESERVE
+"""
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+from config import EXCHANGE_WEIGHT_PER_MINUTE, RATE_LIMIT_BULK_RESERVE
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_LIVE = 0   # цены, трекинг TP/SL
+PRIORITY_BULK = 1   # загрузка истории
+
+DEFAULT_PAUSE = 2.0  # 429 без Retry-After
+
+
+class RateGovernor:
+    """Token bucket одной биржи с очередью по приоритету"""
+
+    def __init__(self, name: str, per_minute: int, bulk_reserve: float = RATE_LIMIT_BULK_RESERVE):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.refill_per_sec = per_minute / 60.0
+        self.bulk_reserve = per_minute * bulk_reserve
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+        self._waiters = []  # heap: (priority, seq)
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_sec)
+        self.updated_at = now
+
+    def _wait_time(self, weight: float, priority: int, now: float) -> float:
+        """Сколько ждать до возможности списать weight (0 - можно сейчас)"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        floor = self.bulk_reserve if priority > PRIORITY_LIVE else 0.0
+        # Запрос тяжелее всего бюджета не должен ждать вечно
+        need = min(weight + floor, self.capacity)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.refill_per_sec
+
+    async def acquire(self, weight: float = 1, priority: int = PRIORITY_LIVE):
+        """Дождаться очереди и бюджета, затем списать weight"""
+        entry = (priority, next(self._seq))
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._waiters[0] == entry:
+                    wait = self._wait_time(weight, priority, now)
+                    if wait <= 0:
+                        self.tokens -= weight
+                        return
+                else:
+                    wait = None  # ждём, пока очередь продвинется
+
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._changed.set()
+
+    def observe(self, response: httpx.Response):
+        """Поправить бюджет по заголовкам ответа биржи"""
+        headers = response.headers
+        now = time.monotonic()
+        self._refill(now)
+
+        used = headers.get("X-MBX-USED-WEIGHT-1M")
+        if used is not None and used.isdigit():
+            self.tokens = min(self.tokens, self.capacity - int(used))
+
+        # Bybit: остаток запросов к этому endpoint в его собственном коротком
+        # окне до X-Bapi-Limit-Reset-Timestamp, а не минутный бюджет. До сброса
+        # окна тратим не больше остатка с учётом пополнения ведра за это время
+        remaining = headers.get("X-Bapi-Limit-Status")
+        reset_ms = headers.get("X-Bapi-Limit-Reset-Timestamp")
+        if remaining is not None and remaining.isdigit() and reset_ms and reset_ms.isdigit():
+            reset_in = max(0.0, int(reset_ms) / 1000 - time.time())
+            if int(remaining) == 0:
+                self._pause(reset_in, "limit exhausted")
+            else:
+                self.tokens = min(self.tokens, int(remaining) - reset_in * self.refill_per_sec)
+
+        if response.status_code in (418, 429):
+            retry_after = _parse_retry_after(headers.get("Retry-After"))
+            self.tokens = min(self.tokens, 0.0)
+            self._pause(retry_after if retry_after is not None else DEFAULT_PAUSE, f"HTTP {response.status_code}")
+
+        self._changed.set()
+
+    def _pause(self, seconds: float, reason: str):
+        until = time.monotonic() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            logger.warning(f"⏸ {self.name.upper()} requests paused for {seconds:.0f}s ({reason})")
+
+    def snapshot(self) -> dict:
+        self._refill(time.monotonic())
+        return {
+            'tokens': round(self.tokens, 1),
+            'capacity': self.capacity,
+            'queued': len(self._waiters),
+            'paused': max(0.0, round(self.paused_until - time.monotonic(), 1)),
+        }
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+RATE_LIMITS: Dict[str, RateGovernor] = {
+    name: RateGovernor(name, limit) for name, limit in EXCHANGE_WEIGHT_PER_MINUTE.items()
+}
@@ -0,0 +1,110 @@
+"""
+single_flight.py - Склейка одновременных запросов (single-flight)
+
+Пока запрос по ключу в полёте, остальные вызывающие ждут тот же
+future, а не идут на биржу повторно. Пакетный вариант do_many
+отправляет одним запросом только ключи, которых ещё нет в полёте.
+
+refresh/refresh_many - фоновое обновление для stale-while-revalidate:
+вызывающий сразу получает старое значение, обновление идёт одно.
+Ошибка фонового пакета пишется в лог один раз на пакет.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _consume(future: asyncio.Future):
+    """Забрать ошибку future, чтобы asyncio не ругался на непрочитанную"""
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """Не больше одного запроса в полёте на ключ"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def _register(self, key: Hashable, future: asyncio.Future):
+        self._inflight[key] = future
+
+        def forget(_):
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+        future.add_done_callback(forget)
+
+    def _start(self, key: Hashable, factory: Callable[[], Awaitable]) -> asyncio.Future:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._register(key, future)
+        return future
+
+    def _start_many(self, keys: Iterable[Hashable], factory: Callable[[List[Hashable]], Awaitable[Dict]]
+                    ) -> Tuple[Dict[Hashable, asyncio.Future], Optional[asyncio.Future]]:
+        """(future по каждому ключу, новый пакет или None)"""
+        futures = {}
+        todo = []
+        batch = None
+        for key in dict.fromkeys(keys):
+            if key in self._inflight:
+                futures[key] = self._inflight[key]
+            else:
+                todo.append(key)
+
+        if todo:
+            batch = asyncio.ensure_future(factory(todo))
+
+            async def pick(key):
+                return (await batch).get(key)
+
+            for key in todo:
+                futures[key] = asyncio.ensure_future(pick(key))
+                self._register(key, futures[key])
+        return futures, batch
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable]) -> Any:
+        """Результат factory() - общий для всех, кто спросил ключ одновременно"""
+        return await asyncio.shield(self._start(key, factory))
+
+    async def do_many(self, keys: Iterable[Hashable],
+                      factory: Callable[[List[Hashable]], Awaitable[Dict]]) -> Dict[Hashable, Any]:
+        """
+        Пакетный запрос: factory(ключи) -> {ключ: значение}
+
+        Ключи, уже запрошенные кем-то другим, не попадают в новый пакет.
+        Ошибка пакета даёт None по его ключам.
+        """
+        futures, _ = self._start_many(keys, factory)
+        results = await asyncio.gather(*(asyncio.shield(f) for f in futures.values()), return_exceptions=True)
+        return {
+            key: None if isinstance(result, BaseException) else result
+            for key, result in zip(futures, results)
+        }
+
+    def refresh(self, key: Hashable, factory: Callable[[], Awaitable]):
+        """Обновить в фоне (если по ключу уже ничего не летит)"""
+        self._detach(self._start(key, factory))
+
+    def refresh_many(self, keys: Iterable[Hashable], factory: Callable[[List[Hashable]], Awaitable[Dict]]):
+        """Обновить пачку в фоне; ошибка пакета - одно предупреждение, а не по ключу"""
+        futures, batch = self._start_many(keys, factory)
+        for future in futures.values():
+            future.add_done_callback(_consume)
+        if batch is not None:
+            self._detach(batch)
+
+    def _detach(self, future: asyncio.Future):
+        def log_error(f):
+            if not f.cancelled() and f.exception() is not None:
+                logger.warning(f"Background {self.name} refresh failed: {f.exception()}")
+
+        future.add_done_callback(log_error)
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
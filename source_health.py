@@ -0,0 +1,206 @@
+"""
+source_health.py - Здоровье источников рыночных данных
+
+- По каждой бирже: доля успешных запросов, p50/p95 задержки, 418/429
+- Circuit breaker: после серии ошибок источника (или сразу при 418/429)
+  он отключается на cooldown и не получает запросов
+- Ошибка источника - сеть, таймаут, 5xx, 418/429. Ошибка запроса
+  (4xx, неизвестный символ - ExchangeError) считается отдельно и
+  breaker не трогает: биржа жива, плоха пара
+- Порядок источников - по здоровью: быстрый и стабильный первым
+- Отключённые источники проверяются в фоне лёгким запросом;
+  рабочие запросы не ждут таймаутов упавшей биржи
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from config import (
+    SOURCE_HEALTH_WINDOW, SOURCE_FAILURE_THRESHOLD, SOURCE_COOLDOWN_BASE,
+    SOURCE_COOLDOWN_MAX, SOURCE_PROBE_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_STATUSES = (418, 429)  # 418 - бан IP у Binance, 429 - превышен лимит
+DEFAULT_LATENCY = 1.0             # Оценка задержки источника без статистики (сек)
+
+
+class ExchangeError(Exception):
+    """Ошибка уровня API биржи в ответе 200 (retCode/code != 0): неверный символ или параметры"""
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP статус ошибки (None - сетевая ошибка/таймаут)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return error_status(error) in RATE_LIMIT_STATUSES
+
+
+def is_source_failure(error: Exception) -> bool:
+    """Ошибка самого источника (сеть, таймаут, 5xx, 418/429), а не конкретного запроса"""
+    status = error_status(error)
+    if status is not None:
+        return status >= 500 or status in RATE_LIMIT_STATUSES
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class SourceHealth:
+    """Статистика и circuit breaker одного источника"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples = deque(maxlen=SOURCE_HEALTH_WINDOW)  # (ok, latency)
+        self.rate_limited = 0
+        self.request_errors = 0  # 4xx и ошибки API по отдельным запросам (breaker не трогают)
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0.0  # circuit открыт (источник отключён) до этого момента
+
+    @property
+    def is_open(self) -> bool:
+        return self.open_until > 0
+
+    def success_rate(self) -> float:
+        if not self.samples:
+            return 1.0
+        return sum(1 for ok, _ in self.samples if ok) / len(self.samples)
+
+    def latency(self, q: float = 0.5) -> float:
+        if not self.samples:
+            return DEFAULT_LATENCY
+        return _percentile([latency for _, latency in self.samples], q)
+
+    def score(self) -> float:
+        """Меньше - лучше: медианная задержка с поправкой на ошибки"""
+        return self.latency(0.5) / max(self.success_rate(), 0.05)
+
+    def record_success(self, latency: float):
+        self.samples.append((True, latency))
+        self.consecutive_failures = 0
+        if self.is_open:
+            self.close()
+
+    def record_failure(self, latency: float, error: Exception):
+        if not is_source_failure(error):
+            self.request_errors += 1
+            return
+
+        self.samples.append((False, latency))
+        self.consecutive_failures += 1
+
+        if is_rate_limited(error):
+            self.rate_limited += 1
+            self.trip(_retry_after(error), f"HTTP {error_status(error)}")
+        elif self.consecutive_failures >= SOURCE_FAILURE_THRESHOLD and not self.is_open:
+            self.trip(None, f"{self.consecutive_failures} errors in a row")
+
+    def trip(self, retry_after: Optional[float], reason: str):
+        """Отключить источник на cooldown"""
+        cooldown = min(SOURCE_COOLDOWN_MAX, SOURCE_COOLDOWN_BASE * (2 ** self.trips))
+        if retry_after is not None:
+            cooldown = max(cooldown, retry_after)
+        self.trips += 1
+        self.open_until = time.monotonic() + cooldown
+        logger.warning(f"⛔ {self.name.upper()} disabled for {cooldown:.0f}s ({reason})")
+
+    def close(self):
+        self.open_until = 0.0
+        self.trips = 0
+        self.consecutive_failures = 0
+        logger.info(f"✅ {self.name.upper()} is back")
+
+    def probe_due(self) -> bool:
+        return self.is_open and time.monotonic() >= self.open_until
+
+    def snapshot(self) -> dict:
+        return {
+            'success_rate': round(self.success_rate(), 3),
+            'p50': round(self.latency(0.5), 3),
+            'p95': round(self.latency(0.95), 3),
+            'rate_limited': self.rate_limited,
+            'request_errors': self.request_errors,
+            'open': self.is_open,
+        }
+
+
+class SourceHealthBoard:
+    """Здоровье всех источников и выбор порядка запросов"""
+
+    def __init__(self, names: List[str]):
+        self.names = list(names)  # порядок по умолчанию (приоритет при равенстве)
+        self.sources: Dict[str, SourceHealth] = {name: SourceHealth(name) for name in names}
+
+    def __getitem__(self, name: str) -> SourceHealth:
+        return self.sources[name]
+
+    def ranked(self) -> List[str]:
+        """
+        Рабочие источники по здоровью (score)
+
+        Отключённые не получают запросов, пока есть хоть один рабочий;
+        если упали все - отдаются все, чтобы запрос ушёл, а не вернул пустоту.
+        """
+        working = [name for name in self.names if not self.sources[name].is_open]
+        return sorted(
+            working or self.names,
+            key=lambda name: (self.sources[name].score(), self.names.index(name))
+        )
+
+    async def call(self, name: str, func: Callable[..., Awaitable], *args):
+        """Вызвать запрос к источнику и записать результат в статистику"""
+        health = self.sources[name]
+        started = time.monotonic()
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            health.record_failure(time.monotonic() - started, e)
+            raise
+        health.record_success(time.monotonic() - started)
+        return result
+
+    async def run_probes(self, probe: Callable[[str], Awaitable], interval: float = SOURCE_PROBE_INTERVAL):
+        """Фоновая проверка отключённых источников"""
+        logger.info("🩺 Source health probes started")
+        while True:
+            await asyncio.sleep(interval)
+            for name in self.names:
+                if not self.sources[name].probe_due():
+                    continue
+                try:
+                    await self.call(name, probe, name)
+                except Exception as e:
+                    # Ещё не поднялся - новый cooldown (вдвое дольше)
+                    if self.sources[name].probe_due():
+                        self.sources[name].trip(_retry_after(e), f"probe failed: {e.__class__.__name__}")
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: health.snapshot() for name, health in self.sources.items()}
+
+
+SOURCE_HEALTH = SourceHealthBoard(["binance", "bybit", "okx"])
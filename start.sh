@@ -76,7 +76,7 @@ echo ""
 
 # Импорт данных для всех пар
 echo "⏳ Importing candles for 15 pairs..."
-echo "   This will take ~2-3 minutes..."
+echo "   First run downloads full history, restarts only fetch new candles (candles.db)"
 echo ""
 
 python import_history.py all
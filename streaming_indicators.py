@@ -0,0 +1,231 @@
+"""
+streaming_indicators.py - Индикаторы, обновляемые по одной свече
+
+- Состояние на (pair, tf): EMA, RSI (простой и Уайлдера), ATR,
+  скользящие среднее/отклонение - O(1) на свечу, история не пересчитывается
+- Каждый индикатор хранит состояние по закрытым барам (commit) и
+  считает текущее значение с формирующимся баром поверх него (peek),
+  поэтому обновление последней свечи тоже O(1)
+- Значения совпадают с indicator_engine на той же серии; у EMA стартовое
+  значение - первая свеча, которую видело состояние (после заполнения
+  кольцевого буфера расхождение с пересчётом по окну ~ (1 - k) ** capacity)
+
+CandleStorage.get_indicators(pair, tf) поднимает состояние по истории
+и дальше обновляет его при каждой записи в серию.
+"""
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+from config import RSI_PERIOD, BB_PERIOD, BB_STD
+
+
+class RollingStats:
+    """Среднее и отклонение (генеральной совокупности) последних period значений"""
+
+    __slots__ = ('period', '_window', '_mean', '_m2')
+
+    def __init__(self, period: int):
+        self.period = period
+        self._window = deque()  # закрытые значения, не больше period - 1
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def commit(self, x: float):
+        self._window.append(x)
+        delta = x - self._mean
+        self._mean += delta / len(self._window)
+        self._m2 += delta * (x - self._mean)
+
+        if len(self._window) > self.period - 1:
+            old = self._window.popleft()
+            n = len(self._window)
+            if n == 0:
+                self._mean = self._m2 = 0.0
+            else:
+                delta = old - self._mean
+                self._mean -= delta / n
+                self._m2 = max(self._m2 - delta * (old - self._mean), 0.0)
+
+    def peek(self, x: float) -> Tuple[Optional[float], Optional[float]]:
+        """(среднее, отклонение) окна с текущим значением x; None, пока окно неполное"""
+        n = len(self._window) + 1
+        if n < self.period:
+            return None, None
+        delta = x - self._mean
+        mean = self._mean + delta / n
+        m2 = self._m2 + delta * (x - mean)
+        return mean, max(m2 / n, 0.0) ** 0.5
+
+
+class StreamingEMA:
+    """EMA, стартует с первого значения (как indicator_engine.ema_series)"""
+
+    __slots__ = ('period', 'k', '_value', '_count')
+
+    def __init__(self, period: int):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self._value: Optional[float] = None
+        self._count = 0
+
+    def _next(self, x: float) -> float:
+        return x if self._value is None else x * self.k + self._value * (1 - self.k)
+
+    def commit(self, x: float):
+        self._value = self._next(x)
+        self._count += 1
+
+    def peek(self, x: float) -> Optional[float]:
+        return self._next(x) if self._count + 1 >= self.period else None
+
+
+class StreamingRSI:
+    """RSI: простое среднее последних period изменений или сглаживание Уайлдера"""
+
+    __slots__ = ('period', 'wilder', '_prev', '_gains', '_losses', '_deltas', '_avg_gain', '_avg_loss')
+
+    def __init__(self, period: int = RSI_PERIOD, wilder: bool = False):
+        self.period = period
+        self.wilder = wilder
+        self._prev: Optional[float] = None  # закрытие последнего закрытого бара
+        self._gains = RollingStats(period)
+        self._losses = RollingStats(period)
+        self._deltas = 0
+        self._avg_gain = 0.0  # Уайлдер: сумма первых period изменений, затем среднее
+        self._avg_loss = 0.0
+
+    def _averages(self, gain: float, loss: float) -> Tuple[Optional[float], Optional[float]]:
+        if not self.wilder:
+            return self._gains.peek(gain)[0], self._losses.peek(loss)[0]
+        n = self._deltas + 1
+        if n < self.period:
+            return None, None
+        if n == self.period:
+            return (self._avg_gain + gain) / self.period, (self._avg_loss + loss) / self.period
+        p = self.period
+        return (self._avg_gain * (p - 1) + gain) / p, (self._avg_loss * (p - 1) + loss) / p
+
+    def commit(self, close: float):
+        if self._prev is not None:
+            delta = close - self._prev
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            if self.wilder:
+                if self._deltas + 1 <= self.period:
+                    self._avg_gain += gain
+                    self._avg_loss += loss
+                    if self._deltas + 1 == self.period:
+                        self._avg_gain /= self.period
+                        self._avg_loss /= self.period
+                else:
+                    self._avg_gain, self._avg_loss = self._averages(gain, loss)
+            else:
+                self._gains.commit(gain)
+                self._losses.commit(loss)
+            self._deltas += 1
+        self._prev = close
+
+    def peek(self, close: float) -> Optional[float]:
+        if self._prev is None:
+            return None
+        delta = close - self._prev
+        avg_gain, avg_loss = self._averages(max(delta, 0.0), max(-delta, 0.0))
+        if avg_gain is None or avg_loss is None:
+            return None
+        if avg_loss == 0:
+            return 100.0
+        return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+class StreamingATR:
+    """ATR - простое среднее True Range за period"""
+
+    __slots__ = ('period', '_prev_close', '_ranges')
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self._prev_close: Optional[float] = None
+        self._ranges = RollingStats(period)
+
+    def _true_range(self, h: float, l: float) -> float:
+        pc = self._prev_close
+        return max(h - l, abs(h - pc), abs(l - pc))
+
+    def commit(self, h: float, l: float, c: float):
+        if self._prev_close is not None:
+            self._ranges.commit(self._true_range(h, l))
+        self._prev_close = c
+
+    def peek(self, h: float, l: float, c: float) -> Optional[float]:
+        if self._prev_close is None:
+            return None
+        return self._ranges.peek(self._true_range(h, l))[0]
+
+
+class SeriesIndicators:
+    """
+    Индикаторы одной серии (pair, tf)
+
+    push(row) - свеча (t, o, h, l, c, v): то же 't' заменяет формирующийся
+    бар, большее - закрывает его и начинает новый. Текущие значения -
+    атрибуты ema/rsi/rsi_wilder/atr/bands.
+    """
+
+    def __init__(self, ema_periods: Iterable[int] = (20, 50, 100), rsi_period: int = RSI_PERIOD,
+                 atr_period: int = 14, bb_period: int = BB_PERIOD, bb_std: float = BB_STD):
+        self._config = (tuple(ema_periods), rsi_period, atr_period, bb_period, bb_std)
+        self.reset()
+
+    def reset(self):
+        ema_periods, rsi_period, atr_period, bb_period, self.bb_std = self._config
+        self._emas = {p: StreamingEMA(p) for p in ema_periods}
+        self._rsi = StreamingRSI(rsi_period)
+        self._rsi_wilder = StreamingRSI(rsi_period, wilder=True)
+        self._atr = StreamingATR(atr_period)
+        self._bands = RollingStats(bb_period)
+
+        self.live = None  # (t, o, h, l, c, v) формирующегося бара
+        self.bars = 0
+        self.ema: Dict[int, Optional[float]] = dict.fromkeys(ema_periods)
+        self.rsi: Optional[float] = None
+        self.rsi_wilder: Optional[float] = None
+        self.atr: Optional[float] = None
+        self.bands: Optional[Tuple[float, float, float]] = None  # upper, middle, lower
+
+    def _commit(self, row):
+        _, _, h, l, c, _ = row
+        for ema in self._emas.values():
+            ema.commit(c)
+        self._rsi.commit(c)
+        self._rsi_wilder.commit(c)
+        self._atr.commit(h, l, c)
+        self._bands.commit(c)
+
+    def push(self, row) -> bool:
+        """Учесть свечу; False - свеча старше формирующейся (нужен rebuild)"""
+        row = tuple(float(x) for x in row)
+        if self.live is not None:
+            if row[0] < self.live[0]:
+                return False
+            if row[0] > self.live[0]:
+                self._commit(self.live)
+                self.bars += 1
+        self.live = row
+
+        _, _, h, l, c, _ = row
+        for period, ema in self._emas.items():
+            self.ema[period] = ema.peek(c)
+        self.rsi = self._rsi.peek(c)
+        self.rsi_wilder = self._rsi_wilder.peek(c)
+        self.atr = self._atr.peek(h, l, c)
+        middle, std = self._bands.peek(c)
+        self.bands = None if middle is None else (middle + std * self.bb_std, middle, middle - std * self.bb_std)
+        return True
+
+    def rebuild(self, columns):
+        """Пересчитать по всей серии (6, n) - после вставки в середину или замены серии"""
+        self.reset()
+        for row in zip(*columns):
+            self.push(row)
+
+    def __len__(self) -> int:
+        return self.bars + (self.live is not None)
@@ -23,7 +23,6 @@ import random
 from datetime import datetime, timezone
 from collections import defaultdict
 from typing import Optional, Dict, List
-import httpx
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.exceptions import RetryAfter, TelegramAPIError
@@ -37,7 +36,9 @@ from config import (
     HIGH_TIME_SLOTS, MIN_INTERVAL_RARE, MIN_INTERVAL_HIGH, MIN_INTERVAL_MEDIUM,
     SIGNAL_QUEUE_TTL, SIGNAL_PRICE_TOLERANCE,
     FREE_SIGNAL_DELAY, FREE_MAX_SIGNALS_PER_DAY,
-    TRACKING_ENABLED, NO_SIGNALS_MESSAGE_ENABLED, NO_SIGNALS_HOUR_UTC
+    TRACKING_ENABLED, NO_SIGNALS_MESSAGE_ENABLED, NO_SIGNALS_HOUR_UTC,
+    STREAM_CHECK_INTERVAL, HISTORY_CANDLES, BOOTSTRAP_CONCURRENCY, BACKFILL_INTERVAL,
+    TIMEFRAME_SECONDS
 )
 from database import (
     get_all_tracked_pairs, get_pairs_with_users,
@@ -48,12 +49,17 @@ from database import (
     is_duplicate_signal, get_daily_counts, increment_daily_count, can_send_signal,
     get_signals_sent_today
 )
-from indicators import CANDLES, fetch_price, fetch_candles_binance
-from professional_analyzer import CryptoMickyAnalyzer
+from indicators import CANDLES, fetch_price, fetch_prices, load_history, backfill_gaps, refresh_recent_bars
+from batch_indicators import batch_features
+from analysis_pool import ANALYSIS_POOL, make_job
+from cycle_context import CycleContext
+from market_stream import MARKET_STREAM
+from bar_aggregator import BAR_AGGREGATOR
 
 logger = logging.getLogger(__name__)
 
-crypto_micky_analyzer = CryptoMickyAnalyzer()
+# Выставляется price_collector после загрузки истории
+DATA_READY = asyncio.Event()
 
 
 # ==================== БАЙТ-СООБЩЕНИЯ ДЛЯ FREE ====================
@@ -452,9 +458,8 @@ async def process_signal_queue(bot: Bot):
             # Получаем текущую цену для проверки актуальности
             try:
                 from indicators import fetch_price
-                async with httpx.AsyncClient() as client:
-                    price_data = await fetch_price(client, pair)
-                    current_price = price_data[0] if price_data else queued['entry_price']
+                price_data = await fetch_price(pair)
+                current_price = price_data[0] if price_data else queued['entry_price']
             except:
                 current_price = queued['entry_price']
             
@@ -557,28 +562,19 @@ async def price_collector(bot: Bot):
     """Сбор рыночных данных для 1h, 4h, 1d таймфреймов"""
     logger.info("🔄 Price Collector started (1H, 4H, 1D)")
     
-    # Загружаем исторические данные
-    logger.info("📥 Loading historical data...")
+    # Загружаем исторические данные (параллельно, с лимитом на биржу)
+    logger.info(f"📥 Loading historical data ({BOOTSTRAP_CONCURRENCY} parallel)...")
+    started = time.time()
     
-    timeframes_config = {
-        '1h': 300,
-        '4h': 200,
-        '1d': 100
-    }
-    
-    for pair in DEFAULT_PAIRS:
-        for tf, limit in timeframes_config.items():
-            try:
-                candles = await fetch_candles_binance(pair, tf, limit)
-                if candles:
-                    for candle in candles:
-                        CANDLES.add_candle(pair, tf, candle)
-                    logger.info(f"  ✅ {pair} {tf}: {len(candles)} candles")
-                await asyncio.sleep(0.3)
-            except Exception as e:
-                logger.error(f"  ❌ {pair} {tf}: {e}")
+    try:
+        await load_history(DEFAULT_PAIRS, HISTORY_CANDLES, BOOTSTRAP_CONCURRENCY)
+    except Exception as e:
+        logger.error(f"❌ Historical data load error: {e}")
+    finally:
+        # Анализаторы стартуют сразу, как только данные готовы
+        DATA_READY.set()
     
-    logger.info("✅ Historical data loaded!")
+    logger.info(f"✅ Historical data loaded in {time.time() - started:.1f}s!")
     
     # Статистика
     for pair in DEFAULT_PAIRS:
@@ -589,27 +585,49 @@ async def price_collector(bot: Bot):
         logger.info(f"{status} {pair}: 1h={c1h}, 4h={c4h}, 1d={c1d}")
     
     # Регулярное обновление
-    async with httpx.AsyncClient() as client:
-        while True:
-            try:
-                pairs = await get_all_tracked_pairs()
-                pairs = list(set(pairs + DEFAULT_PAIRS))
-                
-                ts = time.time()
-                for pair in pairs:
-                    price_data = await fetch_price(client, pair)
-                    if price_data:
-                        price, volume = price_data
-                        CANDLES.add_candle(pair, "1h", {
-                            't': ts, 'o': price, 'h': price,
-                            'l': price, 'c': price, 'v': volume
-                        })
-                
-                await asyncio.sleep(CHECK_INTERVAL)
-                
-            except Exception as e:
-                logger.error(f"Price collector error: {e}")
-                await asyncio.sleep(60)
+    backfill = None
+    last_backfill = 0.0
+    refresh = None
+    synced_bar = None  # час, за который объёмы баров уже взяты с биржи
+    while True:
+        try:
+            pairs = await get_all_tracked_pairs()
+            pairs = list(set(pairs + DEFAULT_PAIRS))
+            MARKET_STREAM.set_pairs(pairs)
+            
+            # Дыры в свечах (сбой запроса при старте, простой) - дозагрузка в фоне
+            if (backfill is None or backfill.done()) and time.time() - last_backfill >= BACKFILL_INTERVAL:
+                last_backfill = time.time()
+                backfill = asyncio.create_task(backfill_gaps(pairs, HISTORY_CANDLES, BOOTSTRAP_CONCURRENCY))
+            
+            # Живой WebSocket-поток сам обновляет свечи и цены
+            if MARKET_STREAM.is_live():
+                synced_bar = None
+                await asyncio.sleep(STREAM_CHECK_INTERVAL)
+                continue
+            
+            ts = time.time()
+            # У тика нет объёма бара: раз в час (и при возврате к polling)
+            # закрывшийся и формирующийся бары берутся с биржи с объёмом
+            bar = ts // TIMEFRAME_SECONDS[BAR_AGGREGATOR.base_tf]
+            if bar != synced_bar and (refresh is None or refresh.done()):
+                synced_bar = bar
+                refresh = asyncio.create_task(refresh_recent_bars(pairs, HISTORY_CANDLES, concurrency=BOOTSTRAP_CONCURRENCY))
+            
+            # Все пары одним запросом на биржу (цены попадают в PRICE_CACHE)
+            prices = await fetch_prices(pairs)
+            for pair in pairs:
+                price_data = prices.get(pair.upper())
+                if price_data:
+                    price, _ = price_data
+                    # Обновляем текущий 1h бар (и 4h/1d из него)
+                    BAR_AGGREGATOR.on_tick(pair, price, ts)
+            
+            await asyncio.sleep(CHECK_INTERVAL)
+            
+        except Exception as e:
+            logger.error(f"Price collector error: {e}")
+            await asyncio.sleep(60)
 
 
 async def signal_analyzer(bot: Bot):
@@ -617,7 +635,7 @@ async def signal_analyzer(bot: Bot):
     logger.info("🎯 Signal Analyzer started")
     
     # Ждём загрузки данных
-    await asyncio.sleep(30)
+    await DATA_READY.wait()
     logger.info("🔍 Starting analysis loop...")
     
     cycle = 0
@@ -645,24 +663,29 @@ async def signal_analyzer(bot: Bot):
             pairs_analyzed = 0
             pairs_skipped = 0
             
-            for pair, users in pairs_users.items():
-                # Получаем свечи
-                candles_1h = CANDLES.get_candles(pair, "1h")
-                candles_4h = CANDLES.get_candles(pair, "4h")
-                candles_1d = CANDLES.get_candles(pair, "1d")
-                btc_candles_1h = CANDLES.get_candles("BTCUSDT", "1h")
-                
+            # Индикаторы всех пар - одним векторным расчётом (4h/1d анализатор
+            # берёт по закрытым барам из своего кэша)
+            features = batch_features(CANDLES, list(pairs_users), timeframes=("1h",))
+            # Рыночный снимок (BTC, доминация, ширина рынка) - один на цикл
+            context = CycleContext.build(CANDLES, pairs_users, now=current_time)
+            logger.info(f"[Cycle {cycle}] {context}")
+            
+            jobs = []
+            for pair in pairs_users:
                 # Проверка данных
-                if len(candles_1h) < 100 or len(candles_4h) < 50 or len(candles_1d) < 30:
-                    logger.warning(f"⚠️ {pair}: Not enough data (1h={len(candles_1h)}, 4h={len(candles_4h)}, 1d={len(candles_1d)})")
+                n_1h, n_4h, n_1d = (len(CANDLES.get_arrays(pair, tf).t) for tf in ("1h", "4h", "1d"))
+                if n_1h < 100 or n_4h < 50 or n_1d < 30:
+                    logger.warning(f"⚠️ {pair}: Not enough data (1h={n_1h}, 4h={n_4h}, 1d={n_1d})")
                     continue
                 
+                # EMA/RSI/объёмы - из пакетного расчёта по всем парам
+                indicators = {tf: batch.get(pair) for tf, batch in features.items()}
+                jobs.append(make_job(CANDLES, pair, context, indicators))
+            
+            # АНАЛИЗ в пуле воркеров, результаты - по мере готовности
+            async for pair, signal in ANALYSIS_POOL.run(jobs):
                 pairs_analyzed += 1
-                
-                # АНАЛИЗ
-                signal = crypto_micky_analyzer.analyze_pair(
-                    pair, candles_1h, candles_4h, candles_1d, btc_candles_1h
-                )
+                users = pairs_users[pair]
                 
                 if signal:
                     confidence_pct = signal['confidence']
@@ -799,7 +822,8 @@ async def signal_analyzer(bot: Bot):
             
             # Итог цикла
             queue_size = len(_signal_queue)
-            logger.info(f"[Cycle {cycle}] Analyzed: {pairs_analyzed}, Skipped: {pairs_skipped}, Signals: {signals_found}, Queue: {queue_size}")
+            reused = ANALYSIS_POOL.stats['reused']
+            logger.info(f"[Cycle {cycle}] Analyzed: {pairs_analyzed} (unchanged: {reused}), Skipped: {pairs_skipped}, Signals: {signals_found}, Queue: {queue_size}")
             
         except Exception as e:
             logger.error(f"Signal analyzer error: {e}", exc_info=True)
@@ -1019,79 +1043,82 @@ async def signal_tracker(bot: Bot):
     
     logger.info("📊 Signal Tracker started")
     
-    await asyncio.sleep(120)  # Ждём загрузки данных
+    await DATA_READY.wait()  # Ждём загрузки данных
     
-    async with httpx.AsyncClient() as client:
-        while True:
-            try:
-                active_signals = await get_active_signals()
+    while True:
+        try:
+            active_signals = await get_active_signals()
+            
+            # Цены всех отслеживаемых пар одним запросом
+            prices = await fetch_prices([sig['pair'] for sig in active_signals])
+            
+            for sig in active_signals:
+                pair = sig['pair']
                 
-                for sig in active_signals:
-                    pair = sig['pair']
-                    
-                    # Получаем текущую цену
-                    price_data = await fetch_price(client, pair)
-                    if not price_data:
-                        continue
-                    
-                    current_price = price_data[0]
-                    is_long = sig['side'] == 'LONG'
-                    
-                    # Проверяем вход
-                    if not sig['entry_hit']:
-                        entry_min = sig['entry_min'] or sig['entry_price'] * 0.995
-                        entry_max = sig['entry_max'] or sig['entry_price'] * 1.005
-                        
-                        if entry_min <= current_price <= entry_max:
-                            await update_signal_status(sig['id'], 'entry_hit', 1)
-                            await send_update_message(bot, pair, sig['side'], 'ENTRY', current_price)
-                            logger.info(f"🎯 {pair} Entry activated at {current_price}")
-                    
-                    # Проверяем TP1
-                    if sig['entry_hit'] and not sig['tp1_hit']:
-                        if (is_long and current_price >= sig['tp1']) or \
-                           (not is_long and current_price <= sig['tp1']):
-                            await update_signal_status(sig['id'], 'tp1_hit', 1)
-                            await send_update_message(bot, pair, sig['side'], 'TP1', current_price)
-                            logger.info(f"✅ {pair} TP1 hit at {current_price}")
-                    
-                    # Проверяем TP2
-                    if sig['tp1_hit'] and not sig['tp2_hit']:
-                        if (is_long and current_price >= sig['tp2']) or \
-                           (not is_long and current_price <= sig['tp2']):
-                            await update_signal_status(sig['id'], 'tp2_hit', 1)
-                            await send_update_message(bot, pair, sig['side'], 'TP2', current_price)
-                            logger.info(f"✅ {pair} TP2 hit at {current_price}")
-                    
-                    # Проверяем TP3 (закрытие в прибыль)
-                    if sig['tp2_hit'] and not sig['tp3_hit']:
-                        if (is_long and current_price >= sig['tp3']) or \
-                           (not is_long and current_price <= sig['tp3']):
-                            await update_signal_status(sig['id'], 'tp3_hit', 1)
-                            profit = ((sig['tp3'] / sig['entry_price']) - 1) * 100 if is_long else \
-                                     (1 - (sig['tp3'] / sig['entry_price'])) * 100
-                            await close_signal(sig['id'], profit)
-                            await send_update_message(bot, pair, sig['side'], 'TP3', current_price, profit)
-                            logger.info(f"🎉 {pair} TP3 hit! Profit: {profit:.1f}%")
-                    
-                    # Проверяем SL (закрытие в минус)
-                    if sig['entry_hit'] and not sig['sl_hit'] and not sig['tp3_hit']:
-                        if (is_long and current_price <= sig['stop_loss']) or \
-                           (not is_long and current_price >= sig['stop_loss']):
-                            await update_signal_status(sig['id'], 'sl_hit', 1)
-                            loss = ((sig['stop_loss'] / sig['entry_price']) - 1) * 100 if is_long else \
-                                   (1 - (sig['stop_loss'] / sig['entry_price'])) * 100
-                            await close_signal(sig['id'], loss)
-                            await send_update_message(bot, pair, sig['side'], 'SL', current_price, loss)
-                            logger.info(f"❌ {pair} SL hit! Loss: {loss:.1f}%")
+                # Получаем текущую цену
+                price_data = prices.get(pair.upper())
+                if not price_data:
+                    continue
+                
+                current_price = price_data[0]
+                is_long = sig['side'] == 'LONG'
+                
+                # Проверяем вход
+                if not sig['entry_hit']:
+                    entry_min = sig['entry_min'] or sig['entry_price'] * 0.995
+                    entry_max = sig['entry_max'] or sig['entry_price'] * 1.005
                     
-                    await asyncio.sleep(0.1)
+                    if entry_min <= current_price <= entry_max:
+                        await update_signal_status(sig['id'], 'entry_hit', 1)
+                        await send_update_message(bot, pair, sig['side'], 'ENTRY', current_price)
+                        logger.info(f"🎯 {pair} Entry activated at {current_price}")
                 
-                await asyncio.sleep(60)  # Проверка раз в минуту
+                # Проверяем TP1
+                if sig['entry_hit'] and not sig['tp1_hit']:
+                    if (is_long and current_price >= sig['tp1']) or \
+                       (not is_long and current_price <= sig['tp1']):
+                        await update_signal_status(sig['id'], 'tp1_hit', 1)
+                        await send_update_message(bot, pair, sig['side'], 'TP1', current_price)
+                        logger.info(f"✅ {pair} TP1 hit at {current_price}")
                 
-            except Exception as e:
-                logger.error(f"Signal tracker error: {e}", exc_info=True)
-                await asyncio.sleep(60)
+                # Проверяем TP2
+                if sig['tp1_hit'] and not sig['tp2_hit']:
+                    if (is_long and current_price >= sig['tp2']) or \
+                       (not is_long and current_price <= sig['tp2']):
+                        await update_signal_status(sig['id'], 'tp2_hit', 1)
+                        await send_update_message(bot, pair, sig['side'], 'TP2', current_price)
+                        logger.info(f"✅ {pair} TP2 hit at {current_price}")
+                
+                # Проверяем TP3 (закрытие в прибыль)
+                if sig['tp2_hit'] and not sig['tp3_hit']:
+                    if (is_long and current_price >= sig['tp3']) or \
+                       (not is_long and current_price <= sig['tp3']):
+                        await update_signal_status(sig['id'], 'tp3_hit', 1)
+                        profit = ((sig['tp3'] / sig['entry_price']) - 1) * 100 if is_long else \
+                                 (1 - (sig['tp3'] / sig['entry_price'])) * 100
+                        await close_signal(sig['id'], profit)
+                        await send_update_message(bot, pair, sig['side'], 'TP3', current_price, profit)
+                        logger.info(f"🎉 {pair} TP3 hit! Profit: {profit:.1f}%")
+                
+                # Проверяем SL (закрытие в минус)
+                if sig['entry_hit'] and not sig['sl_hit'] and not sig['tp3_hit']:
+                    if (is_long and current_price <= sig['stop_loss']) or \
+                       (not is_long and current_price >= sig['stop_loss']):
+                        await update_signal_status(sig['id'], 'sl_hit', 1)
+                        loss = ((sig['stop_loss'] / sig['entry_price']) - 1) * 100 if is_long else \
+                               (1 - (sig['stop_loss'] / sig['entry_price'])) * 100
+                        await close_signal(sig['id'], loss)
+                        await send_update_message(bot, pair, sig['side'], 'SL', current_price, loss)
+                        logger.info(f"❌ {pair} SL hit! Loss: {loss:.1f}%")
+                
+                await asyncio.sleep(0.1)
+            
+            # Раз в минуту; при живом потоке - чаще (цены уже в кэше)
+            await asyncio.sleep(MARKET_STREAM.tracking_interval(60))
+            
+        except Exception as e:
+            logger.error(f"Signal tracker error: {e}", exc_info=True)
+            await asyncio.sleep(60)
 
 
 async def send_update_message(bot: Bot, pair: str, side: str, update_type: str, 
@@ -4,10 +4,151 @@ test_indicators.py - Тестирование индикаторов
 Запуск: python test_indicators.py
 """
 import sys
+import math
+import asyncio
+import random
+from collections import Counter
+
+import numpy as np
+
+import cycle_context
+import professional_analyzer
 from indicators import (
     ema, sma, rsi, macd, bollinger_bands, 
-    volume_strength, atr, calculate_tp_sl
+    volume_strength, atr, calculate_tp_sl,
+    CandleStorage, find_support_resistance_levels, _filter_and_group_levels
 )
+from candle_buffer import CandleBuffer, OHLCV, rows_to_columns
+from indicator_engine import ema_series, macd_series, rsi_series, atr_series, bollinger_series
+from batch_indicators import BatchFeatures, batch_features
+from extrema import rolling_min, rolling_max, local_minima, local_maxima, cluster_levels
+from professional_analyzer import CryptoMickyAnalyzer
+from analysis_pool import AnalysisPool, make_job
+from cycle_context import CycleContext
+
+# ==================== ЭТАЛОН: прежние реализации на Python ====================
+def ref_ema(values, period):
+    if len(values) < period:
+        return None
+    k = 2 / (period + 1)
+    ema_val = values[0]
+    for value in values[1:]:
+        ema_val = value * k + ema_val * (1 - k)
+    return ema_val
+
+def ref_rsi(closes, period=14):
+    if len(closes) < period + 1:
+        return None
+    gains, losses = [], []
+    for i in range(1, len(closes)):
+        change = closes[i] - closes[i-1]
+        gains.append(max(0, change))
+        losses.append(max(0, -change))
+    avg_gain = sum(gains[-period:]) / period
+    avg_loss = sum(losses[-period:]) / period
+    if avg_loss == 0:
+        return 100.0
+    return 100 - (100 / (1 + avg_gain / avg_loss))
+
+def ref_wilder_rsi(closes, period=14):
+    gains = [max(0, b - a) for a, b in zip(closes, closes[1:])]
+    losses = [max(0, a - b) for a, b in zip(closes, closes[1:])]
+    avg_gain = sum(gains[:period]) / period
+    avg_loss = sum(losses[:period]) / period
+    for gain, loss in zip(gains[period:], losses[period:]):
+        avg_gain = (avg_gain * (period - 1) + gain) / period
+        avg_loss = (avg_loss * (period - 1) + loss) / period
+    if avg_loss == 0:
+        return 100.0
+    return 100 - (100 / (1 + avg_gain / avg_loss))
+
+def ref_macd(closes, fast=12, slow=26, signal=9):
+    if len(closes) < slow + signal:
+        return None
+    macd_line = ref_ema(closes, fast) - ref_ema(closes, slow)
+    macd_values = [ref_ema(closes[:i], fast) - ref_ema(closes[:i], slow) for i in range(slow, len(closes) + 1)]
+    signal_line = ref_ema(macd_values, signal)
+    return macd_line, signal_line, macd_line - signal_line
+
+def ref_bollinger(closes, period=20, std_dev=2):
+    if len(closes) < period:
+        return None
+    recent = closes[-period:]
+    middle = sum(recent) / period
+    std = (sum((x - middle) ** 2 for x in recent) / period) ** 0.5
+    return middle + std * std_dev, middle, middle - std * std_dev
+
+def ref_atr(candles, period=14):
+    if len(candles) < period + 1:
+        return None
+    true_ranges = []
+    for i in range(1, len(candles)):
+        high, low, prev_close = candles[i]['h'], candles[i]['l'], candles[i-1]['c']
+        true_ranges.append(max(high - low, abs(high - prev_close), abs(low - prev_close)))
+    return sum(true_ranges[-period:]) / period
+
+def ref_local_extrema(values, window):
+    minima, maxima = [], []
+    for i in range(window, len(values) - window):
+        if values[i] <= min(values[i-window:i]) and values[i] <= min(values[i+1:i+window+1]):
+            minima.append(i)
+        if values[i] >= max(values[i-window:i]) and values[i] >= max(values[i+1:i+window+1]):
+            maxima.append(i)
+    return minima, maxima
+
+def ref_zones(prices, volumes, min_touches):
+    zones, processed = [], set()
+    for i, price in enumerate(prices):
+        if i in processed:
+            continue
+        touches = [i]
+        processed.add(i)
+        for j in range(i + 1, len(prices)):
+            if j not in processed and abs(price - prices[j]) / price < 0.02:
+                touches.append(j)
+                processed.add(j)
+        if len(touches) >= min_touches:
+            total_volume = sum(volumes[t] for t in touches)
+            zones.append({
+                'price': sum(prices[t] for t in touches) / len(touches),
+                'touches': len(touches),
+                'volume': total_volume,
+                'strength': len(touches) * math.log1p(total_volume)
+            })
+    zones.sort(key=lambda x: x['strength'], reverse=True)
+    return zones[:5]
+
+def ref_higher_highs(closes):
+    peaks = [closes[i] for i in range(2, len(closes) - 2)
+             if closes[i] > max(closes[i-2], closes[i-1], closes[i+1], closes[i+2])]
+    return len(closes) >= 10 and len(peaks) >= 2 and peaks[-1] > peaks[-2]
+
+def ref_volume_confirmation(candles, side, min_ratio=1.0):
+    if len(candles) < 10:
+        return False
+    avg_volume = sum(c['v'] for c in candles[-30:]) / len(candles[-30:])
+    picked = [c['v'] for c in candles[-10:] if (c['c'] > c['o'] if side == 'long' else c['c'] < c['o'])]
+    return bool(picked) and sum(picked) / len(picked) > avg_volume * min_ratio
+
+def _random_candles(n=300, seed=7, start=43000.0):
+    rng = random.Random(seed)
+    candles, price = [], start
+    for i in range(n):
+        close = price * (1 + rng.gauss(0, 0.01))
+        candles.append({
+            't': i * 3600.0, 'o': price, 'c': close, 'v': rng.uniform(10, 100),
+            'h': max(price, close) * (1 + rng.uniform(0, 0.005)),
+            'l': min(price, close) * (1 - rng.uniform(0, 0.005)),
+        })
+        price = close
+    return candles
+
+def _close(a, b, rel=1e-9):
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, tuple):
+        return all(_close(x, y, rel) for x, y in zip(a, b))
+    return abs(a - b) <= rel * max(1.0, abs(a), abs(b))
 
 def test_ema():
     """Тест EMA"""
@@ -106,6 +247,383 @@ def test_calculate_tp_sl():
     print(f"      SL:  {result['stop_loss']:.2f} (+{result['sl_percent']:.2f}%)")
     print(f"      TP1: {result['take_profit_1']:.2f} (-{result['tp1_percent']:.2f}%)")
 
+def test_parity_with_reference():
+    """Паритет векторных индикаторов с прежними реализациями"""
+    print("🧪 Тест паритета индикаторов...")
+    for seed, start in ((7, 43000.0), (8, 0.35), (9, 2.5)):
+        candles = _random_candles(seed=seed, start=start)
+        closes = [c['c'] for c in candles]
+        for n in (10, 15, 34, 35, 100, 300):
+            assert _close(ema(closes[:n], 9), ref_ema(closes[:n], 9)), f"EMA n={n}"
+            assert _close(rsi(closes[:n], 14), ref_rsi(closes[:n], 14)), f"RSI n={n}"
+            assert _close(macd(closes[:n]), ref_macd(closes[:n])), f"MACD n={n}"
+            assert _close(bollinger_bands(closes[:n]), ref_bollinger(closes[:n]), 1e-7), f"BB n={n}"
+            assert _close(atr(candles[:n]), ref_atr(candles[:n])), f"ATR n={n}"
+
+        # Весь ряд за проход = значения на каждом префиксе
+        ema_full = ema_series(closes, 21)
+        rsi_full = rsi_series(closes, 14)
+        wilder_full = rsi_series(closes, 14, wilder=True)
+        line, signal, _ = macd_series(closes)
+        for i in (20, 40, 120, 299):
+            assert _close(float(ema_full[i]), ref_ema(closes[:i + 1], 21))
+            assert _close(float(rsi_full[i]), ref_rsi(closes[:i + 1], 14))
+            assert _close(float(wilder_full[i]), ref_wilder_rsi(closes[:i + 1], 14))
+            if i >= 34:
+                assert _close((float(line[i]), float(signal[i])), ref_macd(closes[:i + 1])[:2])
+
+    # Та же серия из буфера свечей (CandleView) - без словарей
+    buffer = CandleBuffer(500)
+    buffer.extend(rows_to_columns(candles))
+    assert _close(atr(buffer.view()), ref_atr(candles))
+    arrays = buffer.arrays()
+    assert _close(float(atr_series(arrays.h, arrays.l, arrays.c)[-1]), ref_atr(candles))
+    assert _close(tuple(float(b[-1]) for b in bollinger_series(arrays.c)), ref_bollinger(closes), 1e-7)
+    print("   ✅ EMA, RSI, MACD, Bollinger, ATR совпадают с прежним расчётом")
+
+def test_streaming_indicators_follow_storage():
+    """Инкрементальные индикаторы = пересчёт по всей серии"""
+    print("🧪 Тест инкрементальных индикаторов...")
+    candles = _random_candles(n=260, seed=21)
+    storage = CandleStorage(capacity=500)
+    storage.set_candles("BTCUSDT", "1h", candles[:150])
+    state = storage.get_indicators("BTCUSDT", "1h")
+
+    # Новые свечи и обновления формирующейся - без пересчёта истории
+    for candle in candles[150:]:
+        storage.update_candle("BTCUSDT", "1h", dict(candle, c=candle['o'], h=candle['o'], l=candle['o']))
+        storage.update_candle("BTCUSDT", "1h", candle)
+    # Опоздавшая правка бара в середине - пересчёт
+    fixed = dict(candles[200], h=candles[200]['h'] * 1.05)
+    storage.merge_candles("BTCUSDT", "1h", [fixed])
+    candles[200] = fixed
+
+    assert state is storage.get_indicators("BTCUSDT", "1h")
+    assert len(state) == 260
+    closes = [c['c'] for c in candles]
+    for period in (20, 50, 100):
+        assert _close(state.ema[period], ref_ema(closes, period)), f"EMA{period}"
+    assert _close(state.rsi, ref_rsi(closes))
+    assert _close(state.rsi_wilder, ref_wilder_rsi(closes))
+    assert _close(state.atr, ref_atr(candles))
+    assert _close(state.bands, ref_bollinger(closes), 1e-7)
+
+    # Замена серии целиком сбрасывает состояние
+    storage.set_candles("BTCUSDT", "1h", candles[:10])
+    state = storage.get_indicators("BTCUSDT", "1h")
+    assert state.rsi is None and state.ema[20] is None and len(state) == 10
+    print("   ✅ EMA, RSI, ATR, BB совпадают с полным пересчётом")
+
+def test_batch_features_match_per_pair():
+    """Пакетный расчёт по матрице пар = расчёт по каждой паре"""
+    print("🧪 Тест пакетных индикаторов...")
+    storage = CandleStorage(capacity=500)
+    lengths = {"AAAUSDT": 300, "BBBUSDT": 120, "CCCUSDT": 25, "DDDUSDT": 8}
+    for seed, (pair, n) in enumerate(lengths.items()):
+        storage.set_candles(pair, "1h", _random_candles(n=n, seed=seed, start=10.0 ** seed))
+
+    batch = BatchFeatures(storage, list(lengths) + ["NONEUSDT"], "1h")
+    assert "NONEUSDT" not in batch and batch.get("NONEUSDT") is None
+
+    analyzer = CryptoMickyAnalyzer()
+    for pair in lengths:
+        candles = storage.get_candles(pair, "1h")
+        closes = [c['c'] for c in candles]
+        features = batch[pair]
+        for period in (20, 50, 100):
+            assert _close(features.ema[period], ref_ema(closes, period)), f"{pair} EMA{period}"
+        assert _close(features.rsi, ref_rsi(closes)), pair
+        assert _close(features.atr, ref_atr(list(candles))), pair
+        assert _close(features.volume_ratio, volume_strength(list(candles), 20)), pair
+        for side in ('long', 'short'):
+            assert analyzer._check_volume_confirmation(candles, side, features) == \
+                analyzer._check_volume_confirmation(candles, side)
+        assert analyzer._determine_trend(candles, features) == analyzer._determine_trend(candles)
+    print(f"   ✅ {len(lengths)} пары разной длины - одним вызовом")
+
+def test_extrema_match_reference():
+    """Скользящие экстремумы и локальные min/max = прямой перебор окон"""
+    print("🧪 Тест экстремумов для уровней...")
+    rng = random.Random(3)
+    for n, w in ((1, 1), (7, 3), (50, 5), (257, 10), (300, 16)):
+        # Округление даёт равные соседние значения - нестрогое сравнение
+        values = [round(rng.uniform(0, 20)) for _ in range(n)]
+        expected = [min(values[k:k + w]) for k in range(n - w + 1)]
+        assert rolling_min(values, w).tolist() == expected, (n, w)
+        expected = [max(values[k:k + w]) for k in range(n - w + 1)]
+        assert rolling_max(values, w).tolist() == expected, (n, w)
+        minima, maxima = ref_local_extrema(values, w)
+        assert local_minima(values, w).tolist() == minima, (n, w)
+        assert local_maxima(values, w).tolist() == maxima, (n, w)
+
+    candles = _random_candles(n=400, seed=11)
+    lows, highs, closes = ([c[k] for c in candles] for k in 'lhc')
+    expected = (
+        _filter_and_group_levels([lows[i] for i in ref_local_extrema(lows, 5)[0]], closes),
+        _filter_and_group_levels([highs[i] for i in ref_local_extrema(highs, 5)[1]], closes),
+    )
+    assert find_support_resistance_levels(candles) == expected
+    storage = CandleStorage(capacity=500)
+    storage.set_candles("BTCUSDT", "1h", candles)
+    assert find_support_resistance_levels(storage.get_candles("BTCUSDT", "1h")) == expected
+    print("   ✅ Совпадают с перебором, включая равных соседей")
+
+def test_level_clusters_match_pairwise_grouping():
+    """Группировка уровней сортировкой = прежнее попарное сравнение"""
+    print("🧪 Тест кластеров уровней...")
+    rng = random.Random(5)
+    for k, spread, min_touches in ((0, 1, 1), (1, 1, 1), (40, 0.05, 1), (300, 0.2, 2), (2000, 0.5, 3)):
+        prices = [100 * (1 + rng.uniform(-spread, spread)) for _ in range(k)]
+        # Ровно на границе 2% и повторы одной цены
+        prices += [100.0, 102.0, 98.0, 100.0] if k else []
+        volumes = [rng.choice([1.0, 5.0, rng.uniform(1, 1000)]) for _ in prices]
+        zones = cluster_levels(prices, volumes, min_touches)
+        expected = ref_zones(prices, volumes, min_touches)
+        assert len(zones) == len(expected), k
+        for zone, ref in zip(zones, expected):
+            assert zone['touches'] == ref['touches'], k
+            for key in ('price', 'volume', 'strength'):
+                assert _close(zone[key], ref[key]), (k, key)
+
+    analyzer = CryptoMickyAnalyzer()
+    candles = _random_candles(n=600, seed=2)
+    for field, zones, pivots in (('l', analyzer._find_support_zones, local_minima),
+                                 ('h', analyzer._find_resistance_zones, local_maxima)):
+        values = [c[field] for c in candles]
+        index = pivots(values, 10).tolist()
+        expected = ref_zones([values[i] for i in index], [candles[i]['v'] for i in index],
+                             analyzer.min_level_touches)
+        assert [z['touches'] for z in zones(candles)] == [z['touches'] for z in expected]
+        assert all(_close(z['price'], r['price']) for z, r in zip(zones(candles), expected))
+    print("   ✅ Те же топ-5 зон: цена, касания, объём, сила")
+
+def test_analysis_pool_matches_inline():
+    """Анализ в пуле потоков/процессов = analyze_pair в цикле событий"""
+    print("🧪 Тест пула анализа...")
+    storage = CandleStorage(capacity=500)
+    pairs = [f"P{i}USDT" for i in range(6)] + ["BTCUSDT"]
+    for seed, pair in enumerate(pairs):
+        for tf, n, offset in (("1h", 300, 0), ("4h", 200, 100), ("1d", 100, 200)):
+            storage.set_candles(pair, tf, _random_candles(n=n, seed=seed + offset))
+    features = batch_features(storage, pairs)
+    indicators = {pair: {tf: batch.get(pair) for tf, batch in features.items()} for pair in pairs}
+
+    analyzer = CryptoMickyAnalyzer()
+
+    def inline():
+        return {
+            pair: analyzer.analyze_pair(
+                pair, *(storage.get_candles(pair, tf) for tf in ("1h", "4h", "1d")),
+                storage.get_candles("BTCUSDT", "1h"), indicators[pair]
+            ) for pair in pairs
+        }
+
+    def summary(signals):
+        return {pair: signal and (signal['side'], signal['confidence']) for pair, signal in signals.items()}
+
+    # Два цикла подряд: во втором антидубль отсекает повторы первого
+    professional_analyzer._signal_cache.clear()
+    expected = [summary(inline()), summary(inline())]
+    assert any(expected[0].values()) and expected[0] != expected[1]
+
+    async def run(pool):
+        context = CycleContext.build(storage, pairs)
+        jobs = [make_job(storage, pair, context, indicators[pair]) for pair in pairs]
+        try:
+            return summary({pair: signal async for pair, signal in pool.run(jobs)})
+        finally:
+            pool.close()
+
+    for mode in ("thread", "process"):
+        professional_analyzer._signal_cache.clear()
+        cycles = [asyncio.run(run(AnalysisPool(mode, 2))) for _ in range(2)]
+        assert cycles == expected, mode
+    professional_analyzer._signal_cache.clear()
+
+    # Процесс-воркер не исполняет заново запускающий скрипт
+    pool = AnalysisPool("process", 1)
+    try:
+        # __mp_main__ с __file__ - импортированный заново скрипт родителя
+        main_file = pool.executor().submit(eval, "getattr(__import__('sys').modules.get('__mp_main__'), '__file__', None)")
+        assert main_file.result(timeout=60) is None, main_file.result()
+    finally:
+        pool.close()
+    print("   ✅ Те же сигналы, антидубль общий")
+
+def test_cycle_context_computed_once():
+    """Рыночные признаки - один раз на цикл, BTC как в _analyze_btc"""
+    print("🧪 Тест контекста цикла...")
+    storage = CandleStorage(capacity=500)
+    pairs = ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    analyzer = CryptoMickyAnalyzer()
+    calls = []
+
+    @cycle_context.market_feature("test_calls")
+    def _count(storage, pairs, context):
+        calls.append(context.features['btc_state'])  # предыдущие признаки уже посчитаны
+        return len(calls)
+
+    @cycle_context.market_feature("test_broken")
+    def _broken(storage, pairs, context):
+        raise ValueError("no data")
+
+    try:
+        for seed in range(12):
+            for i, pair in enumerate(pairs):
+                storage.set_candles(pair, "1h", _random_candles(n=60, seed=seed * 10 + i))
+            context = CycleContext.build(storage, pairs, now=1000.0)
+            btc = storage.get_candles("BTCUSDT", "1h")
+            assert context.btc_state == analyzer._analyze_btc(btc) == analyzer._analyze_btc(list(btc))
+            assert context['test_calls'] == seed + 1 and context.get('test_broken', 'n/a') == 'n/a'
+
+            changes = {p: (c[-1] - c[-24]) / c[-24] * 100
+                       for p, c in ((p, storage.get_arrays(p, "1h").c) for p in pairs)}
+            alts = sorted(changes[p] for p in pairs[1:])
+            assert _close(context['btc_dominance'], changes["BTCUSDT"] - sum(alts) / 2)
+            assert _close(context['breadth'], sum(c > 0 for c in changes.values()) / 3)
+    finally:
+        del cycle_context.MARKET_FEATURES["test_calls"], cycle_context.MARKET_FEATURES["test_broken"]
+
+    # Без истории - нейтрально, признаки None
+    empty = CycleContext.build(CandleStorage(capacity=10), pairs)
+    assert empty.btc_state == 'neutral' and empty.get('btc_dominance') is None
+    print("   ✅ Один расчёт на цикл, состояние BTC совпадает")
+
+def test_unchanged_pairs_reuse_results():
+    """Версии серий не изменились - пара не анализируется повторно"""
+    print("🧪 Тест кэша результатов анализа...")
+    storage = CandleStorage(capacity=500)
+    pairs = [f"P{i}USDT" for i in range(6)] + ["BTCUSDT"]
+    for seed, pair in enumerate(pairs):
+        for tf, n, offset in (("1h", 300, 0), ("4h", 200, 100), ("1d", 100, 200)):
+            storage.set_candles(pair, tf, _random_candles(n=n, seed=seed + offset))
+
+    # Версия растёт только при изменении серии
+    version = storage.version("P1USDT", "1h")
+    last = dict(storage.get_candles("P1USDT", "1h")[-1])
+    storage.add_candle("P1USDT", "1h", last)
+    assert storage.version("P1USDT", "1h") == version
+    storage.add_candle("P1USDT", "1h", {**last, 'c': last['c'] * 1.001, 'h': last['h'] * 1.001})
+    assert storage.version("P1USDT", "1h") == version + 1
+
+    pool = AnalysisPool("thread", 2)
+    professional_analyzer._signal_cache.clear()
+
+    async def cycle():
+        context = CycleContext.build(storage, pairs)
+        features = batch_features(storage, pairs)
+        jobs = [make_job(storage, pair, context, {tf: batch.get(pair) for tf, batch in features.items()})
+                for pair in pairs]
+        return {pair: signal async for pair, signal in pool.run(jobs)}
+
+    try:
+        first = asyncio.run(cycle())
+        assert pool.stats['analyzed'] == len(pairs) and pool.stats['reused'] == 0
+        signalled = {pair for pair, signal in first.items() if signal}
+        assert signalled
+
+        # Пары с сигналом обновили антидубль - их ключ другой; остальные не пересчитываются
+        second = asyncio.run(cycle())
+        assert pool.stats['analyzed'] == len(signalled)
+        assert pool.stats['reused'] == len(pairs) - len(signalled)
+        assert all(second[pair] is None for pair in set(pairs) - signalled)
+
+        # Когда новых сигналов нет, цикл без изменений свечей ничего не считает
+        for _ in range(5):
+            if not any(asyncio.run(cycle()).values()):
+                break
+        asyncio.run(cycle())
+        assert pool.stats['analyzed'] == 0 and pool.stats['reused'] == len(pairs)
+
+        # Новая 1h свеча - заново только эта пара
+        last = storage.get_candles("P0USDT", "1h")[-1]
+        storage.add_candle("P0USDT", "1h", {**last, 't': last['t'] + 3600})
+        asyncio.run(cycle())
+        assert pool.stats['analyzed'] == 1 and pool.stats['reused'] == len(pairs) - 1
+    finally:
+        pool.close()
+        professional_analyzer._signal_cache.clear()
+    print("   ✅ Без изменений - без пересчёта")
+
+def test_higher_timeframe_memo_by_closed_bar():
+    """Тренды и зоны 4h/1d пересчитываются только на закрытии бара"""
+    print("🧪 Тест кэша трендов и зон по закрытому бару...")
+    now = 1_699_920_000.0 + 20000  # середина 4h бара, до конца суток далеко
+    storage = CandleStorage(capacity=500)
+    for tf, n, step, seed in (("1h", 300, 3600, 1), ("4h", 200, 14400, 2), ("1d", 100, 86400, 3)):
+        # Последний бар - формирующийся: открыт, но не закрыт к now
+        candles = _random_candles(n=n, seed=seed)
+        for i, candle in enumerate(candles):
+            candle['t'] = (now // step - (n - 1 - i)) * step
+        storage.set_candles("ETHUSDT", tf, candles)
+
+    analyzer = CryptoMickyAnalyzer()
+    context = CycleContext(now, {'btc_state': 'neutral'})
+
+    def analyze():
+        analyzer.analyze_pair("ETHUSDT", *(storage.get_candles("ETHUSDT", tf) for tf in ("1h", "4h", "1d")),
+                              context=context)
+
+    analyze()
+    assert analyzer.memo_stats == Counter(misses=4)
+    analyze()
+    assert analyzer.memo_stats == Counter(misses=4, hits=4)
+
+    # Формирующийся бар меняется - результат прежний, считан по закрытым барам
+    last = storage.get_candles("ETHUSDT", "4h")[-1]
+    storage.add_candle("ETHUSDT", "4h", {**last, 'c': last['c'] * 1.05, 'h': last['h'] * 1.05})
+    analyze()
+    assert analyzer.memo_stats == Counter(misses=4, hits=8)
+    candles_4h = storage.get_candles("ETHUSDT", "4h")
+    closed = list(candles_4h)[:-1]
+    assert analyzer._memoized('trend', "ETHUSDT", '4h', candles_4h.arrays.head(len(closed)), None) == \
+        analyzer._determine_trend(closed)
+    assert analyzer._memoized('supports', "ETHUSDT", '4h', candles_4h.arrays.head(len(closed)), None) == \
+        analyzer._find_support_zones(closed)
+
+    # Бар закрылся - 4h пересчитывается, 1d - из кэша
+    context = CycleContext(now + 14400, {'btc_state': 'neutral'})
+    analyze()
+    assert analyzer.memo_stats['misses'] == 4 + 3
+
+    # LRU ограничен: новые записи вытесняют давно не использованные
+    analyzer.memo_size = 3
+    last = storage.get_candles("ETHUSDT", "4h")[-1]
+    storage.add_candle("ETHUSDT", "4h", {**last, 't': last['t'] + 14400})
+    context = CycleContext(now + 3 * 14400, {'btc_state': 'neutral'})
+    analyze()
+    assert len(analyzer._memo) == 3
+    print("   ✅ Пересчёт раз в бар, LRU ограничен")
+
+def test_analyze_arrays_matches_dict_candles():
+    """analyze_arrays по колонкам = analyze_pair по словарям свечей"""
+    print("🧪 Тест анализа по массивам...")
+    analyzer = CryptoMickyAnalyzer()
+    context = CycleContext(0.0, {'btc_state': 'neutral'})
+    signals = 0
+    for seed in range(12):
+        series = [_random_candles(n=n, seed=seed * 3 + k) for k, n in enumerate((300, 200, 100))]
+        arrays = [OHLCV(*rows_to_columns(candles)) for candles in series]
+
+        closes = [c['c'] for c in series[0]]
+        for window in (closes[-20:], closes[-12:], closes[:9]):
+            assert analyzer._check_higher_highs(np.array(window)) == ref_higher_highs(window)
+            assert analyzer._check_lower_lows(-np.array(window)) == ref_higher_highs(window)
+        for side in ('long', 'short'):
+            assert analyzer._check_volume_confirmation(arrays[0], side) == \
+                ref_volume_confirmation(series[0], side)
+        assert _close(analyzer._calculate_atr(arrays[0]), ref_atr(series[0]))
+
+        professional_analyzer._signal_cache.clear()
+        from_dicts = analyzer.analyze_pair(f"P{seed}USDT", *series, context=context)
+        professional_analyzer._signal_cache.clear()
+        from_arrays = CryptoMickyAnalyzer().analyze_arrays(f"P{seed}USDT", *arrays, context=context)
+        assert from_dicts == from_arrays, seed
+        signals += from_arrays is not None
+    professional_analyzer._signal_cache.clear()
+    assert signals, "нужен хотя бы один сигнал"
+    print(f"   ✅ Те же сигналы ({signals} из 12), без словарей свечей")
+
 def run_all_tests():
     """Запустить все тесты"""
     print("=" * 50)
@@ -120,7 +638,17 @@ def run_all_tests():
         test_bollinger_bands,
         test_volume_strength,
         test_atr,
-        test_calculate_tp_sl
+        test_calculate_tp_sl,
+        test_parity_with_reference,
+        test_streaming_indicators_follow_storage,
+        test_batch_features_match_per_pair,
+        test_extrema_match_reference,
+        test_level_clusters_match_pairwise_grouping,
+        test_analysis_pool_matches_inline,
+        test_cycle_context_computed_once,
+        test_unchanged_pairs_reuse_results,
+        test_higher_timeframe_memo_by_closed_bar,
+        test_analyze_arrays_matches_dict_candles
     ]
     
     passed = 0
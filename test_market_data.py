@@ -0,0 +1,986 @@
+#!/usr/bin/env python3
+"""
+test_market_data.py - Тестирование слоя рыночных данных (офлайн)
+Запуск: python test_market_data.py
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import tempfile
+
+import httpx
+import numpy as np
+
+import indicators
+import tasks
+from config import TIMEFRAME_SECONDS, HTTP_HOSTS, TICKER_TIMEOUT
+from indicators import CANDLES, PRICE_CACHE, CandleStorage, fetch_prices, fetch_candles_binance_internal
+from candle_store import CandleStore
+from market_stream import MarketStream, BinanceStream
+from bar_aggregator import BarAggregator
+from candle_buffer import CandleBuffer, rows_to_columns, klines_to_columns
+from source_health import SOURCE_HEALTH, SourceHealth, ExchangeError, is_source_failure
+from rate_limiter import RATE_LIMITS, RateGovernor, PRIORITY_BULK, PRIORITY_LIVE
+from exchange_replay import ResponseArchive, RecordingTransport, ReplayTransport
+from mock_exchange import MockExchange, Conditions
+from http_clients import HTTP_CLIENTS, HttpClients
+from single_flight import SingleFlight
+
+
+async def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("Условие не выполнено за отведённое время")
+        await asyncio.sleep(0.02)
+
+
+def test_stream_fills_candles_and_reconnects():
+    """Тест WebSocket-потока на локальной заглушке биржи"""
+    print("🧪 Тест Market Stream...")
+
+    async def scenario():
+        exchange = MockExchange(tick_interval=0.05, seed=1, start_prices={"STRMUSDT": 100.0})
+        base = await exchange.start()
+        stream = MarketStream(sources=[BinanceStream(f"{base}/stream")], backoff_base=0.05)
+        stream.set_pairs(["STRMUSDT"])
+        task = asyncio.create_task(stream.run())
+        try:
+            await _wait_for(lambda: stream.is_live() and CANDLES.get_candles("STRMUSDT", "1h"))
+            assert PRICE_CACHE.get("STRMUSDT") is not None, "Цена должна попасть в PRICE_CACHE"
+            for tf in ("1h", "4h", "1d"):
+                candles = CANDLES.get_candles("STRMUSDT", tf)
+                assert len(candles) == 1, f"Формирующийся бар {tf} обновляется на месте"
+
+            await exchange.drop_connections()
+            await _wait_for(lambda: exchange.connections >= 2 and stream.is_live())
+            assert stream.reconnects >= 1, "Поток должен переподключиться"
+        finally:
+            task.cancel()
+            await exchange.stop()
+
+    asyncio.run(scenario())
+    print("   ✅ Поток обновляет CANDLES/PRICE_CACHE и переподключается")
+
+
+def _bars(start: int, count: int, tf_sec: int = 3600) -> list:
+    return [
+        {'t': float(start + i * tf_sec), 'o': 1.0 + i, 'h': 2.0 + i, 'l': 0.5 + i, 'c': 1.5 + i, 'v': 10.0}
+        for i in range(count)
+    ]
+
+
+def test_candle_store_survives_restart():
+    """Тест постоянного хранилища свечей"""
+    print("🧪 Тест CandleStore...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "candles.db")
+
+        storage = CandleStorage()
+        storage.attach_store(CandleStore(path))
+        storage.set_candles("BTCUSDT", "1h", _bars(0, 300))
+        # Дельта: последняя свеча обновилась, пришли 2 новые
+        changed = storage.merge_candles("BTCUSDT", "1h", _bars(299 * 3600, 3))
+        assert changed == 3, f"Ожидалось 3 изменённые свечи, получено {changed}"
+
+        # Запись копится в памяти, обновления формирующейся свечи схлопываются
+        store = storage.store
+        assert len(store.pending) == 302
+
+        async def flush_in_background():
+            flusher = asyncio.create_task(store.run_flusher(interval=0.01))
+            await _wait_for(lambda: not store.pending)
+            flusher.cancel()
+
+        asyncio.run(flush_in_background())
+        assert store.stats()['candles'] == 302
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM candles").fetchone()[0] == 302, "Сброшено на диск"
+
+        for close in (1.6, 1.7, 1.8):
+            storage.update_candle("BTCUSDT", "1h", dict(_bars(301 * 3600, 1)[0], c=close))
+        assert list(store.pending) == [("BTCUSDT", "1h", 301 * 3600 * 1000)]
+        storage.store.close()
+
+        restarted = CandleStorage()
+        restarted.attach_store(CandleStore(path))
+        loaded = restarted.load_from_store()
+        candles = restarted.get_candles("BTCUSDT", "1h")
+        assert loaded == 302, f"После рестарта ожидалось 302 свечи, получено {loaded}"
+        assert candles == storage.get_candles("BTCUSDT", "1h"), "История на диске совпадает с памятью"
+        assert restarted.store.last_open_ts("BTCUSDT", "1h") == 301 * 3600
+        restarted.store.close()
+
+    print("   ✅ История переживает рестарт, дельта пишется поверх")
+
+
+def test_candle_buffer_wraps_without_copies():
+    """Тест кольцевого буфера свечей"""
+    print("🧪 Тест CandleBuffer...")
+
+    buffer = CandleBuffer(capacity=5)
+    buffer.extend(rows_to_columns(_bars(0, 3)))
+    for candle in _bars(3 * 3600, 4):
+        buffer.append((candle['t'], candle['o'], candle['h'], candle['l'], candle['c'], candle['v']))
+
+    arrays = buffer.arrays()
+    assert len(buffer) == 5, f"Ёмкость 5, в буфере {len(buffer)}"
+    assert arrays.t.tolist() == [2 * 3600.0, 3 * 3600.0, 4 * 3600.0, 5 * 3600.0, 6 * 3600.0]
+    assert arrays.c.flags['C_CONTIGUOUS'] and arrays.c.base is not None, "Колонка - view без копии"
+
+    buffer.replace_last((6 * 3600.0, 1.0, 9.0, 0.1, 7.0, 1.0))
+    view = buffer.view()
+    assert view[-1]['h'] == 9.0 and view.arrays.c[-1] == 7.0
+    assert [c['t'] for c in view[-2:]] == [5 * 3600.0, 6 * 3600.0]
+
+    # Пачка больше ёмкости - остаются последние свечи
+    buffer.extend(rows_to_columns(_bars(0, 12)))
+    assert buffer.arrays().t[0] == 7 * 3600.0 and len(buffer) == 5
+
+    print("   ✅ Добавление O(1), непрерывные срезы после переполнения")
+
+
+def test_candle_upsert_by_open_time():
+    """Тест: одна свеча на время открытия, опоздавшие встают на место"""
+    print("🧪 Тест upsert свечей...")
+
+    storage = CandleStorage(capacity=10)
+    storage.set_candles("BTCUSDT", "1h", _bars(0, 5))
+
+    # Повторная загрузка той же истории ничего не меняет
+    assert storage.merge_candles("BTCUSDT", "1h", _bars(0, 5)) == 0
+    assert len(storage.get_candles("BTCUSDT", "1h")) == 5
+
+    # Новая свеча через разрыв, затем опоздавшая свеча закрывает часть разрыва
+    result = storage.add_candle("BTCUSDT", "1h", _bars(7 * 3600, 1)[0])
+    assert result.appended == 1 and result.gaps == 1
+    late = dict(_bars(5 * 3600, 1)[0], c=123.0)
+    result = storage.add_candle("BTCUSDT", "1h", late)
+    assert result.inserted == 1 and result.gaps == 0
+
+    # Исправленный бар из середины и повтор внутри пачки
+    fixed = dict(_bars(2 * 3600, 1)[0], h=999.0)
+    result = storage.upsert_columns("BTCUSDT", "1h", rows_to_columns([fixed, fixed, _bars(8 * 3600, 1)[0]]))
+    assert (result.replaced, result.appended, result.duplicates) == (1, 1, 1)
+
+    t = storage.get_arrays("BTCUSDT", "1h").t
+    assert list(t) == [h * 3600 for h in (0, 1, 2, 3, 4, 5, 7, 8)]
+    assert storage.get_candles("BTCUSDT", "1h")[2]["h"] == 999.0
+    assert storage.get_candles("BTCUSDT", "1h")[5]["c"] == 123.0
+
+    # Заполненный буфер: свеча старше окна отбрасывается
+    storage.merge_candles("BTCUSDT", "1h", _bars(9 * 3600, 3))
+    assert len(storage.get_candles("BTCUSDT", "1h")) == 10
+    assert storage.add_candle("BTCUSDT", "1h", _bars(-3600, 1)[0]).dropped == 1
+
+    counters = storage.integrity[("BTCUSDT", "1h")]
+    assert counters["duplicates"] == 6 and counters["gaps"] == 1 and counters["dropped"] == 1
+    print("   ✅ Дубликаты не копятся, разрывы и опоздавшие свечи учтены")
+
+
+def test_bar_aggregator_builds_ohlcv():
+    """Тест сборки OHLCV-баров из тиков"""
+    print("🧪 Тест BarAggregator...")
+
+    storage = CandleStorage()
+    aggregator = BarAggregator(storage)
+    day = 86400 * 100
+
+    # Первый час уже скачан с биржи (объём свечи), второй открывается тиком
+    storage.update_candle("TESTUSDT", "1h", {'t': day, 'o': 100.0, 'h': 100.0, 'l': 100.0, 'c': 100.0, 'v': 40.0})
+    ticks = [
+        (day + 1200, 105.0),
+        (day + 3000, 98.0),
+        (day + 3600 + 10, 99.0),
+        (day + 3600 + 600, 101.0),
+    ]
+    for ts, price in ticks:
+        aggregator.on_tick("TESTUSDT", price, ts)
+
+    bars_1h = storage.get_candles("TESTUSDT", "1h")
+    assert len(bars_1h) == 2, f"Ожидалось 2 бара 1h, получено {len(bars_1h)}"
+    first, second = bars_1h
+    assert (first['t'], first['o'], first['h'], first['l'], first['c']) == (day, 100.0, 105.0, 98.0, 98.0)
+    assert first['v'] == 40.0, f"Объём свечи биржи сохраняется: {first['v']}"
+    assert (second['o'], second['c'], second['v']) == (99.0, 101.0, 0.0), "Объём тиком не выдумывается"
+
+    # Старшие таймфреймы собраны из 1h
+    for tf in ("4h", "1d"):
+        bars = storage.get_candles("TESTUSDT", tf)
+        assert len(bars) == 1, f"{tf}: ожидался 1 бар"
+        bar = bars[0]
+        assert (bar['t'], bar['o'], bar['h'], bar['l'], bar['c'], bar['v']) == (day, 100.0, 105.0, 98.0, 101.0, 40.0)
+
+    # Тик из прошлого часа не портит историю
+    aggregator.on_tick("TESTUSDT", 500.0, day + 100)
+    assert storage.get_candles("TESTUSDT", "1h")[0]['h'] == 105.0
+
+    print("   ✅ Бары 1h/4h/1d собираются из тиков")
+
+
+def test_refresh_recent_bars_takes_exchange_volume():
+    """Тест: закрывшийся и формирующийся бары берутся с биржи вместе с объёмом"""
+    print("🧪 Тест refresh_recent_bars...")
+
+    day = 86400 * 100
+    requests = []
+
+    async def fetch(pair, tf, limit, priority=PRIORITY_LIVE, **kwargs):
+        requests.append((pair, tf, limit, priority))
+        return np.array([[day, day + 3600], [1, 2], [3, 4], [0.5, 1], [2, 3], [70.0, 5.0]])
+
+    original = indicators.fetch_candles_binance
+    indicators.fetch_candles_binance = fetch
+    try:
+        for ts, price in ((day + 60, 1.5), (day + 3700, 2.5)):
+            BarAggregator(CANDLES, rollup_tfs=()).on_tick("RFRSUSDT", price, ts)
+        assert list(CANDLES.get_arrays("RFRSUSDT", "1h").v) == [0.0, 0.0]
+
+        changed = asyncio.run(indicators.refresh_recent_bars(["RFRSUSDT"], ["1h"]))
+        assert changed == 2 and requests == [("RFRSUSDT", "1h", 2, PRIORITY_BULK)]
+        assert list(CANDLES.get_arrays("RFRSUSDT", "1h").v) == [70.0, 5.0]
+    finally:
+        indicators.fetch_candles_binance = original
+        CANDLES.buffers.pop(("RFRSUSDT", "1h"), None)
+
+    print("   ✅ Объём баров - из свечей биржи")
+
+
+def test_circuit_breaker_skips_banned_source():
+    """Тест circuit breaker: забаненная биржа не получает запросов"""
+    print("🧪 Тест Source Health...")
+
+    hits = {"binance": 0, "bybit": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "api.binance.com":
+            hits["binance"] += 1
+            return httpx.Response(418, headers={"Retry-After": "120"})
+        hits["bybit"] += 1
+        symbols = ["HLTHAUSDT", "HLTHBUSDT"]
+        return httpx.Response(200, json={"retCode": 0, "result": {"list": [
+            {"symbol": s, "lastPrice": "2.5", "volume24h": "100"} for s in symbols
+        ]}})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            first = await fetch_prices(["HLTHAUSDT"], client=client)
+            second = await fetch_prices(["HLTHBUSDT"], client=client)
+        return first, second
+
+    try:
+        first, second = asyncio.run(scenario())
+        assert first["HLTHAUSDT"] == (2.5, 100.0) and second["HLTHBUSDT"] == (2.5, 100.0)
+        assert hits["binance"] == 1, f"После 418 Binance не должен получать запросы ({hits['binance']})"
+        assert SOURCE_HEALTH["binance"].is_open and SOURCE_HEALTH["binance"].rate_limited == 1
+        assert "binance" not in SOURCE_HEALTH.ranked()
+        assert SOURCE_HEALTH["binance"].open_until - time.monotonic() > 60, "Учтён Retry-After"
+    finally:
+        for name in SOURCE_HEALTH.names:
+            SOURCE_HEALTH.sources[name] = SourceHealth(name)
+
+    print("   ✅ 418 отключает источник, запросы идут в здоровый")
+
+
+def test_client_errors_do_not_trip_breaker():
+    """Тест: 4xx по неизвестной паре - ошибка запроса, а не биржи"""
+    print("🧪 Тест ошибок запроса и breaker...")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "api.binance.com":
+            return httpx.Response(400, json={"code": -1121, "msg": "Invalid symbol."})
+        symbol = request.url.params["symbol"]
+        return httpx.Response(200, json={"retCode": 0, "result": {"list": [
+            {"symbol": symbol, "lastPrice": "3", "volume24h": "1"}
+        ]}})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            for i in range(5):
+                try:
+                    await SOURCE_HEALTH.call("binance", indicators.fetch_price_binance, client, f"BAD{i}USDT")
+                    raise AssertionError("Ожидался 400")
+                except httpx.HTTPStatusError:
+                    pass
+            # Пара, которой нет на Binance, берётся у следующей биржи
+            assert await indicators.fetch_price("BAD0USDT", client=client) == (3.0, 1.0)
+
+    try:
+        asyncio.run(scenario())
+        binance = SOURCE_HEALTH["binance"]
+        assert not binance.is_open, "Плохие пары не отключают Binance"
+        assert binance.request_errors == 6 and binance.consecutive_failures == 0
+
+        request = httpx.Request("GET", "https://api.binance.com")
+        for status, failure in ((400, False), (404, False), (429, True), (418, True), (503, True)):
+            error = httpx.HTTPStatusError("", request=request, response=httpx.Response(status))
+            assert is_source_failure(error) is failure, status
+        assert is_source_failure(httpx.ConnectTimeout("timeout"))
+        assert not is_source_failure(ExchangeError("Bybit API error: Not supported symbols"))
+    finally:
+        for name in SOURCE_HEALTH.names:
+            SOURCE_HEALTH.sources[name] = SourceHealth(name)
+        for i in range(5):
+            PRICE_CACHE.cache.pop(f"BAD{i}USDT", None)
+
+    print("   ✅ 4xx и ошибки API не трогают breaker, сеть/5xx/418/429 - трогают")
+
+
+def test_open_source_not_called_when_others_empty():
+    """Тест: отключённый источник не опрашивается, даже если рабочие ничего не вернули"""
+    print("🧪 Тест пропуска отключённого источника...")
+
+    hits = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hits[request.url.host] = hits.get(request.url.host, 0) + 1
+        if request.url.host == "api.binance.com":
+            return httpx.Response(200, json=[{"symbol": "SKIPAUSDT", "lastPrice": "1", "volume": "1"}])
+        if request.url.host == "api.bybit.com":
+            return httpx.Response(200, json={"retCode": 0, "result": {"list": []}})
+        return httpx.Response(200, json={"code": "0", "data": []})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            assert await fetch_prices(["SKIPAUSDT"], client=client) == {}
+            assert "api.binance.com" not in hits, f"Отключённый Binance опрошен: {hits}"
+            assert hits["api.bybit.com"] == 1 and hits["www.okx.com"] == 1
+
+            # Отключены все - запрос всё равно уходит
+            for name in ("bybit", "okx"):
+                SOURCE_HEALTH[name].trip(None, "test")
+            assert await fetch_prices(["SKIPAUSDT"], client=client) == {"SKIPAUSDT": (1.0, 1.0)}
+
+    try:
+        SOURCE_HEALTH["binance"].trip(None, "test")
+        asyncio.run(scenario())
+    finally:
+        for name in SOURCE_HEALTH.names:
+            SOURCE_HEALTH.sources[name] = SourceHealth(name)
+        PRICE_CACHE.cache.pop("SKIPAUSDT", None)
+
+    print("   ✅ Отключённый источник пропускается, пока есть рабочие")
+
+
+def test_price_requests_coalesce():
+    """Тест single-flight и stale-while-revalidate для цен"""
+    print("🧪 Тест single-flight...")
+
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=[{"symbol": "FLGTUSDT", "lastPrice": str(len(calls)), "volume": "5"}])
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            # 5 одновременных запросов - один поход на биржу
+            results = await asyncio.gather(*(fetch_prices(["FLGTUSDT"], client=client) for _ in range(5)))
+            assert len(calls) == 1, f"Ожидался 1 запрос, было {len(calls)}"
+            assert all(r["FLGTUSDT"] == (1.0, 5.0) for r in results)
+
+            # Цена устарела: сразу отдаётся старая, обновление одно и в фоне
+            price, volume, cached_at = PRICE_CACHE.cache["FLGTUSDT"]
+            PRICE_CACHE.cache["FLGTUSDT"] = (price, volume, cached_at - PRICE_CACHE.ttl - 1)
+            stale = await asyncio.gather(*(fetch_prices(["FLGTUSDT"], client=client) for _ in range(3)))
+            assert all(r["FLGTUSDT"] == (1.0, 5.0) for r in stale), "Старая цена без ожидания"
+            await _wait_for(lambda: PRICE_CACHE.get("FLGTUSDT") == (2.0, 5.0))
+            assert len(calls) == 2, f"Фоновое обновление одно, запросов {len(calls)}"
+
+    asyncio.run(scenario())
+
+    print("   ✅ Одновременные запросы склеиваются, устаревшая цена обновляется в фоне")
+
+
+def test_binance_tickers_batched():
+    """Тест: тикеры Binance запрашиваются пачками symbols=[...], при 400 - весь список"""
+    print("🧪 Тест пачек ticker/24hr...")
+
+    requests = []
+    known = {f"T{i:03d}USDT" for i in range(indicators.BINANCE_TICKER_BATCH + 5)}
+
+    def ticker(symbol):
+        return {"symbol": symbol, "lastPrice": "1.5", "volume": "10"}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        symbols = request.url.params.get("symbols")
+        requests.append(symbols)
+        if symbols is None:
+            return httpx.Response(200, json=[ticker(s) for s in sorted(known)] + [ticker("OTHERUSDT")])
+        wanted = json.loads(symbols)
+        if not set(wanted) <= known:
+            return httpx.Response(400, json={"code": -1121, "msg": "Invalid symbol."})
+        return httpx.Response(200, json=[ticker(s) for s in wanted])
+
+    def spent():
+        """Вес, списанный с бюджета с прошлого вызова"""
+        governor = RATE_LIMITS["binance"]
+        governor._refill(time.monotonic())
+        used, governor.tokens = governor.capacity - governor.tokens, governor.capacity
+        return round(used)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            prices = await indicators.fetch_prices_binance(client, [s.lower() for s in known])
+            assert set(prices) == known and prices["T000USDT"] == (1.5, 10.0)
+            assert len(requests) == 2, f"Две пачки, запросов {len(requests)}"
+            assert all(len(json.loads(r)) <= indicators.BINANCE_TICKER_BATCH for r in requests)
+            assert spent() == 40 + 2, "Вес каждой пачки по числу символов"
+
+            # Неизвестный символ в пачке - 400, пачка берётся из полного списка
+            requests.clear()
+            prices = await indicators.fetch_prices_binance(client, ["T001USDT", "GONEUSDT"])
+            assert requests == ['["GONEUSDT","T001USDT"]', None], f"Запросы {requests}"
+            assert set(prices) == {"T001USDT"}, "Из полного списка - только запрошенные"
+            assert spent() == 2 + 80, "Запасной полный список тоже списывается"
+
+            # Неизвестные символы в обеих пачках - полный список один раз
+            requests.clear()
+            prices = await indicators.fetch_prices_binance(client, sorted(known) + ["AAAGONEUSDT", "ZZZGONEUSDT"])
+            assert len(requests) == 2 and requests[1] is None, f"Запросы {requests}"
+            assert set(prices) == known
+            assert spent() == 40 + 80
+
+    governor = RATE_LIMITS["binance"]
+    RATE_LIMITS["binance"] = RateGovernor("binance", per_minute=1200)
+    try:
+        asyncio.run(scenario())
+    finally:
+        RATE_LIMITS["binance"] = governor
+
+    print("   ✅ Пачки по symbols и откат на полный список при 400")
+
+
+def test_single_flight_priority_and_batch_errors():
+    """Тест: живой запрос не ждёт фоновый, ошибка фонового пакета - одно предупреждение"""
+    print("🧪 Тест single-flight: приоритет и ошибки пакета...")
+
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        rows = [[i * 3600000, "1", "2", "0.5", "1.5", "10"] for i in range(int(request.url.params["limit"]))]
+        return httpx.Response(200, json=rows)
+
+    warnings = []
+    handler_log = logging.Handler()
+    handler_log.emit = lambda record: warnings.append(record.getMessage())
+    flight_logger = logging.getLogger("single_flight")
+    flight_logger.addHandler(handler_log)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            fetch = indicators.fetch_candles_binance
+            bulk, live, live_again = await asyncio.gather(
+                fetch("PRIOUSDT", "1h", 5, client=client, priority=PRIORITY_BULK),
+                fetch("PRIOUSDT", "1h", 5, client=client),
+                fetch("PRIOUSDT", "1h", 5, client=client),
+            )
+            assert len(calls) == 2, f"Фоновый и живой - разные запросы, было {len(calls)}"
+            assert (bulk == live).all() and (live == live_again).all()
+
+        async def broken(keys):
+            raise RuntimeError("exchange down")
+
+        flight = SingleFlight("test")
+        flight.refresh_many(["A", "B", "C"], broken)
+        await _wait_for(lambda: flight.in_flight() == 0)
+        await asyncio.sleep(0)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        flight_logger.removeHandler(handler_log)
+
+    failed = [w for w in warnings if "test refresh failed" in w]
+    assert len(failed) == 1, f"Одно предупреждение на пакет: {failed}"
+    print("   ✅ Приоритет в ключе, ошибка пакета в логе один раз")
+
+
+def test_rate_governor_headers_and_priority():
+    """Тест лимитера: бюджет по заголовкам, живые запросы раньше фоновых"""
+    print("🧪 Тест RateGovernor...")
+
+    async def scenario():
+        governor = RateGovernor("binance", per_minute=60, bulk_reserve=0.2)
+        governor.observe(httpx.Response(200, headers={"X-MBX-USED-WEIGHT-1M": "55"}))
+        assert governor.tokens <= 5.01, f"Бюджет по заголовку: {governor.tokens}"
+
+        order = []
+
+        async def request(tag, priority):
+            await governor.acquire(3, priority)
+            order.append(tag)
+
+        bulk = asyncio.create_task(request("bulk", PRIORITY_BULK))
+        live = asyncio.create_task(request("live", PRIORITY_LIVE))
+        await asyncio.wait_for(live, timeout=1)
+        assert order == ["live"], f"Живой запрос первым, порядок {order}"
+        assert not bulk.done(), "Фоновый запрос ждёт резерв"
+        bulk.cancel()
+
+        governor.observe(httpx.Response(429, headers={"Retry-After": "30"}))
+        assert governor.snapshot()["paused"] > 25, "Retry-After ставит паузу"
+
+        # Bybit: остаток в коротком окне endpoint, а не в минуте
+        bybit = RateGovernor("bybit", per_minute=600, bulk_reserve=0.2)
+        reset = str(int((time.time() + 2) * 1000))
+        bybit.observe(httpx.Response(200, headers={"X-Bapi-Limit-Status": "50", "X-Bapi-Limit-Reset-Timestamp": reset}))
+        assert 25 < bybit.tokens < 35, f"До сброса окна - не больше остатка: {bybit.tokens}"
+        bybit.observe(httpx.Response(200, headers={"X-Bapi-Limit-Status": "0", "X-Bapi-Limit-Reset-Timestamp": reset}))
+        assert 0 < bybit.snapshot()["paused"] <= 2, "Окно исчерпано - пауза до его сброса"
+
+    asyncio.run(scenario())
+
+    print("   ✅ Бюджет из заголовков, приоритет и Retry-After работают")
+
+
+def test_kline_parsing_to_columns():
+    """Тест разбора klines сразу в колонки"""
+    print("🧪 Тест разбора klines...")
+
+    binance_rows = [
+        [3600000 * i, f"{1 + i}.5", f"{2 + i}.0", f"{i}.5", f"{1 + i}.75", "10.5", 3600000 * (i + 1) - 1, "0", 5, "0", "0", "0"]
+        for i in range(5)
+    ]
+    # Bybit/OKX: строки, новые свечи первыми
+    bybit_rows = [[str(r[0])] + r[1:6] + ["123"] for r in reversed(binance_rows)]
+
+    binance = klines_to_columns(binance_rows)
+    bybit = klines_to_columns(bybit_rows, newest_first=True)
+
+    assert binance.shape == (6, 5) and binance.dtype.name == "float64"
+    assert (binance == bybit).all(), "Порядок и значения совпадают для всех бирж"
+    assert binance[0].tolist() == [3600.0 * i for i in range(5)], "Время открытия в секундах"
+    assert binance[4, -1] == 5.75
+
+    storage = CandleStorage()
+    storage.set_columns("PRSEUSDT", "1h", binance[:, :3])
+    update = binance[:, 2:].copy()
+    update[4, 0] += 0.25  # формирующаяся свеча успела измениться
+    changed = storage.merge_columns("PRSEUSDT", "1h", update)
+    assert changed == 3, f"Последняя свеча заменена + 2 новые, получено {changed}"
+    assert storage.get_arrays("PRSEUSDT", "1h").t.tolist() == binance[0].tolist()
+
+    print("   ✅ Binance/Bybit/OKX klines → колонки без словарей")
+
+
+def test_record_and_replay_exchange():
+    """Тест записи и офлайн-воспроизведения ответов биржи"""
+    print("🧪 Тест record/replay...")
+
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        rows = [[i * 3600000, "1", "2", "0.5", str(1.5 + len(calls)), "10"] for i in range(int(request.url.params["limit"]))]
+        if request.url.params["symbol"] == "GZIPUSDT":
+            body = gzip.compress(json.dumps(rows).encode())
+            return httpx.Response(200, content=body, headers={"Content-Encoding": "gzip", "Content-Length": str(len(body))})
+        return httpx.Response(200, json=rows, headers={"X-MBX-USED-WEIGHT-1M": "7"})
+
+    async def scenario(path):
+        archive = ResponseArchive(path)
+        async with httpx.AsyncClient(transport=RecordingTransport(httpx.MockTransport(handler), archive)) as client:
+            first = await fetch_candles_binance_internal(client, "RPLYUSDT", "1h", 3)
+            second = await fetch_candles_binance_internal(client, "RPLYUSDT", "1h", 3)
+            # Сжатый ответ: клиенту отдаётся распакованное тело без Content-Encoding
+            packed = await fetch_candles_binance_internal(client, "GZIPUSDT", "1h", 4)
+            assert packed.shape == (6, 4)
+        archive.close()
+
+        replay = ReplayTransport.from_file(path)
+        async with httpx.AsyncClient(transport=replay) as client:
+            assert (await fetch_candles_binance_internal(client, "RPLYUSDT", "1h", 3) == first).all()
+            assert (await fetch_candles_binance_internal(client, "RPLYUSDT", "1h", 3) == second).all()
+            # Дальше повторяется последний ответ; другой limit подбирается без параметра
+            assert (await fetch_candles_binance_internal(client, "RPLYUSDT", "1h", 3) == second).all()
+            assert (await fetch_candles_binance_internal(client, "RPLYUSDT", "1h", 50)).shape == (6, 3)
+            assert (await fetch_candles_binance_internal(client, "GZIPUSDT", "1h", 4) == packed).all()
+            try:
+                await fetch_candles_binance_internal(client, "NONEUSDT", "1h", 3)
+                raise AssertionError("Незаписанный запрос должен падать как без сети")
+            except httpx.ConnectError:
+                pass
+        assert replay.served == 5 and replay.misses == 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(os.path.join(tmp, "run.jsonl.gz")))
+
+    assert len(calls) == 3, "При воспроизведении сеть не используется"
+
+    # realtime: ответы идут по смещениям at записи, а не подряд
+    url = "https://api.binance.com/api/v3/ping"
+    records = [{"at": at, "latency": 0.01, "method": "GET", "url": f"{url}?n={n}", "status": 200,
+                "headers": {}, "body": "{}"} for n, at in enumerate((5.0, 5.3))]
+
+    async def realtime():
+        async with httpx.AsyncClient(transport=ReplayTransport(records, realtime=True)) as client:
+            await client.get(f"{url}?n=0")
+            started = time.monotonic()
+            await client.get(f"{url}?n=1")
+            return time.monotonic() - started
+
+    elapsed = asyncio.run(realtime())
+    assert 0.25 < elapsed < 0.6, f"Второй ответ через ~0.3с после первого, прошло {elapsed:.2f}с"
+    print("   ✅ Ответы записаны и воспроизводятся без сети")
+
+
+def test_mock_exchange_rest():
+    """Тест REST-заглушки бирж: форматы ответов и инъекция ошибок"""
+    print("🧪 Тест mock exchange REST...")
+
+    async def scenario():
+        exchange = MockExchange(seed=5, start_prices={"BTCUSDT": 50000.0}, symbols=["ETHUSDT"])
+        await exchange.start()
+        urls = {name: getattr(indicators, name) for name in ("BINANCE_API_URL", "BYBIT_API_URL", "OKX_API_URL")}
+        for name in urls:
+            setattr(indicators, name, exchange.http_url)
+        try:
+            async with httpx.AsyncClient() as client:
+                for fetch in (indicators.fetch_price_binance, indicators.fetch_price_bybit, indicators.fetch_price_okx):
+                    price, volume = await fetch(client, "BTCUSDT")
+                    assert 40000 < price < 60000 and volume > 0
+
+                prices = await indicators.fetch_prices_binance(client, ["BTCUSDT", "ETHUSDT"])
+                assert set(prices) == {"BTCUSDT", "ETHUSDT"}
+                assert set(await indicators.fetch_prices_bybit(client, ["ETHUSDT"])) == {"ETHUSDT"}
+                assert set(await indicators.fetch_prices_okx(client, ["ETHUSDT"])) == {"ETHUSDT"}
+
+                # Свечи трёх бирж - одна и та же история, по возрастанию времени
+                binance = await fetch_candles_binance_internal(client, "BTCUSDT", "1h", 50)
+                bybit = await indicators.fetch_candles_bybit(client, "BTCUSDT", "1h", 50)
+                okx = await indicators.fetch_candles_okx(client, "BTCUSDT", "1h", 50)
+                assert binance.shape == (6, 50)
+                assert (np.diff(binance[0]) == 3600).all()
+                assert (binance[:, :-1] == bybit[:, :-1]).all() and (bybit[0] == okx[0]).all()
+                assert (binance[2] >= binance[1:5].max(axis=0) - 1e-6).all()
+
+                # Вес Binance виден в заголовке
+                resp = await client.get(f"{exchange.http_url}/api/v3/ping")
+                assert int(resp.headers["X-MBX-USED-WEIGHT-1M"]) > 0
+
+                exchange.conditions["binance"] = Conditions(ban_rate=1.0, retry_after=7)
+                try:
+                    await indicators.fetch_price_binance(client, "BTCUSDT")
+                    raise AssertionError("Ожидался 418")
+                except httpx.HTTPStatusError as e:
+                    assert e.response.status_code == 418
+                    assert e.response.headers["Retry-After"] == "7"
+                assert exchange.requests[("binance", 418)] == 1
+        finally:
+            for name, url in urls.items():
+                setattr(indicators, name, url)
+            await exchange.stop()
+
+    asyncio.run(scenario())
+    print("   ✅ Тикеры, свечи и ошибки бирж эмулируются")
+
+
+def test_backfill_fills_only_gaps():
+    """Тест: дыры в серии находятся и дозагружаются диапазонами"""
+    print("🧪 Тест дозагрузки дыр...")
+
+    async def scenario():
+        exchange = MockExchange(seed=11, start_prices={"GAPSUSDT": 10.0})
+        await exchange.start()
+        urls = {name: getattr(indicators, name) for name in ("BINANCE_API_URL", "BYBIT_API_URL", "OKX_API_URL")}
+        for name in urls:
+            setattr(indicators, name, exchange.http_url)
+        try:
+            full = await indicators.fetch_candles_binance("GAPSUSDT", "1h", 50, priority=PRIORITY_BULK)
+            assert full.shape == (6, 50)
+
+            # Нет первых 5 свечей, 5 в середине и 3 последних
+            keep = np.ones(50, dtype=bool)
+            keep[:5] = keep[20:25] = keep[47:] = False
+            CANDLES.set_columns("GAPSUSDT", "1h", full[:, keep])
+
+            gaps = indicators.scan_gaps("GAPSUSDT", "1h", 50)
+            assert gaps == [
+                (full[0, 0], full[0, 4]), (full[0, 20], full[0, 24]), (full[0, 47], full[0, 49])
+            ], gaps
+
+            requests_before = sum(exchange.requests.values())
+            filled = await indicators.backfill_gaps(["GAPSUSDT"], {"1h": 50})
+            assert filled == {("GAPSUSDT", "1h"): 13}
+            assert sum(exchange.requests.values()) - requests_before == 3, "Один запрос на дыру"
+
+            arrays = CANDLES.get_arrays("GAPSUSDT", "1h")
+            assert (arrays.t == full[0]).all()
+            assert (arrays.c[:-1] == full[4, :-1]).all(), "Закрытые свечи совпадают с биржей"
+            assert indicators.scan_gaps("GAPSUSDT", "1h", 50) == []
+            assert await indicators.backfill_gaps(["GAPSUSDT"], {"1h": 50}) == {}
+        finally:
+            for name, url in urls.items():
+                setattr(indicators, name, url)
+            CANDLES.buffers.pop(("GAPSUSDT", "1h"), None)
+            await HTTP_CLIENTS.close()
+            await exchange.stop()
+
+    asyncio.run(scenario())
+    print("   ✅ Дозагружены только пропущенные свечи")
+
+
+def test_empty_ranges_expire_and_skip_forming_bar():
+    """Тест: пустой диапазон помнится ограниченно, формирующийся бар не отмечается, сбой - с backoff"""
+    print("🧪 Тест пустых диапазонов дозагрузки...")
+
+    step = 3600
+    current_open = time.time() // step * step
+    t = current_open - np.arange(9, 0, -1) * step  # 9 закрытых баров, формирующегося нет
+    keep = np.ones(9, dtype=bool)
+    keep[3:5] = False
+    columns = np.vstack([t, np.ones((5, 9))])[:, keep]
+
+    async def nothing(*args, **kwargs):
+        return np.empty((6, 0))
+
+    fetch, max_ranges = indicators.fetch_candles_binance, indicators.BACKFILL_SKIP_MAX
+    indicators.fetch_candles_binance = nothing
+    try:
+        CANDLES.set_columns("EMPTUSDT", "1h", columns)
+        gaps = indicators.scan_gaps("EMPTUSDT", "1h", 10)
+        assert gaps == [(t[3], t[4]), (current_open, current_open)], gaps
+
+        asyncio.run(indicators.backfill_gaps(["EMPTUSDT"], {"1h": 10}))
+        assert indicators.scan_gaps("EMPTUSDT", "1h", 10) == [(current_open, current_open)], \
+            "Закрытый пустой диапазон помнится, формирующийся бар - нет"
+
+        # Запись устарела - диапазон снова запрашивается
+        key = ("EMPTUSDT", "1h", t[3], t[4])
+        indicators._SKIPPED_RANGES[key] -= indicators.BACKFILL_EMPTY_TTL
+        assert len(indicators.scan_gaps("EMPTUSDT", "1h", 10)) == 2 and key not in indicators._SKIPPED_RANGES
+
+        # Старые записи вытесняются сверх лимита
+        indicators.BACKFILL_SKIP_MAX = 1
+        indicators._mark_empty(("OLDUSDT", "1h", 0.0, 0.0), time.time())
+        indicators._mark_empty(key, time.time())
+        assert list(indicators._SKIPPED_RANGES) == [key]
+
+        # Биржи недоступны: дыры откладываются с растущей паузой, а не каждый проход
+        calls = []
+
+        async def down(*args, **kwargs):
+            calls.append(args)
+            return None
+
+        indicators.BACKFILL_SKIP_MAX = max_ranges
+        indicators._SKIPPED_RANGES.clear()
+        indicators.fetch_candles_binance = down
+        asyncio.run(indicators.backfill_gaps(["EMPTUSDT"], {"1h": 10}))
+        assert len(calls) == 2 and indicators.scan_gaps("EMPTUSDT", "1h", 10) == []
+        asyncio.run(indicators.backfill_gaps(["EMPTUSDT"], {"1h": 10}))
+        assert len(calls) == 2, "Отложенные дыры не запрашиваются"
+
+        indicators._SKIPPED_RANGES[key] -= indicators.BACKFILL_RETRY_BASE
+        asyncio.run(indicators.backfill_gaps(["EMPTUSDT"], {"1h": 10}))
+        assert len(calls) == 3 and indicators._RANGE_FAILURES[key] == 2
+        assert indicators._SKIPPED_RANGES[key] - time.time() > 1.5 * indicators.BACKFILL_RETRY_BASE, "Пауза удваивается"
+    finally:
+        indicators.fetch_candles_binance, indicators.BACKFILL_SKIP_MAX = fetch, max_ranges
+        indicators._SKIPPED_RANGES.clear()
+        indicators._RANGE_FAILURES.clear()
+        CANDLES.buffers.pop(("EMPTUSDT", "1h"), None)
+
+    print("   ✅ Пустые диапазоны с TTL и лимитом, сбои с backoff, формирующийся бар не помечается")
+
+
+def test_load_history_parallel_and_data_ready():
+    """Тест загрузки истории: параллельно с лимитом, дельта поверх candles.db, DATA_READY"""
+    print("🧪 Тест параллельной загрузки истории...")
+
+    active, peak, limits = [0], [0], []
+
+    async def fetch(pair, tf, limit, priority=PRIORITY_LIVE, **kwargs):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        limits.append((pair, tf, limit))
+        assert priority == PRIORITY_BULK, "История - фоновым приоритетом"
+        await asyncio.sleep(0.02)
+        active[0] -= 1
+        step = TIMEFRAME_SECONDS[tf]
+        last = time.time() // step * step
+        t = last - np.arange(limit - 1, -1, -1) * step
+        return np.vstack([t, np.ones((5, limit))])
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("exchange down")
+
+    async def collector():
+        task = asyncio.create_task(tasks.price_collector(None))
+        try:
+            await asyncio.wait_for(tasks.DATA_READY.wait(), timeout=5)
+        finally:
+            task.cancel()
+
+    pairs = ["HISTAUSDT", "HISTBUSDT", "HISTCUSDT"]
+    original, data_ready = indicators.fetch_candles_binance, tasks.DATA_READY
+    indicators.fetch_candles_binance = fetch
+    try:
+        loaded = asyncio.run(indicators.load_history(pairs, {"1h": 20, "4h": 10}, concurrency=2))
+        assert loaded == {(p, tf): n for p in pairs for tf, n in (("1h", 20), ("4h", 10))}, loaded
+        assert peak[0] == 2, f"Одновременно не больше concurrency и больше одного: {peak[0]}"
+
+        # История уже есть - запрашиваются только последние бары
+        limits.clear()
+        asyncio.run(indicators.load_history(pairs, {"1h": 20, "4h": 10}, concurrency=2))
+        assert all(limit <= 2 for _, _, limit in limits), limits
+
+        # Анализаторы не ждут вечно, даже если загрузка упала
+        tasks.load_history, load = broken, tasks.load_history
+        tasks.DATA_READY = asyncio.Event()
+        try:
+            asyncio.run(collector())
+        finally:
+            tasks.load_history = load
+        assert tasks.DATA_READY.is_set()
+    finally:
+        indicators.fetch_candles_binance, tasks.DATA_READY = original, data_ready
+        for pair in pairs:
+            for tf in ("1h", "4h"):
+                CANDLES.buffers.pop((pair, tf), None)
+
+    print("   ✅ История качается параллельно, DATA_READY ставится всегда")
+
+
+def test_http_clients_registry():
+    """Тест реестра HTTP-клиентов: один клиент на хост, заголовки в RATE_LIMITS, закрытие"""
+    print("🧪 Тест HttpClients...")
+
+    profile = {"timeout": 1.0, "connect": 1.0, "max_connections": 2, "keepalive": 1, "retries": 0}
+    url = "https://api.binance.com/api/v3/ping"
+
+    async def scenario(path):
+        archive = ResponseArchive(path)
+        archive.write({"at": 0, "latency": 0, "method": "GET", "url": url, "status": 200,
+                       "headers": {"x-mbx-used-weight-1m": "900"}, "body": "{}"})
+        archive.close()
+
+        clients = HttpClients({"binance": profile, "cryptopay": profile}, replay_path=path)
+        await clients.start()
+        binance = clients.get("binance")
+        assert clients.get("binance") is binance, "Клиент хоста переиспользуется"
+        assert not clients.get("cryptopay").event_hooks["response"], "Crypto Pay - без лимитов бирж"
+
+        # Ответ биржи проходит через хук: бюджет по X-MBX-USED-WEIGHT-1M
+        await binance.get(url)
+        assert RATE_LIMITS["binance"].tokens <= 1200 - 900 + 1, RATE_LIMITS["binance"].tokens
+
+        cryptopay = clients.get("cryptopay")
+        await clients.close()
+        assert binance.is_closed and cryptopay.is_closed
+        assert clients.get("binance") is not binance, "После закрытия создаётся новый"
+        await clients.close()
+
+    governor = RATE_LIMITS["binance"]
+    RATE_LIMITS["binance"] = RateGovernor("binance", per_minute=1200)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(scenario(os.path.join(tmp, "run.jsonl.gz")))
+    finally:
+        RATE_LIMITS["binance"] = governor
+
+    print("   ✅ Клиенты переиспользуются, хук лимитов работает, закрываются на остановке")
+
+
+def test_ticker_and_kline_timeouts():
+    """Тест таймаутов: цены и проверка биржи - TICKER_TIMEOUT, klines - таймаут профиля хоста"""
+    print("🧪 Тест таймаутов запросов...")
+
+    timeouts = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        timeouts[path] = request.extensions["timeout"]["read"]
+        if path.endswith("/klines"):
+            return httpx.Response(200, json=[])
+        if path.endswith("/ping"):
+            return httpx.Response(200, json={})
+        return httpx.Response(200, json={"lastPrice": "1.5", "volume": "10"})
+
+    async def scenario():
+        profile = HTTP_HOSTS["binance"]
+        timeout = httpx.Timeout(profile["timeout"], connect=profile["connect"])
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), timeout=timeout) as client:
+            await indicators.fetch_price_binance(client, "BTCUSDT")
+            await fetch_candles_binance_internal(client, "BTCUSDT", "1h", 10)
+            HTTP_CLIENTS.get = lambda name: client
+            try:
+                await indicators.probe_source("binance")
+            finally:
+                del HTTP_CLIENTS.get
+
+    asyncio.run(scenario())
+    assert TICKER_TIMEOUT == 5.0 and HTTP_HOSTS["binance"]["timeout"] == 10.0
+    assert timeouts["/api/v3/ticker/24hr"] == TICKER_TIMEOUT, timeouts
+    assert timeouts["/api/v3/ping"] == TICKER_TIMEOUT, timeouts
+    assert timeouts["/api/v3/klines"] == HTTP_HOSTS["binance"]["timeout"], timeouts
+
+    print("   ✅ Цены - 5с, klines - 10с")
+
+
+def run_all_tests():
+    """Запустить все тесты"""
+    print("=" * 50)
+    print("🧪 Тестирование рыночных данных")
+    print("=" * 50)
+    print()
+
+    tests = [
+        test_stream_fills_candles_and_reconnects,
+        test_candle_store_survives_restart,
+        test_candle_buffer_wraps_without_copies,
+        test_candle_upsert_by_open_time,
+        test_bar_aggregator_builds_ohlcv,
+        test_refresh_recent_bars_takes_exchange_volume,
+        test_circuit_breaker_skips_banned_source,
+        test_client_errors_do_not_trip_breaker,
+        test_open_source_not_called_when_others_empty,
+        test_price_requests_coalesce,
+        test_single_flight_priority_and_batch_errors,
+        test_binance_tickers_batched,
+        test_rate_governor_headers_and_priority,
+        test_kline_parsing_to_columns,
+        test_record_and_replay_exchange,
+        test_mock_exchange_rest,
+        test_backfill_fills_only_gaps,
+        test_empty_ranges_expire_and_skip_forming_bar,
+        test_load_history_parallel_and_data_ready,
+        test_http_clients_registry,
+        test_ticker_and_kline_timeouts,
+    ]
+
+    passed = 0
+    failed = 0
+
+    for test in tests:
+        try:
+            test()
+            passed += 1
+        except AssertionError as e:
+            print(f"   ❌ Тест провален: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"   ❌ Ошибка: {e}")
+            failed += 1
+        print()
+
+    print("=" * 50)
+    print(f"✅ Пройдено: {passed}")
+    print(f"❌ Провалено: {failed}")
+    print("=" * 50)
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)